@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: độ trễ end-to-end và số token mỗi hành động,
+chế độ "separate" (process_player_action + check_rule_violation) so với
+"combined" (resolve_action - một lần gọi LLM).
+
+Mỗi chế độ chạy cùng một chuỗi hành động của một player, lần lượt từng hành động
+như khi chơi thật (lịch sử hội thoại tăng dần, KV cache theo session bật như bot).
+
+Chạy từ thư mục horror_bot/ (cần LLM_MODEL_PATH trong .env):
+    python benchmarks/action_resolution_benchmark.py --actions 8
+    LLM_JSON_GRAMMAR=off python benchmarks/action_resolution_benchmark.py --actions 8
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import llm_service  # noqa: E402
+from services.game_engine import DM_SYSTEM_PROMPT  # noqa: E402
+
+HIDDEN_RULES = [
+    {"rule_text": "Không bao giờ được nhìn vào gương sau nửa đêm."},
+    {"rule_text": "Nếu nghe thấy tiếng gõ cửa ba lần, không được trả lời."},
+    {"rule_text": "Không được gọi tên người đã chết."},
+    {"rule_text": "Đèn ở hành lang tầng 3 phải luôn được bật."},
+]
+
+ACTIONS = [
+    "Tôi bật đèn pin và nhìn quanh căn phòng",
+    "Tôi tiến lại gần chiếc gương lớn trên tường và nhìn vào đó",
+    "Có tiếng gõ cửa ba lần, tôi hỏi: ai đó?",
+    "Tôi mở ngăn kéo bàn làm việc",
+    "Tôi tắt đèn hành lang để trốn trong bóng tối",
+    "Tôi gọi tên bà nội đã mất để xin giúp đỡ",
+    "Tôi nhặt chiếc chìa khóa gỉ trên sàn",
+    "Tôi đi xuống cầu thang về phía tầng hầm",
+]
+
+PLAYER_CONTEXT = """Current Location: Hành lang tầng 3
+Player Stats: HP 80/100, Sanity 65/100, AGI 50, ACC 70
+Inventory: Đèn pin
+
+"""
+
+
+async def _separate(action: str, history: list, rules_text: str, session: str) -> str:
+    response = await llm_service.process_player_action(
+        action_text=action, system_prompt=DM_SYSTEM_PROMPT, conversation_history=history,
+        player_context=PLAYER_CONTEXT, session_key=session
+    )
+    await llm_service.check_rule_violation(
+        hidden_rules=HIDDEN_RULES, action_text=action, action_description=response,
+        rules_text=rules_text, game_id=0
+    )
+    return response
+
+
+async def _combined(action: str, history: list, rules_text: str, session: str) -> str:
+    result = await llm_service.resolve_action(
+        action_text=action, rules_text=rules_text, conversation_history=history,
+        player_context=PLAYER_CONTEXT, session_key=session
+    )
+    return result.get("description", "")
+
+
+async def _run_mode(name: str, resolve, actions: list) -> dict:
+    rules_text = llm_service.format_hidden_rules(HIDDEN_RULES)
+    history = []
+    latencies = []
+    before = llm_service.get_scheduler_stats()
+
+    for action in actions:
+        start = time.perf_counter()
+        description = await resolve(action, history[-6:], rules_text, f"bench-{name}")
+        latencies.append(time.perf_counter() - start)
+        history += [{"role": "user", "content": action}, {"role": "assistant", "content": description}]
+
+    after = llm_service.get_scheduler_stats()
+    evaluated = (after["prompt_tokens"] - after["reused_tokens"]) - (before["prompt_tokens"] - before["reused_tokens"])
+    latencies.sort()
+    return {
+        "calls": after["completed"] - before["completed"],
+        "avg": sum(latencies) / len(latencies),
+        "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        "prompt_tokens": (after["prompt_tokens"] - before["prompt_tokens"]) / len(actions),
+        "evaluated_tokens": evaluated / len(actions),
+        "completion_tokens": (after["completion_tokens"] - before["completion_tokens"]) / len(actions),
+    }
+
+
+async def main(actions: int):
+    if not llm_service.load_llm():
+        return
+    sample = (ACTIONS * (actions // len(ACTIONS) + 1))[:actions]
+
+    results = [
+        ("separate", await _run_mode("separate", _separate, sample)),
+        ("combined", await _run_mode("combined", _combined, sample)),
+    ]
+    calls = llm_service.get_call_stats()
+    llm_service.shutdown_llm()
+
+    print(f"\n📊 {actions} hành động / chế độ (tính trung bình mỗi hành động)")
+    print(f"   {'Mode':<9} {'LLM calls':>9} {'avg (s)':>8} {'p95 (s)':>8} {'prompt tok':>10} {'evaluated':>9} {'generated':>9}")
+    for name, r in results:
+        print(f"   {name:<9} {r['calls'] / actions:>9.1f} {r['avg']:>8.2f} {r['p95']:>8.2f} "
+              f"{r['prompt_tokens']:>10.0f} {r['evaluated_tokens']:>9.0f} {r['completion_tokens']:>9.0f}")
+
+    # So sánh trước/sau grammar: chạy lại với LLM_JSON_GRAMMAR=off
+    print(f"\n🧾 JSON output theo loại lời gọi (grammar {'on' if calls['grammar'] else 'off'})")
+    for kind, stat in sorted(calls["kinds"].items()):
+        print(f"   {kind:<15} {stat['calls']:>4} lần | lỗi parse {stat['failure_rate']:>4.0%} | TB {stat['avg_tokens']:.0f} token")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--actions", type=int, default=8)
+    args = parser.parse_args()
+    asyncio.run(main(args.actions))
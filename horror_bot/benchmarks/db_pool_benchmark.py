@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: chi phí mỗi query khi mở kết nối mới vs. dùng ConnectionPool.
+
+Mô phỏng N game chạy song song, mỗi game xử lý vài hành động; mỗi hành động
+chạy ~12 query giống process_free_text_action (đọc player, update stats,
+history, location, encounter...).
+
+Chạy từ thư mục horror_bot/:
+    python benchmarks/db_pool_benchmark.py --games 50 --actions 5
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import aiosqlite
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import db_manager  # noqa: E402
+
+QUERIES_PER_ACTION = 12
+
+
+async def _legacy_execute_query(query, params=(), commit=False, fetchone=False, fetchall=False):
+    """Bản sao hành vi cũ: mỗi query mở một kết nối aiosqlite mới."""
+    async with aiosqlite.connect(db_manager.DB_PATH, timeout=30) as db:
+        db.row_factory = aiosqlite.Row
+        async with db.execute(query, params) as cursor:
+            result = None
+            if fetchone:
+                row = await cursor.fetchone()
+                result = dict(row) if row else None
+            elif fetchall:
+                result = [dict(row) for row in await cursor.fetchall()]
+            if commit:
+                await db.commit()
+            return result
+
+
+async def _simulate_action(run_query, user_id: int, game_id: int):
+    for i in range(QUERIES_PER_ACTION):
+        if i % 3 == 2:
+            await run_query(
+                "UPDATE players SET sanity = sanity WHERE user_id = ? AND game_id = ?",
+                (user_id, game_id), commit=True
+            )
+        else:
+            await run_query(
+                "SELECT * FROM players WHERE user_id = ? AND game_id = ?",
+                (user_id, game_id), fetchone=True
+            )
+
+
+async def _run(run_query, games: int, actions: int) -> float:
+    async def play(game_id):
+        for _ in range(actions):
+            await _simulate_action(run_query, game_id, game_id)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(play(g) for g in range(games)))
+    return time.perf_counter() - start
+
+
+async def main(games: int, actions: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_manager.DB_PATH = os.path.join(tmp, "bench.db")
+        await db_manager.setup_database()
+        for g in range(games):
+            await db_manager.execute_query(
+                "INSERT INTO players (user_id, game_id) VALUES (?, ?)", (g, g), commit=True
+            )
+
+        total_queries = games * actions * QUERIES_PER_ACTION
+        legacy = await _run(_legacy_execute_query, games, actions)
+        pooled = await _run(db_manager.execute_query, games, actions)
+        stats = dict(db_manager.get_pool().stats)
+        await db_manager.close_pool()
+
+    print(f"\n📊 {games} game song song x {actions} hành động x {QUERIES_PER_ACTION} query = {total_queries} query")
+    print(f"   Kết nối mới mỗi query: {legacy:.2f}s  ({legacy / total_queries * 1e6:.0f} µs/query)")
+    print(f"   ConnectionPool (size={db_manager.DB_POOL_SIZE}): {pooled:.2f}s  ({pooled / total_queries * 1e6:.0f} µs/query)")
+    print(f"   Tiết kiệm: {(legacy - pooled) / total_queries * 1e6:.0f} µs/query (x{legacy / pooled:.1f})")
+    print(f"   Pool stats: {stats}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=50)
+    parser.add_argument("--actions", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.games, args.actions))
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: thông lượng LLM (requests/s, p95 latency) theo số worker process
+với cùng một ngân sách core.
+
+Mỗi cấu hình chạy N worker x (cores // N) threads, bắn R request hành động
+player song song qua InferenceScheduler giống như bot khi nhiều người chơi gửi
+hành động cùng lúc.
+
+Chạy từ thư mục horror_bot/ (cần LLM_MODEL_PATH trong .env hoặc --model):
+    python benchmarks/llm_throughput_benchmark.py --cores 8 --workers 1 2 4 --requests 32
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import llm_service, llm_workers  # noqa: E402
+from services.inference_scheduler import InferenceScheduler, PRIORITY_INTERACTIVE  # noqa: E402
+
+SYSTEM_PROMPT = """You are the Dungeon Master for a horror game.
+Be concise. Horror tone. Vietnamese.
+"""
+
+PLAYER_CONTEXT = """Current Location: Hành lang tầng 3
+Player Stats: HP 80/100, Sanity 65/100, AGI 50, ACC 70
+Inventory: Đèn pin, Chìa khóa gỉ
+
+"""
+
+
+def _build_prompt(i: int) -> str:
+    return llm_service.get_prompt(
+        "process_player_action",
+        system_prompt=SYSTEM_PROMPT,
+        messages_text="",
+        player_context=PLAYER_CONTEXT,
+        action_text=f"Tôi mở cánh cửa thứ {i} và nhìn vào bên trong"
+    )
+
+
+async def _run_config(workers: list, requests: int, max_tokens: int) -> dict:
+    scheduler = InferenceScheduler()
+    scheduler.attach_models(workers)
+    latencies = []
+
+    async def one(i):
+        start = time.perf_counter()
+        await scheduler.complete(
+            _build_prompt(i), priority=PRIORITY_INTERACTIVE, kind="benchmark",
+            max_tokens=max_tokens, stop=["<|im_end|>"], temperature=0.8, echo=False
+        )
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+    scheduler.close()
+
+    latencies.sort()
+    return {
+        "elapsed": elapsed,
+        "rps": requests / elapsed,
+        "p50": latencies[len(latencies) // 2],
+        "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+    }
+
+
+def main(model: str, cores: int, worker_counts: list, requests: int, max_tokens: int, n_ctx: int):
+    if not model or not os.path.exists(model):
+        print(f"❌ Không tìm thấy model tại: {model}")
+        return
+
+    results = []
+    for count in worker_counts:
+        threads = max(1, cores // count)
+        print(f"🔄 {count} worker x {threads} threads: đang load model...")
+        workers = llm_workers.start_workers(count, dict(
+            model_path=model, n_ctx=n_ctx, n_threads=threads,
+            n_gpu_layers=0, use_mmap=True, verbose=False
+        ))
+        if workers is None:
+            print(f"❌ Không khởi động được {count} worker, bỏ qua")
+            continue
+        results.append((count, threads, asyncio.run(_run_config(workers, requests, max_tokens))))
+
+    print(f"\n📊 {requests} request song song, max_tokens={max_tokens}, ngân sách {cores} core")
+    print(f"   {'Worker':>6} {'Threads':>7} {'req/s':>7} {'p50 (s)':>8} {'p95 (s)':>8}")
+    for count, threads, r in results:
+        print(f"   {count:>6} {threads:>7} {r['rps']:>7.2f} {r['p50']:>8.2f} {r['p95']:>8.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=llm_service.LLM_MODEL_PATH)
+    parser.add_argument("--cores", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--max-tokens", type=int, default=128)
+    parser.add_argument("--ctx", type=int, default=2048)
+    args = parser.parse_args()
+    main(args.model, args.cores, args.workers, args.requests, args.max_tokens, args.ctx)
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: bản đồ định dạng cũ (v1: MapNode có __dict__, ID uuid4, to_dict() JSON lồng nhau)
+so với định dạng compact (v2: MapNode __slots__, ID số nhỏ, mảng kết nối đóng gói)
+và định dạng seed (v3: chỉ lưu scenario + seed + generator, sinh lại bản đồ khi nạp).
+
+Đo cho N bản đồ sinh ngẫu nhiên của một scenario (mặc định abyss - nhiều tầng nhất):
+  - kích thước map_data lưu trong game_maps
+  - thời gian encode / decode (json.loads, và nạp thành MapGraph như game_content)
+  - bộ nhớ: cây MapNode khi sinh, và dữ liệu bản đồ giữ trong cache mỗi game
+
+Chạy từ thư mục horror_bot/:
+    python benchmarks/map_encoding_benchmark.py --scenario abyss --maps 50
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import map_generator  # noqa: E402
+from services.map_graph import MapGraph  # noqa: E402
+
+
+class _LegacyMapNode:
+    """Bản sao MapNode cũ: __dict__ mỗi instance, ID uuid4."""
+    def __init__(self, room_type: str, description: str):
+        self.id = str(uuid.uuid4())
+        self.room_type = room_type
+        self.description = description
+        self.connections = {}
+        self.entities = []
+        self.events = []
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "room_type": self.room_type,
+            "description": self.description,
+            "connections": self.connections,
+            "entities": self.entities,
+            "events": self.events
+        }
+
+
+def _legacy_nodes(game_map) -> dict:
+    """Dựng lại cây node theo kiểu cũ (uuid4) từ một MapStructure mới."""
+    nodes = {}
+    for node in game_map.nodes.values():
+        legacy = _LegacyMapNode(node.room_type, node.description)
+        legacy.entities = list(node.entities)
+        legacy.events = list(node.events)
+        nodes[node.id] = legacy
+    for node in game_map.nodes.values():
+        for direction, target in node.connections.items():
+            nodes[node.id].connections[direction] = nodes[target].id
+    return {legacy.id: legacy for legacy in nodes.values()}, nodes[game_map.start_node_id].id
+
+
+def _compact_nodes(game_map) -> dict:
+    """Cùng cây node đó theo kiểu mới (MapNode __slots__, ID số nhỏ)."""
+    copy = map_generator.MapStructure(game_map.scenario_name)
+    for node in game_map.nodes.values():
+        clone = map_generator.MapNode(node.room_type, node.description)
+        clone.entities = list(node.entities)
+        clone.events = list(node.events)
+        copy.add_node(clone)
+    for node in game_map.nodes.values():
+        copy.nodes[node.id].connections = dict(node.connections)
+    return copy.nodes
+
+
+def _legacy_dict(game_map, legacy_nodes, start_id) -> dict:
+    return {
+        "scenario_name": game_map.scenario_name,
+        "start_node_id": start_id,
+        "nodes": {node_id: node.to_dict() for node_id, node in legacy_nodes.items()}
+    }
+
+
+def _timed(fn, items, rounds: int = 5) -> tuple:
+    """(kết quả, ms mỗi item) - lấy lượt nhanh nhất trong `rounds` lượt để bớt nhiễu."""
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        results = [fn(item) for item in items]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return results, best * 1000 / len(items)
+
+
+def _allocated(build) -> tuple:
+    """(kết quả, số byte còn giữ sau khi build) theo tracemalloc."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+
+def main(scenario: str, maps: int, seed: int):
+    random.seed(seed)
+    scenario_file = f"data/scenarios/{scenario}.json"
+    structures = [map_generator.generate_map_structure(scenario_file) for _ in range(maps)]
+    legacy, legacy_tree_bytes = _allocated(lambda: [_legacy_nodes(m) for m in structures])
+    _, new_tree_bytes = _allocated(lambda: [_compact_nodes(m) for m in structures])
+    rooms = sum(len(m.nodes) for m in structures)
+
+    legacy_dicts = [_legacy_dict(m, nodes, start) for m, (nodes, start) in zip(structures, legacy)]
+    legacy_blobs, legacy_encode_ms = _timed(json.dumps, legacy_dicts)
+    compact_blobs, compact_encode_ms = _timed(lambda m: m.to_compact(), structures)
+    seeded_blobs, seeded_encode_ms = _timed(lambda m: m.encode(), structures)
+
+    _, legacy_parse_ms = _timed(json.loads, legacy_blobs)
+    _, compact_parse_ms = _timed(json.loads, compact_blobs)
+    _, legacy_load_ms = _timed(lambda b: MapGraph.from_map_data(json.loads(b)), legacy_blobs)
+    _, compact_load_ms = _timed(MapGraph.decode, compact_blobs)
+    _, seeded_parse_ms = _timed(json.loads, seeded_blobs)
+    _, seeded_load_ms = _timed(MapGraph.decode, seeded_blobs)
+
+    # Trước đây game_content giữ cả dict json.loads(map_data) cho mỗi game; giờ chỉ giữ MapGraph
+    _, legacy_cached_bytes = _allocated(lambda: [json.loads(b) for b in legacy_blobs])
+    _, graph_bytes = _allocated(lambda: [MapGraph.decode(b) for b in compact_blobs])
+    seeded_graphs, seeded_graph_bytes = _allocated(lambda: [MapGraph.decode(b) for b in seeded_blobs])
+    reproducible = all(
+        list(g.exits) == list(MapGraph.decode(b).exits) for g, b in zip(seeded_graphs, compact_blobs)
+    )
+
+    legacy_size = sum(len(b.encode()) for b in legacy_blobs) / maps
+    compact_size = sum(len(b.encode()) for b in compact_blobs) / maps
+    seeded_size = sum(len(b.encode()) for b in seeded_blobs) / maps
+
+    print(f"\n🗺️ {maps} bản đồ '{scenario}', TB {rooms / maps:.0f} phòng/bản đồ (seed {seed})")
+    print(f"   {'':<28} {'v1 (cũ)':>12} {'v2 (compact)':>14} {'v3 (seed)':>11}")
+    rows = [
+        ("map_data lưu DB (KB)", legacy_size / 1024, compact_size / 1024, seeded_size / 1024),
+        ("Cây MapNode khi sinh (KB)", legacy_tree_bytes / maps / 1024, new_tree_bytes / maps / 1024,
+         new_tree_bytes / maps / 1024),
+        ("Encode (ms)", legacy_encode_ms, compact_encode_ms, seeded_encode_ms),
+        ("Decode json.loads (ms)", legacy_parse_ms, compact_parse_ms, seeded_parse_ms),
+        ("Nạp thành MapGraph (ms)", legacy_load_ms, compact_load_ms, seeded_load_ms),
+        ("Giữ trong cache/game (KB)", legacy_cached_bytes / maps / 1024, graph_bytes / maps / 1024,
+         seeded_graph_bytes / maps / 1024),
+    ]
+    for name, legacy_value, compact_value, seeded_value in rows:
+        print(f"   {name:<28} {legacy_value:>12.2f} {compact_value:>14.2f} {seeded_value:>11.2f}")
+    print("   (v1 giữ trong cache = dict json.loads; v2/v3 = MapGraph gồm cả bảng khoảng cách BFS;")
+    print("    nạp v3 = sinh lại bản đồ từ seed + compile)")
+    print(f"   Sinh lại từ seed ra đúng bản đồ đã lưu: {'✅' if reproducible else '❌'}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", default="abyss")
+    parser.add_argument("--maps", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    main(args.scenario, args.maps, args.seed)
@@ -3,7 +3,7 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 from database import db_manager
-from services import game_engine
+from services import game_engine, llm_service, narration_stream, content_pool, startup, admission, action_buffer, player_actors, event_bus, dashboard
 import typing
 import os
 from dotenv import load_dotenv
@@ -217,6 +217,188 @@ class AdminCommands(commands.Cog):
         content = "👮 **Danh sách Moderator:**\n" + "\n".join(mod_mentions)
         await interaction.response.send_message(content, ephemeral=True)
     
+    @app_commands.command(name="perfstats", description="📈 [Admin/Mod] Xem số liệu hiệu năng của bot")
+    async def perf_stats(self, interaction: discord.Interaction):
+        """Hiển thị số liệu hiệu năng (storage, hàng đợi ghi...) để theo dõi khi tải cao."""
+        if not await self.is_admin_or_moderator(interaction):
+            await interaction.response.send_message(
+                "❌ Bạn không có quyền sử dụng lệnh này.",
+                ephemeral=True
+            )
+            return
+
+        embed = discord.Embed(title="📈 Số liệu hiệu năng", color=discord.Color.blurple())
+
+        storage = db_manager.get_storage_stats()
+        storage_text = f"Mode: `{storage['mode']}`"
+        if 'pool' in storage:
+            pool = storage['pool']
+            storage_text += f"\nPool: {pool['connects']} kết nối, {pool['acquires']} lượt mượn, {pool['waits']} lượt chờ"
+        if 'writer' in storage:
+            writer = storage['writer']
+            storage_text += (
+                f"\nHàng đợi ghi: {writer['queue_depth']} (max {writer['max_queue_depth']})"
+                f"\nCommit: {writer['commits']} lần, TB {writer['avg_batch_size']:.1f} lệnh/commit"
+                f"\nCommit latency: TB {writer['commit_ms']['avg']:.1f}ms | p95 {writer['commit_ms']['p95']:.1f}ms"
+                f"\nWrite latency: TB {writer['write_latency_ms']['avg']:.1f}ms | p95 {writer['write_latency_ms']['p95']:.1f}ms"
+            )
+        embed.add_field(name="🗄️ Storage", value=storage_text, inline=False)
+
+        cache = db_manager.player_cache.get_stats()
+        embed.add_field(
+            name="👤 Player cache",
+            value=(
+                f"{cache['size']}/{cache['max_size']} player | hit rate {cache['hit_rate']:.0%}\n"
+                f"Hit: {cache['hits']} | Miss: {cache['misses']} | Evict: {cache['evictions']}"
+            ),
+            inline=False
+        )
+
+        routes = db_manager.channel_routes.get_stats()
+        embed.add_field(
+            name="🧭 Định tuyến private channel",
+            value=(
+                f"{routes['size']} kênh / {routes['games']} game (nạp lúc khởi động: {routes['loaded']})\n"
+                f"Tin nhắn thuộc game: {routes['hits']} | bỏ qua không cần DB: {routes['misses']}"
+            ),
+            inline=False
+        )
+
+        occ = db_manager.occupancy.get_stats()
+        embed.add_field(
+            name="🗺️ Occupancy index",
+            value=(
+                f"{occ['players']} player / {occ['occupied_rooms']} phòng có người / {occ['games']} game\n"
+                f"Tra cứu: {occ['lookups']} | nạp lại game: {occ['reloads']} | "
+                f"di chuyển: {occ['moves']} | tử vong: {occ['deaths']}"
+            ),
+            inline=False
+        )
+
+        llm = llm_service.get_scheduler_stats()
+        depth = llm['queue_depth']
+        wait = llm['wait_ms']
+        embed.add_field(
+            name="🧠 LLM scheduler",
+            value=(
+                f"Đang chờ: interactive {depth['interactive']} | normal {depth['normal']} | background {depth['background']}\n"
+                f"Chờ p95: interactive {wait['interactive']['p95']:.0f}ms | normal {wait['normal']['p95']:.0f}ms"
+                f" | background {wait['background']['p95']:.0f}ms\n"
+                f"Worker: {llm['busy']}/{llm['workers']} đang chạy | "
+                f"Inference: TB {llm['run_ms']['avg']:.0f}ms | p95 {llm['run_ms']['p95']:.0f}ms\n"
+                f"Job: {llm['completed']} xong, {llm['failed']} lỗi, {llm['cancelled']} bị hủy | "
+                f"{llm['completion_tokens']} token sinh ra\n"
+                f"KV cache: bỏ qua {llm['reused_tokens']}/{llm['prompt_tokens']} token prompt"
+                f" ({llm['reused_tokens'] / llm['prompt_tokens'] if llm['prompt_tokens'] else 0:.0%}) | "
+                f"{llm['session_cache']['sessions']} session, {llm['session_cache']['bytes'] / 2**20:.0f} MB | "
+                f"{llm['pinned']} job gắn worker theo session"
+            ),
+            inline=False
+        )
+
+        calls = llm_service.get_call_stats()
+        call_lines = [
+            f"`{kind}`: {stat['calls']} lần | lỗi parse {stat['failure_rate']:.0%} | TB {stat['avg_tokens']:.0f} token"
+            for kind, stat in sorted(calls['kinds'].items())
+        ]
+        embed.add_field(
+            name=f"🧾 JSON output (grammar {'bật' if calls['grammar'] else 'tắt'})",
+            value="\n".join(call_lines) or "Chưa có lần gọi nào",
+            inline=False
+        )
+
+        pool = content_pool.get_stats()
+        embed.add_field(
+            name="📦 Content pool",
+            value=(
+                f"Dự trữ: {pool['rules']} bộ rules, {pool['lore']} lore ({pool['scenarios']} scenario x target {pool['target']})\n"
+                f"Phục vụ từ kho: {pool['served_from_pool']} | Sinh trực tiếp: {pool['live_fallbacks']} | "
+                f"Đã sinh nền: {pool['generated']} (loại {pool['rejected']})"
+            ),
+            inline=False
+        )
+
+        gate = admission.get_stats()
+        limits = gate['limits']
+        rejected = gate['rejected']
+        embed.add_field(
+            name="🚪 Admission control",
+            value=(
+                f"Nhận: {gate['accepted']} | Từ chối: {sum(rejected.values())} ({gate['reject_rate']:.0%})\n"
+                f"Lý do: spam {rejected['rate_limited']} | chưa xong lượt trước {rejected['player_busy']} | "
+                f"game bận {rejected['game_busy']} | bot bận {rejected['server_busy']}\n"
+                f"Đang xử lý: {gate['inflight']}/{limits['total'] or '∞'} hành động trong {gate['inflight_games']} game "
+                f"(tối đa {limits['per_game'] or '∞'}/game, {limits['per_player'] or '∞'}/player, "
+                f"{limits['rate_per_min']:g}/phút, burst {limits['burst']:g}, {gate['buckets']} bucket)"
+            ),
+            inline=False
+        )
+
+        buffered = action_buffer.get_stats()
+        embed.add_field(
+            name="🧺 Gom tin nhắn",
+            value=(
+                f"{buffered['messages']} tin nhắn -> {buffered['actions']} hành động "
+                f"({buffered['merged']} tin nhắn được gộp, chờ im lặng {buffered['quiet_seconds']:g}s)"
+            ),
+            inline=False
+        )
+
+        actors = player_actors.get_stats()
+        embed.add_field(
+            name="🎭 Player actors",
+            value=(
+                f"Đang sống: {actors['actors']} (đỉnh {actors['peak_actors']}) | chờ trong mailbox: {actors['pending']}\n"
+                f"Tạo: {actors['spawned']} | thu hồi: {actors['reclaimed']} (rảnh {actors['idle_seconds']:g}s) | "
+                f"xử lý: {actors['processed']} | phải xếp sau lượt trước: {actors['queued_behind']}"
+            ),
+            inline=False
+        )
+
+        timings = startup.get_timings()
+        embed.add_field(
+            name=f"🚀 Khởi động (LLM: {llm_service.get_state()})",
+            value="\n".join(f"`{name}`: {seconds:.2f}s" for name, seconds in timings.items()) or "Chưa có số liệu",
+            inline=False
+        )
+
+        ttfv = narration_stream.get_stats()
+        ttfr = game_engine.get_stats()
+        embed.add_field(
+            name="⏱️ Phản hồi hành động",
+            value=(
+                f"Chữ đầu tiên hiện ra sau: TB {ttfv['avg']:.0f}ms | p95 {ttfv['p95']:.0f}ms ({ttfv['count']} hành động)\n"
+                f"Kết quả đầy đủ sau: TB {ttfr['avg']:.0f}ms | p95 {ttfr['p95']:.0f}ms ({ttfr['count']} hành động)\n"
+                f"Di chuyển hợp lệ: {ttfr['moves']} | bị chặn vì không có lối đi: {ttfr['invalid_moves']}"
+            ),
+            inline=False
+        )
+
+        board = dashboard.get_stats()
+        embed.add_field(
+            name="📊 Dashboard",
+            value=(
+                f"{board['requests']} yêu cầu -> {board['renders']} lần vẽ ({board['coalesced']} được gộp, "
+                f"tối đa 1 edit/{board['interval']:g}s/game)\n"
+                f"Edit: {board['edits']} | Gửi mới: {board['sends']} | Bỏ qua vì không đổi: {board['unchanged']} | "
+                f"Game đã kết thúc: {board['dropped']} | {board['games']} game"
+            ),
+            inline=False
+        )
+
+        events = event_bus.get_stats()
+        embed.add_field(
+            name="📨 Event subscribers",
+            value="\n".join(
+                f"`{name}`: {stat['handled']} xong, {stat['failed']} lỗi | chờ {stat['queued']} | "
+                f"đang chạy {stat['running']}/{stat['concurrency']} | trễ p95 {stat['lag_p95']:.0f}ms"
+                for name, stat in events.items()
+            ) or "Chưa có subscriber",
+            inline=False
+        )
+
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
     def is_moderator(self, user_id: int) -> bool:
         """Check if user is a moderator."""
         return user_id in self.moderators
@@ -284,11 +466,7 @@ class AdminCommands(commands.Cog):
                 
                 try:
                     # Get all players and delete their private channels
-                    players = await db_manager.execute_query(
-                        "SELECT private_channel_id FROM players WHERE game_id = ?",
-                        (game_id,),
-                        fetchall=True
-                    )
+                    players = await db_manager.get_game_players(game_id)
                     
                     for player in players:
                         if player['private_channel_id']:
@@ -310,21 +488,7 @@ class AdminCommands(commands.Cog):
                                 print(f"   ⚠️ Error deleting channel: {e}")
                     
                     # Delete from database
-                    await db_manager.execute_query(
-                        "DELETE FROM players WHERE game_id = ?",
-                        (game_id,),
-                        commit=True
-                    )
-                    await db_manager.execute_query(
-                        "DELETE FROM active_games WHERE channel_id = ?",
-                        (game_id,),
-                        commit=True
-                    )
-                    await db_manager.execute_query(
-                        "DELETE FROM game_maps WHERE game_id = ?",
-                        (game_id,),
-                        commit=True
-                    )
+                    await db_manager.cleanup_game(game_id)
                     
                     print(f"✅ [FORCESTOP] Game {game['game_code']} deleted!\n")
                     
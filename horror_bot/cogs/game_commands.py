@@ -8,8 +8,7 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 from database import db_manager
-from services import game_engine, map_generator, scenario_generator, llm_service, background_service, leaderboard_service
-import json
+from services import game_engine, map_generator, scenario_generator, llm_service, background_service, leaderboard_service, game_content, content_pool, admission, action_buffer
 import asyncio
 import random
 import uuid
@@ -20,6 +19,11 @@ class GameCommands(commands.Cog):
     
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        # Gom các tin nhắn liên tiếp của một player thành một hành động
+        self.action_buffer = action_buffer.ActionBuffer(self._run_buffered_action)
+
+    async def cog_unload(self):
+        self.action_buffer.close()
 
     @app_commands.command(
         name="newgame",
@@ -70,11 +74,13 @@ class GameCommands(commands.Cog):
 
         # Load scenario map
         print(f"   └─ Loading scenario map...")
-        scenario_file = f"data/scenarios/{scenario_value}.json"
+        scenario_file = map_generator.scenario_path(scenario_value)
         game_map = map_generator.generate_map_structure(scenario_file)
         if not game_map:
             await interaction.followup.send("❌ Lỗi: Không thể tạo bản đồ.", ephemeral=True)
             return
+        # Chỉ seed được lưu vào game_maps - dùng seed này để tái hiện đúng bản đồ khi debug
+        print(f"   └─ Map seed: {game_map.seed} (generator v{game_map.generator_version}, {len(game_map.nodes)} rooms)")
 
         # Create channel structure: Lobby + Dashboard (as thread inside lobby)
         print(f"   └─ Creating lobby channel...")
@@ -133,7 +139,7 @@ class GameCommands(commands.Cog):
             print(f"      └─ Inserting into game_maps...")
             await db_manager.execute_query(
                 "INSERT INTO game_maps (game_id, map_data) VALUES (?, ?)",
-                (game_id, json.dumps(game_map.to_dict())),
+                (game_id, game_map.encode()),
                 commit=True
             )
             print(f"      ✅ game_maps saved")
@@ -191,8 +197,10 @@ class GameCommands(commands.Cog):
         # Generate and save game rules
         print(f"   └─ Generating game rules...")
         try:
-            rules_dict = await llm_service.generate_dark_rules(scenario_value)
+            rules_dict = await content_pool.get_rules(scenario_value, game_id=game_id)
             await db_manager.save_game_rules(game_id, rules_dict)
+            # Rules may land after a player already loaded the game content
+            game_content.evict(game_id)
             
             public_rules = rules_dict.get("public_rules", [])
             if public_rules:
@@ -206,6 +214,9 @@ class GameCommands(commands.Cog):
                  await lobby_channel.send("**CẢNH BÁO:** Không có quy tắc nào được đặt ra. Hãy tự mình khám phá.")
                  print(f"      ⚠️ No public rules were generated.")
 
+        except llm_service.InferenceCancelled:
+            print(f"      🧹 Game {game_id} was deleted while its rules were queued - stopping setup")
+            return
         except Exception as e:
             print(f"      ⚠️ Error generating or sending rules: {e}")
             await lobby_channel.send("**CẢNH BÁO:** Có lỗi khi tạo ra các quy tắc của thế giới này. Mọi thứ đều khó lường.")
@@ -229,16 +240,7 @@ class GameCommands(commands.Cog):
             profile = await background_service.create_player_profile(scenario_type)
             print(f"        └─ Inserting player into database...")
             
-            await db_manager.execute_query(
-                """INSERT INTO players 
-                   (user_id, game_id, background_id, background_name, background_description,
-                    hp, sanity, agi, acc, current_location_id, is_ready)
-                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0)""",
-                (user_id, game_id, profile['background_id'], profile['background_name'],
-                 profile['background_description'], profile['hp'], profile['sanity'],
-                 profile['agi'], profile['acc'], start_location_id),
-                commit=True
-            )
+            await db_manager.create_player(user_id, game_id, profile, start_location_id)
             print(f"        ✅ Player {user_id} added to game {game_id}")
         except Exception as e:
             print(f"        ❌ Error adding player: {e}")
@@ -247,7 +249,7 @@ class GameCommands(commands.Cog):
         """Generate and send detailed world lore in background (non-blocking)."""
         try:
             print(f"      └─ Generating detailed world lore in background...")
-            world_lore = await llm_service.generate_world_lore(scenario_type)
+            world_lore = await content_pool.get_lore(scenario_type)
             print(f"      └─ World lore generated: {len(world_lore)} characters")
             
             if world_lore and len(world_lore) > 0:
@@ -274,11 +276,7 @@ class GameCommands(commands.Cog):
         user_id = interaction.user.id
         
         # Check if already started
-        player = await db_manager.execute_query(
-            "SELECT is_ready FROM players WHERE user_id = ? AND game_id = ?",
-            (user_id, game_id),
-            fetchone=True
-        )
+        player = await db_manager.get_player(user_id, game_id)
         
         if not player:
             await interaction.followup.send("❌ Bạn chưa join game này!", ephemeral=True)
@@ -319,18 +317,12 @@ class GameCommands(commands.Cog):
             print(f"      ✅ Private channel created: #{private_channel.name}")
             
             # Save private channel ID
-            await db_manager.execute_query(
-                "UPDATE players SET private_channel_id = ?, is_ready = 1 WHERE user_id = ? AND game_id = ?",
-                (private_channel.id, user_id, game_id),
-                commit=True
+            await db_manager.update_player_fields(
+                user_id, game_id, private_channel_id=private_channel.id, is_ready=1
             )
             
             # Send welcome message to private channel
-            player_data = await db_manager.execute_query(
-                "SELECT background_name, hp, sanity, agi, acc, current_location_id FROM players WHERE user_id = ? AND game_id = ?",
-                (user_id, game_id),
-                fetchone=True
-            )
+            player_data = await db_manager.get_player(user_id, game_id)
             
             welcome_text = f"""🎮 **Chào mừng đến {scenario_type.upper()}!**
 
@@ -350,18 +342,16 @@ LLM sẽ phân tích hành động của bạn và cập nhật kịch bản!"""
             await private_channel.send(welcome_text)
             
             # Send initial scene (from LLM)
-            game_map = json.loads((await db_manager.execute_query(
-                "SELECT map_data FROM game_maps WHERE game_id = ?",
-                (game_id,),
-                fetchone=True
-            ))['map_data'])
+            content = await game_content.get_game_content(game_id)
             
             current_room_id = player_data['current_location_id']
-            current_room = game_map['nodes'].get(current_room_id, {})
+            map_graph = content.map_graph if content else None
+            room_type = map_graph.room_type(current_room_id) if map_graph else None
+            description = map_graph.description(current_room_id) if map_graph else None
             
-            initial_scene = f"""**📍 {current_room.get('room_type', 'Room').upper()}**
+            initial_scene = f"""**📍 {(room_type or 'Room').upper()}**
 
-{current_room.get('description', 'Một không gian bí ẩn...')}
+{description or 'Một không gian bí ẩn...'}
 
 💭 *Bạn cảm thấy sợ hãi nhưng cũng tò mò...* 
 
@@ -386,32 +376,54 @@ LLM sẽ phân tích hành động của bạn và cập nhật kịch bản!"""
         if message.author == self.bot.user:
             return
         
-        # Ignore messages outside private channels
-        if not message.channel.name.startswith("private-"):
+        # Find game_id from private channel (in-memory routing table, no DB work)
+        route = db_manager.route_private_channel(message.channel.id)
+        if route is None:
             return
         
-        # Find game_id from private channel
         player_id = message.author.id
-        player = await db_manager.execute_query(
-            "SELECT game_id FROM players WHERE user_id = ? AND private_channel_id = ?",
-            (player_id, message.channel.id),
-            fetchone=True
-        )
-        
-        if not player:
+        owner_id, game_id = route
+        if player_id != owner_id:
             return
         
-        game_id = player['game_id']
         print(f"[ACTION] Player {player_id} in game {game_id}: {message.content}")
+
+        # Model còn đang load/warm-up: trả lời ngay thay vì treo hành động
+        if llm_service.is_waking_up():
+            await message.reply("😴 Quản trò đang thức giấc... Hãy thử lại sau ít giây.")
+            return
         
-        # Process free-form action through game engine
-        await game_engine.process_free_text_action(
-            player_id=player_id,
-            game_id=game_id,
-            action_text=message.content,
-            channel=message.channel,
-            bot=self.bot
-        )
+        # Chờ player gõ xong (có thể qua nhiều tin nhắn) rồi mới xử lý một lần
+        await self.action_buffer.add((player_id, game_id), message)
+
+    async def _run_buffered_action(self, key: tuple, messages: list):
+        """Xử lý một cụm tin nhắn đã gom như một hành động duy nhất."""
+        player_id, game_id = key
+        message = messages[-1]
+        action_text = action_buffer.merge_text(messages)
+        if not action_text:
+            return
+        if len(messages) > 1:
+            print(f"[ACTION] Gom {len(messages)} tin nhắn của {player_id} thành một hành động")
+
+        # Admission control: chặn spam trước khi hành động chiếm chỗ trong hàng đợi LLM
+        reason = admission.try_acquire(player_id, game_id)
+        if reason is not None:
+            print(f"[ACTION] Từ chối hành động của {player_id} (game {game_id}): {reason}")
+            await message.reply(admission.REJECT_MESSAGES[reason])
+            return
+
+        try:
+            # Process free-form action through game engine
+            await game_engine.process_free_text_action(
+                player_id=player_id,
+                game_id=game_id,
+                action_text=action_text,
+                channel=message.channel,
+                bot=self.bot
+            )
+        finally:
+            admission.release(player_id, game_id)
 
     @app_commands.command(name="endgame", description="🏁 Kết thúc game (host tắt ngay, người khác vote 50%)")
     async def end_game(self, interaction: discord.Interaction):
@@ -446,11 +458,7 @@ LLM sẽ phân tích hành động của bạn và cập nhật kịch bản!"""
         print(f"   └─ Is host: {is_host}")
         
         # Check if user is in game
-        player = await db_manager.execute_query(
-            "SELECT * FROM players WHERE user_id = ? AND game_id = ?",
-            (user_id, game_id),
-            fetchone=True
-        )
+        player = await db_manager.get_player(user_id, game_id)
         
         if not player:
             await interaction.followup.send("❌ Bạn không tham gia game này!", ephemeral=True)
@@ -470,11 +478,7 @@ LLM sẽ phân tích hành động của bạn và cập nhật kịch bản!"""
         print(f"   └─ Non-host player, starting vote")
         
         # Get all players in game
-        all_players = await db_manager.execute_query(
-            "SELECT user_id FROM players WHERE game_id = ?",
-            (game_id,),
-            fetchall=True
-        )
+        all_players = await db_manager.get_game_players(game_id)
         
         total_players = len(all_players)
         votes_needed = max(1, (total_players + 1) // 2)  # 50% + 1 for majority
@@ -572,11 +576,7 @@ LLM sẽ phân tích hành động của bạn và cập nhật kịch bản!"""
             
             if game:
                 # Get all players and delete their private channels
-                players = await db_manager.execute_query(
-                    "SELECT private_channel_id FROM players WHERE game_id = ?",
-                    (game_id,),
-                    fetchall=True
-                )
+                players = await db_manager.get_game_players(game_id)
                 
                 for player in players:
                     if player['private_channel_id']:
@@ -598,21 +598,7 @@ LLM sẽ phân tích hành động của bạn và cập nhật kịch bản!"""
                             print(f"      ⚠️ Error deleting channel: {e}")
             
             # Delete from database
-            await db_manager.execute_query(
-                "DELETE FROM players WHERE game_id = ?",
-                (game_id,),
-                commit=True
-            )
-            await db_manager.execute_query(
-                "DELETE FROM active_games WHERE channel_id = ?",
-                (game_id,),
-                commit=True
-            )
-            await db_manager.execute_query(
-                "DELETE FROM game_maps WHERE game_id = ?",
-                (game_id,),
-                commit=True
-            )
+            await db_manager.cleanup_game(game_id)
             
             print(f"      ✅ Game deleted: {game_code}\n")
             
@@ -0,0 +1,54 @@
+"""
+HORROR BOT - PRIVATE CHANNEL ROUTES
+Bảng định tuyến trong bộ nhớ: private_channel_id -> (user_id, game_id).
+on_message tra bảng này thay vì query SQLite, nên tin nhắn ở kênh không liên quan
+không tốn lần đọc DB nào. SQLite vẫn là nguồn dữ liệu gốc; bảng được nạp lại một lần
+khi khởi động và cập nhật sau mỗi lần COMMIT liên quan.
+"""
+
+
+class ChannelRoutes:
+    """Map private channel -> player; có index ngược theo game để xóa cả game một lần."""
+
+    def __init__(self):
+        self._routes = {}       # channel_id -> (user_id, game_id)
+        self._game_channels = {}  # game_id -> set(channel_id)
+        self.stats = {"hits": 0, "misses": 0, "loaded": 0}
+
+    def get(self, channel_id: int) -> tuple | None:
+        route = self._routes.get(channel_id)
+        if route is None:
+            self.stats["misses"] += 1
+        else:
+            self.stats["hits"] += 1
+        return route
+
+    def add(self, channel_id: int, user_id: int, game_id: int):
+        self.remove(channel_id)
+        self._routes[channel_id] = (user_id, game_id)
+        self._game_channels.setdefault(game_id, set()).add(channel_id)
+
+    def remove(self, channel_id: int):
+        route = self._routes.pop(channel_id, None)
+        if route is None:
+            return
+        channels = self._game_channels.get(route[1])
+        if channels is not None:
+            channels.discard(channel_id)
+            if not channels:
+                del self._game_channels[route[1]]
+
+    def remove_game(self, game_id: int):
+        for channel_id in self._game_channels.pop(game_id, ()):
+            self._routes.pop(channel_id, None)
+
+    def replace_all(self, rows):
+        """Nạp lại toàn bộ bảng từ các dòng (private_channel_id, user_id, game_id)."""
+        self._routes.clear()
+        self._game_channels.clear()
+        for channel_id, user_id, game_id in rows:
+            self.add(int(channel_id), user_id, int(game_id))
+        self.stats["loaded"] = len(self._routes)
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "size": len(self._routes), "games": len(self._game_channels)}
@@ -1,6 +1,13 @@
 import aiosqlite
 import os
+import time
 import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from database import migrations
+from database.player_cache import PlayerCache
+from database.channel_routes import ChannelRoutes
+from database.occupancy import OccupancyIndex
 
 # --- CẤU HÌNH ĐƯỜNG DẪN TUYỆT ĐỐI (QUAN TRỌNG) ---
 # Lấy đường dẫn thư mục chứa file db_manager.py (tức là thư mục database/)
@@ -12,6 +19,342 @@ DB_PATH = os.path.join(os.path.dirname(BASE_DIR), "horror_bot.db")
 # File Schema nằm ngay trong thư mục database/
 SCHEMA_PATH = os.path.join(BASE_DIR, "schema.sql")
 
+# --- CẤU HÌNH CONNECTION POOL ---
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+# Kết nối idle lâu hơn ngưỡng này sẽ được ping (SELECT 1) trước khi dùng lại
+DB_POOL_HEALTH_CHECK_SECONDS = float(os.getenv("DB_POOL_HEALTH_CHECK_SECONDS", "60"))
+
+# --- CẤU HÌNH STORAGE MODE ---
+# "wal": WAL + một writer task duy nhất gom commit (mặc định)
+# "legacy": journal mặc định, mỗi helper tự commit trên kết nối của nó
+DB_STORAGE_MODE = os.getenv("DB_STORAGE_MODE", "wal").lower()
+# Số câu lệnh ghi tối đa gom vào một lần COMMIT
+DB_WRITER_BATCH_SIZE = int(os.getenv("DB_WRITER_BATCH_SIZE", "64"))
+
+# Số player tối đa giữ trong cache state (LRU)
+PLAYER_CACHE_SIZE = int(os.getenv("PLAYER_CACHE_SIZE", "2000"))
+
+# Số message hội thoại LLM giữ lại cho mỗi player (phần cũ hơn bị prune ở nền)
+LLM_HISTORY_KEEP = 10
+
+# Cửa sổ lịch sử đưa vào prompt: điểm bắt đầu chỉ nhảy mỗi LLM_HISTORY_STEP message,
+# nên giữa hai lần nhảy prompt chỉ nối thêm ở cuối và KV cache của session được dùng lại.
+# Cửa sổ dài từ LLM_HISTORY_WINDOW đến LLM_HISTORY_WINDOW + LLM_HISTORY_STEP - 1 message.
+LLM_HISTORY_WINDOW = 4
+LLM_HISTORY_STEP = 6
+
+# Pragma áp dụng cho mọi kết nối ở chế độ WAL (journal_mode=WAL được lưu trong file DB)
+WAL_CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous = NORMAL",     # WAL + NORMAL: không fsync mỗi commit, vẫn an toàn khi crash app
+    "PRAGMA cache_size = -16000",      # ~16MB page cache mỗi kết nối
+    "PRAGMA mmap_size = 134217728",    # 128MB memory-mapped I/O cho reader
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 30000",
+)
+
+
+async def _apply_connection_pragmas(db: aiosqlite.Connection):
+    if DB_STORAGE_MODE == "wal":
+        for pragma in WAL_CONNECTION_PRAGMAS:
+            await db.execute(pragma)
+
+
+class ConnectionPool:
+    """Pool các kết nối aiosqlite sống lâu, dùng chung cho mọi helper trong db_manager.
+
+    Mỗi kết nối aiosqlite giữ một OS thread + một SQLite handle, nên việc mở/đóng
+    cho từng câu query rất tốn kém. Pool giữ tối đa `size` kết nối, cấp phát theo
+    LIFO (kết nối "nóng" nhất được dùng lại trước) và ping các kết nối idle lâu.
+    """
+
+    def __init__(self, db_path: str, size: int = DB_POOL_SIZE, timeout: float = 30):
+        self.db_path = db_path
+        self.size = max(1, size)
+        self.timeout = timeout
+        self._idle = asyncio.LifoQueue()  # (connection, last_used_monotonic)
+        self._created = 0
+        self._closed = False
+        self.stats = {"connects": 0, "acquires": 0, "waits": 0, "health_check_failures": 0}
+
+    async def _connect(self) -> aiosqlite.Connection:
+        db = await aiosqlite.connect(self.db_path, timeout=self.timeout)
+        db.row_factory = aiosqlite.Row
+        await _apply_connection_pragmas(db)
+        self.stats["connects"] += 1
+        return db
+
+    async def _is_healthy(self, db: aiosqlite.Connection) -> bool:
+        try:
+            async with db.execute("SELECT 1") as cursor:
+                await cursor.fetchone()
+            return True
+        except Exception as e:
+            print(f"⚠️ [DB_POOL] Kết nối hỏng, tạo lại: {e}")
+            self.stats["health_check_failures"] += 1
+            return False
+
+    async def _discard(self, db: aiosqlite.Connection):
+        self._created -= 1
+        try:
+            await db.close()
+        except Exception:
+            pass
+
+    async def _acquire(self) -> aiosqlite.Connection:
+        self.stats["acquires"] += 1
+        while True:
+            if self._closed:
+                raise RuntimeError("Connection pool đã đóng")
+
+            try:
+                db, last_used = self._idle.get_nowait()
+            except asyncio.QueueEmpty:
+                if self._created < self.size:
+                    self._created += 1
+                    try:
+                        return await self._connect()
+                    except Exception:
+                        self._created -= 1
+                        raise
+                self.stats["waits"] += 1
+                db, last_used = await self._idle.get()
+
+            if time.monotonic() - last_used < DB_POOL_HEALTH_CHECK_SECONDS or await self._is_healthy(db):
+                return db
+            await self._discard(db)
+
+    async def _release(self, db: aiosqlite.Connection):
+        if self._closed:
+            await self._discard(db)
+            return
+        try:
+            # Không trả về pool một kết nối còn transaction dở dang
+            if db.in_transaction:
+                await db.rollback()
+        except Exception:
+            await self._discard(db)
+            return
+        self._idle.put_nowait((db, time.monotonic()))
+
+    @asynccontextmanager
+    async def connection(self):
+        """Mượn một kết nối từ pool: `async with pool.connection() as db: ...`"""
+        db = await self._acquire()
+        try:
+            yield db
+        finally:
+            await self._release(db)
+
+    async def close(self):
+        """Đóng toàn bộ kết nối idle; kết nối đang được mượn sẽ bị đóng khi trả về."""
+        self._closed = True
+        while not self._idle.empty():
+            db, _ = self._idle.get_nowait()
+            await self._discard(db)
+        print("✅ [DB_POOL] Đã đóng connection pool.")
+
+
+class WriteQueue:
+    """Writer duy nhất cho chế độ WAL: mọi câu lệnh ghi đi qua một hàng đợi.
+
+    Một task nền lấy các lệnh đang chờ (tối đa `batch_size`), chạy mỗi lệnh trong
+    một SAVEPOINT riêng (lệnh lỗi không kéo theo cả batch) rồi COMMIT một lần
+    cho cả batch (group commit). Reader vẫn chạy song song trên ConnectionPool.
+    """
+
+    def __init__(self, db_path: str, batch_size: int = DB_WRITER_BATCH_SIZE, timeout: float = 30):
+        self.db_path = db_path
+        self.batch_size = max(1, batch_size)
+        self.timeout = timeout
+        self._queue = asyncio.Queue()
+        self._start_lock = asyncio.Lock()
+        self._lock = asyncio.Lock()  # Quyền dùng kết nối writer: batch hoặc transaction
+        self._db = None
+        self._task = None
+        self._closed = False
+        self._commit_ms = deque(maxlen=500)   # Thời gian chạy batch + COMMIT
+        self._latency_ms = deque(maxlen=500)  # Từ lúc xếp hàng tới lúc commit xong
+        self.stats = {"commits": 0, "statements": 0, "failed_statements": 0, "max_queue_depth": 0}
+
+    async def start(self):
+        if self._task is not None:
+            return
+        async with self._start_lock:
+            if self._task is not None:
+                return
+            self._db = await aiosqlite.connect(self.db_path, timeout=self.timeout, isolation_level=None)
+            self._db.row_factory = aiosqlite.Row
+            await _apply_connection_pragmas(self._db)
+            self._task = asyncio.create_task(self._run())
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    async def submit(self, query, params=(), fetchone=False, fetchall=False, many=False):
+        """Xếp một lệnh ghi vào hàng đợi, chờ tới khi batch chứa nó được COMMIT."""
+        if self._closed:
+            raise RuntimeError("Writer queue đã đóng")
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((query, params, fetchone, fetchall, many, time.perf_counter(), future))
+        self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], self._queue.qsize())
+        return await future
+
+    @asynccontextmanager
+    async def exclusive(self):
+        """Giữ riêng kết nối writer (dùng cho transaction nhiều lệnh)."""
+        async with self._lock:
+            yield self._db
+
+    async def _run(self):
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            async with self._lock:
+                await self._commit_batch(batch)
+            if stop:
+                return
+
+    async def _run_statement(self, query, params, fetchone, fetchall, many):
+        if many:
+            await self._db.executemany(query, params)
+            return None
+        async with self._db.execute(query, params) as cursor:
+            if fetchone:
+                row = await cursor.fetchone()
+                return dict(row) if row else None
+            if fetchall:
+                return [dict(row) for row in await cursor.fetchall()]
+            return None
+
+    async def _commit_batch(self, batch: list):
+        started = time.perf_counter()
+        done = []
+        try:
+            await self._db.execute("BEGIN")
+            for query, params, fetchone, fetchall, many, enqueued, future in batch:
+                if future.done():  # Caller đã timeout/cancel
+                    continue
+                await self._db.execute("SAVEPOINT write_stmt")
+                try:
+                    result = await self._run_statement(query, params, fetchone, fetchall, many)
+                    await self._db.execute("RELEASE write_stmt")
+                    done.append((future, result, enqueued))
+                except Exception as e:
+                    await self._db.execute("ROLLBACK TO write_stmt")
+                    await self._db.execute("RELEASE write_stmt")
+                    self.stats["failed_statements"] += 1
+                    if not future.done():  # Caller có thể đã timeout trong lúc lệnh đang chạy
+                        future.set_exception(e)
+            await self._db.execute("COMMIT")
+        except Exception as e:
+            print(f"❌ [DB_WRITER] Lỗi commit batch ({len(batch)} lệnh): {e}")
+            try:
+                await self._db.execute("ROLLBACK")
+            except Exception:
+                pass
+            for *_, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        finished = time.perf_counter()
+        self._commit_ms.append((finished - started) * 1000)
+        self.stats["commits"] += 1
+        self.stats["statements"] += len(done)
+        for future, result, enqueued in done:
+            self._latency_ms.append((finished - enqueued) * 1000)
+            if not future.done():
+                future.set_result(result)
+
+    def get_stats(self) -> dict:
+        def _summary(samples):
+            if not samples:
+                return {"avg": 0.0, "p95": 0.0, "max": 0.0}
+            ordered = sorted(samples)
+            return {
+                "avg": sum(ordered) / len(ordered),
+                "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                "max": ordered[-1],
+            }
+
+        commits = self.stats["commits"]
+        return {
+            **self.stats,
+            "queue_depth": self.queue_depth,
+            "avg_batch_size": self.stats["statements"] / commits if commits else 0.0,
+            "commit_ms": _summary(self._commit_ms),
+            "write_latency_ms": _summary(self._latency_ms),
+        }
+
+    async def close(self):
+        """Xử lý nốt các lệnh còn trong hàng đợi rồi đóng kết nối writer."""
+        self._closed = True
+        if self._task is not None:
+            self._queue.put_nowait(None)
+            await self._task
+            self._task = None
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+        print("✅ [DB_WRITER] Đã đóng writer queue.")
+
+
+_pool: ConnectionPool | None = None
+_writer: WriteQueue | None = None
+
+
+def get_pool() -> ConnectionPool:
+    """Lấy pool dùng chung (tạo lười ở lần gọi đầu tiên)."""
+    global _pool
+    if _pool is None or _pool._closed:
+        _pool = ConnectionPool(DB_PATH)
+    return _pool
+
+
+async def get_writer() -> WriteQueue | None:
+    """Lấy writer queue (chỉ có ở chế độ WAL), khởi động lười ở lần gọi đầu tiên."""
+    global _writer
+    if DB_STORAGE_MODE != "wal":
+        return None
+    if _writer is None or _writer._closed:
+        _writer = WriteQueue(DB_PATH)
+    await _writer.start()
+    return _writer
+
+
+def get_storage_stats() -> dict:
+    """Số liệu storage để theo dõi khi tải cao: độ sâu hàng đợi, latency commit, pool."""
+    stats = {"mode": DB_STORAGE_MODE}
+    if _pool is not None:
+        stats["pool"] = dict(_pool.stats)
+    if _writer is not None:
+        stats["writer"] = _writer.get_stats()
+    return stats
+
+
+async def close_pool():
+    """Shutdown hook: gọi khi bot tắt để flush writer và đóng sạch các kết nối SQLite."""
+    global _pool, _writer
+    if _writer is not None:
+        await _writer.close()
+        _writer = None
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
 async def get_db_connection():
     """Get a database connection with row factory set to aiosqlite.Row."""
     db = await aiosqlite.connect(DB_PATH)
@@ -19,7 +362,7 @@ async def get_db_connection():
     return db
 
 async def setup_database():
-    """Hàm này sẽ đọc file schema.sql và tạo bảng"""
+    """Tạo/nâng cấp schema bằng các migration đánh số (xem database/migrations.py)."""
     print(f"🛠️ Đang kiểm tra Database tại: {DB_PATH}")
     print(f"📄 Đang đọc Schema tại: {SCHEMA_PATH}")
 
@@ -28,26 +371,104 @@ async def setup_database():
         return
 
     async with aiosqlite.connect(DB_PATH) as db:
-        with open(SCHEMA_PATH, 'r', encoding='utf-8') as f:
-            schema = f.read()
-            
-            # Kiểm tra file có rỗng không
-            if not schema.strip():
-                print("❌ LỖI: File schema.sql bị rỗng! Hãy copy nội dung SQL vào.")
-                return
+        if DB_STORAGE_MODE == "wal":
+            # journal_mode được lưu vào file DB, chỉ cần bật một lần
+            async with db.execute("PRAGMA journal_mode = WAL") as cursor:
+                row = await cursor.fetchone()
+                print(f"✅ Storage mode: {DB_STORAGE_MODE} (journal_mode={row[0]})")
+
+        try:
+            version = await migrations.run_migrations(db, SCHEMA_PATH)
+            print(f"✅ Schema đã ở phiên bản {version}.")
+        except Exception as e:
+            print(f"❌ Lỗi SQL khi chạy migration: {e}")
+            return
+
+        # Các query nóng không được full table scan
+        for name, detail in await migrations.check_hot_query_plans(db):
+            print(f"⚠️ Query '{name}' vẫn full scan: {detail}")
+
+class Transaction:
+    """Unit-of-work: gom nhiều lệnh đọc/ghi vào một transaction, COMMIT một lần.
+
+    Dùng qua `async with db_manager.transaction() as tx:`. `tx.execute` có cùng
+    chữ ký với `execute_query` (tham số commit bị bỏ qua), nên các helper có thể
+    nhận `tx=` để chạy bên trong transaction.
+    """
+
+    def __init__(self, db: aiosqlite.Connection):
+        self._db = db
+        self._on_commit = []
+
+    async def execute(self, query, params=(), commit=False, fetchone=False, fetchall=False):
+        async with self._db.execute(query, params) as cursor:
+            if fetchone:
+                row = await cursor.fetchone()
+                return dict(row) if row else None
+            if fetchall:
+                return [dict(row) for row in await cursor.fetchall()]
+            return None
 
+    async def executemany(self, query, seq_of_params):
+        await self._db.executemany(query, seq_of_params)
+
+    def on_commit(self, callback):
+        """Đăng ký callback (sync) chạy sau khi COMMIT thành công."""
+        self._on_commit.append(callback)
+
+    def _run_commit_hooks(self):
+        for callback in self._on_commit:
             try:
-                await db.executescript(schema)
-                await db.commit()
-                print("✅ Đã chạy lệnh tạo bảng thành công.")
+                callback()
             except Exception as e:
-                print(f"❌ Lỗi SQL khi tạo bảng: {e}")
+                print(f"⚠️ Error in on_commit callback: {e}")
+
+
+@asynccontextmanager
+async def transaction():
+    """Mở một transaction ghi (BEGIN IMMEDIATE ... COMMIT), rollback nếu có lỗi.
+
+    Ở chế độ WAL transaction chạy trên kết nối writer nên sẽ chặn writer queue
+    cho tới khi xong: không được gọi LLM hay `execute_query(..., commit=True)`
+    bên trong khối `async with`.
+    """
+    writer = await get_writer()
+    if writer is not None:
+        connection = writer.exclusive()
+    else:
+        connection = get_pool().connection()
+
+    async with connection as db:
+        await db.execute("BEGIN IMMEDIATE")
+        tx = Transaction(db)
+        try:
+            yield tx
+            await db.execute("COMMIT")
+        except BaseException:
+            if db.in_transaction:
+                await db.execute("ROLLBACK")
+            raise
+    tx._run_commit_hooks()
+
+
+def _runner(tx: Transaction | None):
+    """Chọn cách chạy query: trong transaction `tx` nếu có, ngược lại execute_query."""
+    return tx.execute if tx is not None else execute_query
+
 
 async def execute_query(query, params=(), commit=False, fetchone=False, fetchall=False, timeout=30):
-    """Hàm tiện ích để chạy query SQL an toàn (trả về dict, không phải Row)"""
+    """Hàm tiện ích để chạy query SQL an toàn (trả về dict, không phải Row).
+
+    Ở chế độ WAL, query có commit=True được chuyển cho writer queue; query đọc
+    chạy song song trên ConnectionPool.
+    """
     async def _execute():
-        async with aiosqlite.connect(DB_PATH, timeout=30) as db:
-            db.row_factory = aiosqlite.Row
+        if commit:
+            writer = await get_writer()
+            if writer is not None:
+                return await writer.submit(query, params, fetchone=fetchone, fetchall=fetchall)
+
+        async with get_pool().connection() as db:
             async with db.execute(query, params) as cursor:
                 result = None
                 if fetchone:
@@ -70,6 +491,120 @@ async def execute_query(query, params=(), commit=False, fetchone=False, fetchall
         print(f"❌ Database error: {e}")
         raise
 
+# ===== PLAYER STATE (write-through cache) =====
+
+# SQLite là nguồn gốc; cache chỉ phục vụ đọc cho các hot path
+player_cache = PlayerCache(PLAYER_CACHE_SIZE)
+# private_channel_id -> (user_id, game_id) cho on_message (nạp lại bằng load_channel_routes khi khởi động)
+channel_routes = ChannelRoutes()
+# (game_id, room_id) -> user_id còn sống, cho encounter / broadcast theo phòng (nạp lại bằng load_occupancy)
+occupancy = OccupancyIndex()
+
+
+def _after_commit(tx: Transaction | None, callback):
+    """Chạy callback ngay (query đã commit) hoặc sau khi transaction `tx` COMMIT."""
+    if tx is not None:
+        tx.on_commit(callback)
+    else:
+        callback()
+
+
+async def get_player(user_id: int, game_id: int) -> dict | None:
+    """Lấy toàn bộ dòng `players` của một player (ưu tiên cache)."""
+    game_id = int(game_id)
+    cached = player_cache.get(user_id, game_id)
+    if cached is not None:
+        return cached
+
+    generation = player_cache.generation(game_id)
+    player = await execute_query(
+        "SELECT * FROM players WHERE user_id = ? AND game_id = ?",
+        (user_id, game_id),
+        fetchone=True
+    )
+    if player:
+        player_cache.put(player, generation)
+    return player
+
+
+async def get_game_players(game_id: int) -> list:
+    """Lấy tất cả player của game (ưu tiên cache)."""
+    game_id = int(game_id)
+    cached = player_cache.get_game(game_id)
+    if cached is not None:
+        return cached
+
+    generation = player_cache.generation(game_id)
+    players = await execute_query(
+        "SELECT * FROM players WHERE game_id = ?",
+        (game_id,),
+        fetchall=True
+    )
+    player_cache.put_game(game_id, players, generation)
+    return players
+
+
+async def update_player_fields(user_id: int, game_id: int, tx: Transaction = None, **fields):
+    """UPDATE các cột của player rồi ghi xuyên (write-through) vào cache sau khi commit."""
+    if not fields:
+        return
+    columns = ", ".join(f"{column} = ?" for column in fields)
+    await _runner(tx)(
+        f"UPDATE players SET {columns} WHERE user_id = ? AND game_id = ?",
+        (*fields.values(), user_id, game_id),
+        commit=True
+    )
+    _after_commit(tx, lambda: player_cache.update(user_id, int(game_id), **fields))
+    if fields.get('private_channel_id'):
+        _after_commit(tx, lambda: channel_routes.add(int(fields['private_channel_id']), user_id, int(game_id)))
+    if 'current_location_id' in fields or 'hp' in fields:
+        _after_commit(tx, lambda: occupancy.update(int(game_id), user_id, **fields))
+
+
+async def load_channel_routes():
+    """Dựng lại bảng định tuyến private channel bằng một query duy nhất."""
+    rows = await execute_query(
+        "SELECT private_channel_id, user_id, game_id FROM players WHERE private_channel_id IS NOT NULL",
+        fetchall=True
+    )
+    channel_routes.replace_all(
+        (row['private_channel_id'], row['user_id'], row['game_id']) for row in rows or []
+    )
+    print(f"✅ Đã nạp {len(rows or [])} private channel vào bảng định tuyến")
+
+
+async def load_occupancy():
+    """Dựng lại index phòng -> player còn sống của mọi game bằng một query duy nhất."""
+    rows = await execute_query(
+        "SELECT game_id, user_id, current_location_id, hp FROM players",
+        fetchall=True
+    )
+    occupancy.replace_all(
+        (int(row['game_id']), row['user_id'], row['current_location_id'], row['hp']) for row in rows or []
+    )
+    print(f"✅ Đã nạp vị trí của {len(rows or [])} player vào occupancy index")
+
+
+def route_private_channel(channel_id: int) -> tuple | None:
+    """(user_id, game_id) sở hữu private channel, hoặc None nếu không phải kênh game."""
+    return channel_routes.get(channel_id)
+
+
+async def create_player(user_id: int, game_id: int, profile: dict, start_location_id: str):
+    """Thêm player mới vào game với profile từ background_service."""
+    await execute_query(
+        """INSERT INTO players 
+           (user_id, game_id, background_id, background_name, background_description,
+            hp, sanity, agi, acc, current_location_id, is_ready)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0)""",
+        (user_id, game_id, profile['background_id'], profile['background_name'],
+         profile['background_description'], profile['hp'], profile['sanity'],
+         profile['agi'], profile['acc'], start_location_id),
+        commit=True
+    )
+    player_cache.invalidate(user_id, int(game_id))
+    occupancy.place(int(game_id), user_id, start_location_id, profile['hp'])
+
 # ===== HELPER FUNCTIONS FOR GAME MANAGEMENT =====
 
 async def get_player_current_game(user_id: int) -> int | None:
@@ -85,20 +620,11 @@ async def get_player_current_game(user_id: int) -> int | None:
 
 async def check_player_in_game(user_id: int, game_id: int) -> bool:
     """Kiểm tra người chơi đã trong game này chưa."""
-    result = await execute_query(
-        "SELECT 1 FROM players WHERE user_id = ? AND game_id = ?",
-        (user_id, game_id),
-        fetchone=True
-    )
-    return result is not None
+    return await get_player(user_id, game_id) is not None
 
 async def get_waiting_room_confirmations(game_id: int) -> dict:
     """Lấy số người đã confirm và chưa confirm trong waiting room."""
-    players = await execute_query(
-        "SELECT user_id, waiting_room_confirmed FROM players WHERE game_id = ?",
-        (game_id,),
-        fetchall=True
-    )
+    players = await get_game_players(game_id)
     confirmed = sum(1 for p in players if p.get('waiting_room_confirmed'))
     total = len(players)
     return {"confirmed": confirmed, "total": total, "players": players}
@@ -123,22 +649,34 @@ async def get_game_setup(guild_id: int) -> dict | None:
 
 async def get_end_game_votes(game_id: int) -> dict:
     """Lấy số người vote end game."""
-    players = await execute_query(
-        "SELECT user_id, voted_end_game FROM players WHERE game_id = ?",
-        (game_id,),
-        fetchall=True
-    )
+    players = await get_game_players(game_id)
     voted = sum(1 for p in players if p.get('voted_end_game'))
     total = len(players)
     return {"voted": voted, "total": total, "ratio": voted / total if total > 0 else 0}
 
+# Callback(game_id) chạy sau khi cleanup_game commit (dọn cache/state trong bộ nhớ)
+_cleanup_hooks = []
+
+
+def register_cleanup_hook(callback):
+    """Đăng ký callback(game_id) để dọn state in-memory khi game bị xóa."""
+    _cleanup_hooks.append(callback)
+
+
 async def cleanup_game(game_id: int):
-    """Xóa sạch tất cả dữ liệu liên quan đến game."""
-    await execute_query("DELETE FROM players WHERE game_id = ?", (game_id,), commit=True)
-    await execute_query("DELETE FROM game_maps WHERE game_id = ?", (game_id,), commit=True)
-    await execute_query("DELETE FROM game_rules WHERE game_id = ?", (game_id,), commit=True)
-    await execute_query("DELETE FROM game_context WHERE game_id = ?", (game_id,), commit=True)
-    await execute_query("DELETE FROM active_games WHERE channel_id = ?", (game_id,), commit=True)
+    """Xóa sạch tất cả dữ liệu liên quan đến game (một transaction duy nhất)."""
+    async with transaction() as tx:
+        await tx.execute("DELETE FROM players WHERE game_id = ?", (game_id,))
+        await tx.execute("DELETE FROM player_messages WHERE game_id = ?", (game_id,))
+        await tx.execute("DELETE FROM game_maps WHERE game_id = ?", (game_id,))
+        await tx.execute("DELETE FROM game_rules WHERE game_id = ?", (game_id,))
+        await tx.execute("DELETE FROM game_context WHERE game_id = ?", (game_id,))
+        await tx.execute("DELETE FROM active_games WHERE channel_id = ?", (game_id,))
+        tx.on_commit(lambda: player_cache.invalidate_game(int(game_id)))
+        tx.on_commit(lambda: channel_routes.remove_game(int(game_id)))
+        tx.on_commit(lambda: occupancy.remove_game(int(game_id)))
+        for hook in _cleanup_hooks:
+            tx.on_commit(lambda hook=hook: hook(int(game_id)))
 
 # ===== HIDDEN RULES & DISCOVERY SYSTEM =====
 
@@ -154,57 +692,37 @@ async def get_game_rules(game_id: int, is_public: bool = True) -> list:
 async def discover_hidden_rule(user_id: int, game_id: int, rule_id: int) -> bool:
     """Mark hidden rule as discovered by player."""
     import json
-    player = await execute_query(
-        "SELECT discovered_hidden_rules FROM players WHERE user_id = ? AND game_id = ?",
-        (user_id, game_id),
-        fetchone=True
-    )
+    player = await get_player(user_id, game_id)
     
     if not player:
         return False
     
-    discovered = json.loads(player.get('discovered_hidden_rules', '[]'))
+    discovered = json.loads(player.get('discovered_hidden_rules') or '[]')
     if rule_id not in discovered:
         discovered.append(rule_id)
-        await execute_query(
-            "UPDATE players SET discovered_hidden_rules = ? WHERE user_id = ? AND game_id = ?",
-            (json.dumps(discovered), user_id, game_id),
-            commit=True
-        )
+        await update_player_fields(user_id, game_id, discovered_hidden_rules=json.dumps(discovered))
     return True
 
 async def get_player_discovered_rules(user_id: int, game_id: int) -> list:
     """Lấy danh sách hidden rules mà player đã khám phá."""
-    player = await execute_query(
-        "SELECT discovered_hidden_rules FROM players WHERE user_id = ? AND game_id = ?",
-        (user_id, game_id),
-        fetchone=True
-    )
+    player = await get_player(user_id, game_id)
     if not player:
         return []
     
     import json
-    return json.loads(player.get('discovered_hidden_rules', '[]'))
+    return json.loads(player.get('discovered_hidden_rules') or '[]')
 
 # ===== SANITY & PENALTY SYSTEM =====
 
 async def update_player_sanity(user_id: int, game_id: int, delta: int) -> int:
     """Thay đổi sanity của player, return new sanity value."""
-    player = await execute_query(
-        "SELECT sanity FROM players WHERE user_id = ? AND game_id = ?",
-        (user_id, game_id),
-        fetchone=True
-    )
+    player = await get_player(user_id, game_id)
     
     if not player:
         return 0
     
     new_sanity = max(0, min(100, player['sanity'] + delta))
-    await execute_query(
-        "UPDATE players SET sanity = ? WHERE user_id = ? AND game_id = ?",
-        (new_sanity, user_id, game_id),
-        commit=True
-    )
+    await update_player_fields(user_id, game_id, sanity=new_sanity)
     return new_sanity
 
 async def get_threat_level(game_id: int) -> int:
@@ -253,15 +771,27 @@ def calculate_action_success(player_stat: int, sanity: int, base_success_rate: f
 
 # ===== V4 HELPERS (Free-form Actions) =====
 
+async def get_player_ids_at_location(game_id: str, location_id: str) -> set:
+    """user_id của mọi player còn sống trong phòng (tra occupancy index, O(1))."""
+    game_id = int(game_id)
+    if not occupancy.is_complete(game_id):
+        rows = await execute_query(
+            "SELECT user_id, current_location_id, hp FROM players WHERE game_id = ?",
+            (game_id,),
+            fetchall=True
+        )
+        occupancy.load_game(game_id, ((row['user_id'], row['current_location_id'], row['hp']) for row in rows or []))
+    return occupancy.occupants(game_id, location_id)
+
+
 async def get_players_at_location(game_id: str, location_id: str) -> list:
-    """Get all players at a specific location."""
-    result = await execute_query(
-        """SELECT user_id, background_name, private_channel_id, hp 
-           FROM players WHERE game_id = ? AND current_location_id = ? AND hp > 0""",
-        (game_id, location_id),
-        fetchall=True
-    )
-    return result
+    """Get all living players at a specific location."""
+    players = []
+    for user_id in await get_player_ids_at_location(game_id, location_id):
+        player = await get_player(user_id, game_id)
+        if player is not None:
+            players.append(player)
+    return players
 
 
 async def get_game_by_id(game_id: str) -> dict:
@@ -288,12 +818,7 @@ async def update_player_stats(
     import json
     
     # Get current stats
-    player = await execute_query(
-        """SELECT hp, sanity, current_location_id, inventory 
-           FROM players WHERE user_id = ? AND game_id = ?""",
-        (user_id, game_id),
-        fetchone=True
-    )
+    player = await get_player(user_id, game_id)
     
     if not player:
         return None
@@ -305,11 +830,9 @@ async def update_player_stats(
     inventory = json.dumps(new_inventory) if new_inventory else player['inventory']
     
     # Update database
-    await execute_query(
-        """UPDATE players SET hp = ?, sanity = ?, current_location_id = ?, inventory = ?
-           WHERE user_id = ? AND game_id = ?""",
-        (new_hp, new_sanity, location, inventory, user_id, game_id),
-        commit=True
+    await update_player_fields(
+        user_id, game_id,
+        hp=new_hp, sanity=new_sanity, current_location_id=location, inventory=inventory
     )
     
     return {
@@ -320,55 +843,60 @@ async def update_player_stats(
     }
 
 
-async def append_to_llm_history(user_id: int, game_id: str, role: str, content: str):
-    """Append message to LLM conversation history (keep last 10)."""
-    import json
-    
-    player = await execute_query(
-        "SELECT llm_conversation_history FROM players WHERE user_id = ? AND game_id = ?",
-        (user_id, game_id),
-        fetchone=True
-    )
-    
-    if not player:
-        return
-    
-    history = json.loads(player['llm_conversation_history']) if player['llm_conversation_history'] else []
-    
-    # Append new message
-    history.append({"role": role, "content": content})
-    
-    # Keep only last 10 messages to save memory
-    history = history[-10:]
-    
-    await execute_query(
-        "UPDATE players SET llm_conversation_history = ? WHERE user_id = ? AND game_id = ?",
-        (json.dumps(history), user_id, game_id),
+async def append_to_llm_history(user_id: int, game_id: str, role: str, content: str, tx: Transaction = None):
+    """Append message to the player's LLM conversation history (append-only, no rewrite)."""
+    await _runner(tx)(
+        """INSERT INTO player_messages (game_id, user_id, seq, role, content)
+           SELECT ?, ?, COALESCE(MAX(seq), 0) + 1, ?, ?
+           FROM player_messages WHERE game_id = ? AND user_id = ?""",
+        (game_id, user_id, role, content, game_id, user_id),
         commit=True
     )
 
 
-async def get_llm_history(user_id: int, game_id: str) -> list:
-    """Get player's LLM conversation history."""
-    import json
-    
-    player = await execute_query(
-        "SELECT llm_conversation_history FROM players WHERE user_id = ? AND game_id = ?",
-        (user_id, game_id),
-        fetchone=True
+async def get_llm_history(user_id: int, game_id: str, limit: int = LLM_HISTORY_KEEP) -> list:
+    """Get the player's last `limit` LLM messages, oldest first (bounded indexed read)."""
+    rows = await execute_query(
+        """SELECT role, content FROM player_messages
+           WHERE game_id = ? AND user_id = ? ORDER BY seq DESC LIMIT ?""",
+        (game_id, user_id, limit),
+        fetchall=True
     )
-    
-    if not player:
-        return []
-    
-    return json.loads(player['llm_conversation_history']) if player['llm_conversation_history'] else []
+    return list(reversed(rows))
+
+
+async def get_llm_history_window(user_id: int, game_id: str,
+                                 window: int = LLM_HISTORY_WINDOW, step: int = LLM_HISTORY_STEP) -> list:
+    """Get the player's recent LLM messages, oldest first, with a start that only moves every `step` messages."""
+    rows = await execute_query(
+        """SELECT role, content FROM player_messages
+           WHERE game_id = ? AND user_id = ?
+             AND seq > (SELECT MAX(0, (MAX(seq) - ?) / ? * ?) FROM player_messages
+                        WHERE game_id = ? AND user_id = ?)
+           ORDER BY seq""",
+        (game_id, user_id, window, step, step, game_id, user_id),
+        fetchall=True
+    )
+    return rows
+
 
+async def prune_llm_history(keep: int = LLM_HISTORY_KEEP):
+    """Xóa các message cũ, chỉ giữ `keep` message mới nhất cho mỗi player (chạy ở nền)."""
+    await execute_query(
+        """DELETE FROM player_messages
+           WHERE seq <= (SELECT MAX(m.seq) FROM player_messages m
+                         WHERE m.game_id = player_messages.game_id
+                           AND m.user_id = player_messages.user_id) - ?""",
+        (keep,),
+        commit=True
+    )
 
-async def record_encounter(game_id: str, location_id: str, player_ids: list, encounter_text: str):
+
+async def record_encounter(game_id: str, location_id: str, player_ids: list, encounter_text: str, tx: Transaction = None):
     """Record player encounter in database."""
     import json
     
-    await execute_query(
+    await _runner(tx)(
         """INSERT INTO player_encounters (game_id, location_id, player_ids, encounter_text)
            VALUES (?, ?, ?, ?)""",
         (game_id, location_id, json.dumps(player_ids), encounter_text),
@@ -394,13 +922,15 @@ async def save_game_rules(game_id: int, rules_dict: dict):
         return
 
     # Use executemany for efficient bulk insertion
-    async with aiosqlite.connect(DB_PATH) as db:
-        try:
-            await db.executemany(
-                "INSERT INTO game_rules (game_id, rule_text, is_public) VALUES (?, ?, ?)",
-                all_rules
-            )
-            await db.commit()
-            print(f"✅ Saved {len(all_rules)} rules to the database for game {game_id}.")
-        except Exception as e:
-            print(f"❌ Error saving game rules: {e}")
\ No newline at end of file
+    query = "INSERT INTO game_rules (game_id, rule_text, is_public) VALUES (?, ?, ?)"
+    try:
+        writer = await get_writer()
+        if writer is not None:
+            await writer.submit(query, all_rules, many=True)
+        else:
+            async with get_pool().connection() as db:
+                await db.executemany(query, all_rules)
+                await db.commit()
+        print(f"✅ Saved {len(all_rules)} rules to the database for game {game_id}.")
+    except Exception as e:
+        print(f"❌ Error saving game rules: {e}")
\ No newline at end of file
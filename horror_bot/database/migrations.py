@@ -0,0 +1,128 @@
+"""
+HORROR BOT - SCHEMA MIGRATIONS
+Migration đánh số tăng dần, phiên bản đã chạy được lưu trong bảng schema_version.
+"""
+
+import aiosqlite
+
+# Mỗi migration: (version, tên, SQL). SQL = None nghĩa là chạy file schema.sql gốc.
+# KHÔNG sửa migration đã phát hành - luôn thêm migration mới ở cuối danh sách.
+MIGRATIONS = [
+    (1, "initial_schema", None),
+    (2, "hot_path_indexes", """
+        -- on_message: tìm player theo kênh private
+        CREATE INDEX IF NOT EXISTS idx_players_private_channel
+            ON players(private_channel_id);
+        -- get_players_at_location + mọi query WHERE game_id = ? trên players
+        CREATE INDEX IF NOT EXISTS idx_players_game_location
+            ON players(game_id, current_location_id);
+        -- get_game_rules
+        CREATE INDEX IF NOT EXISTS idx_game_rules_game_public
+            ON game_rules(game_id, is_public);
+        CREATE INDEX IF NOT EXISTS idx_game_maps_game
+            ON game_maps(game_id);
+        CREATE INDEX IF NOT EXISTS idx_game_context_game
+            ON game_context(game_id);
+        CREATE INDEX IF NOT EXISTS idx_player_encounters_game
+            ON player_encounters(game_id);
+    """),
+    (3, "player_messages", """
+        -- Lịch sử hội thoại LLM dạng append-only, thay cho JSON players.llm_conversation_history
+        CREATE TABLE IF NOT EXISTS player_messages (
+            game_id INTEGER,
+            user_id INTEGER,
+            seq INTEGER,                 -- Số thứ tự tăng dần theo từng player
+            role TEXT,
+            content TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (game_id, user_id, seq)
+        ) WITHOUT ROWID;
+
+        -- Chuyển lịch sử JSON cũ sang bảng mới
+        INSERT OR IGNORE INTO player_messages (game_id, user_id, seq, role, content)
+        SELECT p.game_id, p.user_id, CAST(j.key AS INTEGER) + 1,
+               json_extract(j.value, '$.role'), json_extract(j.value, '$.content')
+        FROM players p, json_each(p.llm_conversation_history) j
+        WHERE json_valid(p.llm_conversation_history);
+
+        UPDATE players SET llm_conversation_history = '[]';
+    """),
+]
+
+# Các query nóng phải dùng index (kiểm tra bằng EXPLAIN QUERY PLAN khi khởi động)
+HOT_QUERIES = [
+    ("get_player_ids_at_location",
+     "SELECT user_id, current_location_id, hp FROM players WHERE game_id = ?", (0,)),
+    ("get_game_rules", "SELECT * FROM game_rules WHERE game_id = ? AND is_public = ?", (0, 0)),
+    ("load_game_map", "SELECT map_data FROM game_maps WHERE game_id = ?", (0,)),
+    ("get_threat_level", "SELECT current_threat_level FROM game_context WHERE game_id = ?", (0,)),
+    ("get_llm_history",
+     """SELECT role, content FROM player_messages
+        WHERE game_id = ? AND user_id = ? ORDER BY seq DESC LIMIT ?""", (0, 0, 5)),
+    ("get_llm_history_window",
+     """SELECT role, content FROM player_messages
+        WHERE game_id = ? AND user_id = ?
+          AND seq > (SELECT MAX(0, (MAX(seq) - ?) / ? * ?) FROM player_messages
+                     WHERE game_id = ? AND user_id = ?)
+        ORDER BY seq""", (0, 0, 4, 6, 6, 0, 0)),
+]
+
+
+async def get_schema_version(db: aiosqlite.Connection) -> int:
+    async with db.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version") as cursor:
+        row = await cursor.fetchone()
+    return row[0]
+
+
+async def run_migrations(db: aiosqlite.Connection, schema_path: str) -> int:
+    """Chạy các migration chưa áp dụng theo thứ tự, mỗi migration trong một transaction.
+
+    Returns:
+        Phiên bản schema sau khi chạy xong.
+    """
+    await db.execute(
+        """CREATE TABLE IF NOT EXISTS schema_version (
+               version INTEGER PRIMARY KEY,
+               name TEXT,
+               applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+           )"""
+    )
+    await db.commit()
+
+    current = await get_schema_version(db)
+    for version, name, sql in MIGRATIONS:
+        if version <= current:
+            continue
+
+        if sql is None:
+            with open(schema_path, 'r', encoding='utf-8') as f:
+                sql = f.read()
+            if not sql.strip():
+                raise RuntimeError(f"File schema.sql bị rỗng: {schema_path}")
+
+        # executescript tự COMMIT trước khi chạy, nên BEGIN/COMMIT nằm trong script
+        await db.executescript(
+            f"BEGIN;\n{sql}\n"
+            f"INSERT INTO schema_version (version, name) VALUES ({int(version)}, '{name}');\n"
+            "COMMIT;"
+        )
+        print(f"   ✅ Migration {version:03d}_{name} đã áp dụng")
+        current = version
+
+    return current
+
+
+async def check_hot_query_plans(db: aiosqlite.Connection) -> list:
+    """Chạy EXPLAIN QUERY PLAN cho các query nóng.
+
+    Returns:
+        Danh sách (tên query, bước plan) còn full table scan - rỗng nếu tất cả dùng index.
+    """
+    full_scans = []
+    for name, query, params in HOT_QUERIES:
+        async with db.execute(f"EXPLAIN QUERY PLAN {query}", params) as cursor:
+            for row in await cursor.fetchall():
+                detail = row[-1]
+                if detail.startswith("SCAN "):
+                    full_scans.append((name, detail))
+    return full_scans
@@ -0,0 +1,90 @@
+"""
+HORROR BOT - ROOM OCCUPANCY INDEX
+Index trong bộ nhớ: (game_id, room_id) -> tập user_id còn sống trong phòng.
+Phát hiện encounter / broadcast theo phòng chỉ cần tra dict thay vì quét bảng `players`.
+Cập nhật sau mỗi lần COMMIT đổi vị trí hoặc HP; game nào index không chắc đúng
+(ví dụ player chưa từng được nạp) sẽ bị đánh dấu để nạp lại từ DB khi tra.
+"""
+
+
+class OccupancyIndex:
+    def __init__(self):
+        self._rooms = {}       # game_id -> {room_id: set(user_id)} (chỉ player còn sống)
+        self._players = {}     # game_id -> {user_id: (room_id, hp)}
+        self._complete_games = set()  # Game mà index đang giữ đủ mọi player
+        self.stats = {"lookups": 0, "reloads": 0, "moves": 0, "deaths": 0}
+
+    def is_complete(self, game_id) -> bool:
+        return game_id in self._complete_games
+
+    def occupants(self, game_id, room_id) -> set:
+        """Bản copy tập user_id còn sống trong phòng (caller đảm bảo game đã complete)."""
+        self.stats["lookups"] += 1
+        return set(self._rooms.get(game_id, {}).get(room_id, ()))
+
+    def _set(self, game_id, user_id: int, room_id, hp: int):
+        players = self._players.setdefault(game_id, {})
+        rooms = self._rooms.setdefault(game_id, {})
+        previous = players.get(user_id)
+        if previous is not None:
+            old_room, old_hp = previous
+            members = rooms.get(old_room)
+            if members is not None:
+                members.discard(user_id)
+                if not members:
+                    del rooms[old_room]
+            if old_room != room_id:
+                self.stats["moves"] += 1
+            if old_hp > 0 >= hp:
+                self.stats["deaths"] += 1
+        players[user_id] = (room_id, hp)
+        if hp > 0:
+            rooms.setdefault(room_id, set()).add(user_id)
+
+    def place(self, game_id, user_id: int, room_id, hp: int):
+        """Thêm/ghi đè vị trí + HP của một player (ví dụ player mới vào game)."""
+        self._set(game_id, user_id, room_id, hp)
+
+    def update(self, game_id, user_id: int, **fields):
+        """Áp dụng các cột vừa commit; chỉ quan tâm current_location_id và hp."""
+        if 'current_location_id' not in fields and 'hp' not in fields:
+            return
+        previous = self._players.get(game_id, {}).get(user_id)
+        if previous is None:
+            if 'current_location_id' in fields and 'hp' in fields:
+                self._set(game_id, user_id, fields['current_location_id'], fields['hp'])
+            else:
+                # Không biết phần còn lại của state -> nạp lại game khi cần
+                self._complete_games.discard(game_id)
+            return
+        self._set(game_id, user_id, fields.get('current_location_id', previous[0]), fields.get('hp', previous[1]))
+
+    def load_game(self, game_id, rows):
+        """Nạp lại index của một game từ các dòng (user_id, room_id, hp)."""
+        self.remove_game(game_id)
+        for user_id, room_id, hp in rows:
+            self._set(game_id, user_id, room_id, hp)
+        self._complete_games.add(game_id)
+        self.stats["reloads"] += 1
+
+    def replace_all(self, rows):
+        """Nạp lại toàn bộ index từ các dòng (game_id, user_id, room_id, hp)."""
+        self._rooms.clear()
+        self._players.clear()
+        self._complete_games.clear()
+        for game_id, user_id, room_id, hp in rows:
+            self._set(game_id, user_id, room_id, hp)
+            self._complete_games.add(game_id)
+
+    def remove_game(self, game_id):
+        self._rooms.pop(game_id, None)
+        self._players.pop(game_id, None)
+        self._complete_games.discard(game_id)
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "games": len(self._players),
+            "players": sum(len(players) for players in self._players.values()),
+            "occupied_rooms": sum(len(rooms) for rooms in self._rooms.values()),
+        }
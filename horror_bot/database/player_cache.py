@@ -0,0 +1,111 @@
+"""
+HORROR BOT - PLAYER STATE CACHE
+Cache write-through trong bộ nhớ cho state của player đang chơi.
+SQLite vẫn là nguồn dữ liệu gốc; cache chỉ giữ bản sao các dòng `players`.
+"""
+
+from collections import OrderedDict
+
+
+class PlayerCache:
+    """LRU cache các dòng `players`, key = (user_id, game_id).
+
+    - Đọc: trả về bản copy (caller sửa dict không làm hỏng cache).
+    - Ghi: db_manager gọi `update()` SAU khi COMMIT thành công (write-through).
+    - Mỗi game có một "generation": mọi lần ghi/invalidate tăng generation, nên một
+      lần load từ DB bắt đầu trước đó sẽ không ghi đè dữ liệu mới hơn vào cache.
+    """
+
+    def __init__(self, max_players: int):
+        self.max_players = max(1, max_players)
+        self._players = OrderedDict()
+        self._game_members = {}        # game_id -> set(user_id) đang có trong cache
+        self._complete_games = set()   # Game mà cache đang giữ đủ mọi player
+        self._generations = {}
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def generation(self, game_id) -> int:
+        return self._generations.get(game_id, 0)
+
+    def _bump(self, game_id):
+        self._generations[game_id] = self.generation(game_id) + 1
+
+    def _store(self, row: dict):
+        key = (row['user_id'], row['game_id'])
+        self._players[key] = dict(row)
+        self._players.move_to_end(key)
+        self._game_members.setdefault(row['game_id'], set()).add(row['user_id'])
+        while len(self._players) > self.max_players:
+            (evicted_user, evicted_game), _ = self._players.popitem(last=False)
+            self._forget_member(evicted_user, evicted_game)
+            self.stats["evictions"] += 1
+
+    def _forget_member(self, user_id: int, game_id):
+        self._complete_games.discard(game_id)
+        members = self._game_members.get(game_id)
+        if members is not None:
+            members.discard(user_id)
+            if not members:
+                del self._game_members[game_id]
+
+    # ----- Đọc -----
+
+    def get(self, user_id: int, game_id) -> dict | None:
+        key = (user_id, game_id)
+        row = self._players.get(key)
+        if row is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        self._players.move_to_end(key)
+        return dict(row)
+
+    def get_game(self, game_id) -> list | None:
+        if game_id not in self._complete_games:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return [dict(self._players[(user_id, game_id)]) for user_id in self._game_members.get(game_id, ())]
+
+    # ----- Nạp từ DB -----
+
+    def put(self, row: dict, generation: int):
+        """Lưu dòng vừa đọc từ DB (bỏ qua nếu game đã có lần ghi mới hơn)."""
+        if generation == self.generation(row['game_id']):
+            self._store(row)
+
+    def put_game(self, game_id, rows: list, generation: int):
+        if generation != self.generation(game_id) or len(rows) > self.max_players:
+            return
+        for row in rows:
+            self._store(row)
+        self._complete_games.add(game_id)
+
+    # ----- Write-through / invalidation -----
+
+    def update(self, user_id: int, game_id, **fields):
+        """Áp các field vừa COMMIT vào bản cache (nếu player đang được cache)."""
+        self._bump(game_id)
+        row = self._players.get((user_id, game_id))
+        if row is not None:
+            row.update(fields)
+
+    def invalidate(self, user_id: int, game_id):
+        self._bump(game_id)
+        self._players.pop((user_id, game_id), None)
+        self._forget_member(user_id, game_id)
+
+    def invalidate_game(self, game_id):
+        self._bump(game_id)
+        self._complete_games.discard(game_id)
+        for user_id in self._game_members.pop(game_id, set()):
+            self._players.pop((user_id, game_id), None)
+
+    def get_stats(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "size": len(self._players),
+            "max_size": self.max_players,
+            "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+        }
@@ -1,3 +1,6 @@
+-- Schema gốc = migration 001 (database/migrations.py).
+-- Mọi thay đổi schema/index mới phải thêm thành migration mới, không sửa file này.
+
 -- Bảng quản lý phiên chơi
 CREATE TABLE IF NOT EXISTS active_games (
     channel_id INTEGER PRIMARY KEY,
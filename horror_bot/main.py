@@ -4,9 +4,10 @@ import os
 import asyncio
 from discord.ext import commands, tasks
 from dotenv import load_dotenv
-from services.llm_service import load_llm
-from database.db_manager import setup_database
-from services.recovery_service import restore_from_backup, create_backup, cleanup_old_backups
+from services.llm_service import shutdown_llm
+from services import content_pool, startup, player_actors, event_bus
+from database.db_manager import close_pool, prune_llm_history
+from services.recovery_service import create_backup, cleanup_old_backups
 
 # Load environment variables
 load_dotenv()
@@ -17,6 +18,9 @@ intents = discord.Intents.default()
 intents.message_content = True
 bot = commands.Bot(command_prefix="!", intents=intents)
 
+# on_ready chạy lại mỗi lần reconnect gateway - phần khởi tạo chỉ làm một lần
+_ready_once = False
+
 @tasks.loop(minutes=10)
 async def auto_backup():
     """Auto-backup mỗi 10 phút."""
@@ -26,45 +30,45 @@ async def auto_backup():
     except Exception as e:
         print(f"⚠️ Error in auto_backup: {e}")
 
+@tasks.loop(minutes=30)
+async def prune_history():
+    """Dọn lịch sử hội thoại LLM cũ mỗi 30 phút."""
+    try:
+        await prune_llm_history()
+    except Exception as e:
+        print(f"⚠️ Error in prune_history: {e}")
+
 @bot.event
 async def on_ready():
-    """Event that runs when the bot is connected and ready."""
+    """Event that runs when the bot is connected and ready (again after every reconnect)."""
+    global _ready_once
+    if _ready_once:
+        print(f"🔁 Đã kết nối lại gateway: {bot.user}")
+        return
+    _ready_once = True
+    startup.mark("gateway_ready_at")
+
     print(f'✅ Đã đăng nhập dưới tên: {bot.user} (ID: {bot.user.id})')
     print('=' * 50)
     
-    # 0. Restore from backup if needed
-    print("\n🔄 Kiểm tra backup...")
-    await restore_from_backup()
-    
-    # 1. Setup Database
-    print("\n📦 Khởi tạo cơ sở dữ liệu...")
-    try:
-        await setup_database()
-        print("✅ Cơ sở dữ liệu sẵn sàng.")
-    except Exception as e:
-        print(f"❌ Lỗi cơ sở dữ liệu: {e}")
-    
-    # 2. Load LLM
-    print("\n🤖 Tải mô hình AI...")
-    if load_llm():
-        print("✅ LLM sẵn sàng cho mô tả game\n")
-    else:
-        print("⚠️  LLM không thể tải. Mô tả sẽ bị hạn chế.\n")
+    # Database đã sẵn sàng trước khi kết nối; model đang load ở nền (startup.load_model)
     
-    # 3. Auto-sync slash commands
-    print("🔄 Đồng bộ hóa slash commands...")
-    try:
-        synced = await bot.tree.sync()
-        print(f"✅ Đã sync {len(synced)} slash commands:")
-        for cmd in synced:
-            print(f"   - /{cmd.name}")
-    except Exception as e:
-        print(f"⚠️ Lỗi sync commands: {e}")
+    # Auto-sync slash commands
+    async with startup.phase("sync_commands"):
+        try:
+            synced = await bot.tree.sync()
+            print(f"✅ Đã sync {len(synced)} slash commands:")
+            for cmd in synced:
+                print(f"   - /{cmd.name}")
+        except Exception as e:
+            print(f"⚠️ Lỗi sync commands: {e}")
     
     # Start backup task
     if not auto_backup.is_running():
         auto_backup.start()
         print("\n🔄 Bắt đầu auto-backup (mỗi 10 phút)")
+    if not prune_history.is_running():
+        prune_history.start()
     
     print("\n" + "=" * 50)
     print("🚀 Bot sẵn sàng! Sử dụng /newgame, /join, /endgame")
@@ -93,7 +97,24 @@ async def main():
             print(f"❌ Lỗi tải plugin: {e}")
             return  # Exit if cogs fail to load
 
-        await bot.start(DISCORD_TOKEN)
+        # Storage phải sẵn sàng trước khi nhận event đầu tiên từ gateway
+        try:
+            await startup.prepare_storage()
+        except Exception as e:
+            print(f"❌ Lỗi cơ sở dữ liệu: {e}")
+
+        # Model load trong thread riêng, song song với kết nối gateway
+        model_task = asyncio.create_task(startup.load_model())
+        try:
+            await bot.start(DISCORD_TOKEN)
+        finally:
+            # Đóng sạch các kết nối SQLite trong pool và các LLM worker
+            model_task.cancel()
+            content_pool.stop()
+            player_actors.close()
+            event_bus.close()
+            await close_pool()
+            shutdown_llm()
 
 if __name__ == "__main__":
     try:
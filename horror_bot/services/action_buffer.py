@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+HORROR BOT - ACTION BUFFER
+Players often type one action across several quick messages. The buffer holds a player's
+messages until they have been quiet for ACTION_DEBOUNCE_SECONDS, then sends them to the
+engine as one action: one LLM call and one dashboard edit instead of one per message.
+"""
+
+import asyncio
+import os
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Khoảng im lặng chờ player gõ tiếp trước khi gửi hành động (0 = tắt, xử lý từng tin nhắn ngay)
+ACTION_DEBOUNCE_SECONDS = float(os.getenv("ACTION_DEBOUNCE_SECONDS", "1.5"))
+# Player gõ liên tục thì vẫn gửi sau tối đa chừng này giây kể từ tin nhắn đầu tiên
+ACTION_DEBOUNCE_MAX_SECONDS = float(os.getenv("ACTION_DEBOUNCE_MAX_SECONDS", "6"))
+
+stats = {"messages": 0, "actions": 0, "merged": 0}
+
+
+class ActionBuffer:
+    """Gom tin nhắn theo key (player); on_flush(key, messages) được gọi một lần cho mỗi cụm."""
+
+    def __init__(self, on_flush, quiet: float = ACTION_DEBOUNCE_SECONDS,
+                 max_wait: float = ACTION_DEBOUNCE_MAX_SECONDS):
+        self.on_flush = on_flush
+        self.quiet = quiet
+        self.max_wait = max_wait
+        self._pending = {}  # key -> {"messages": [...], "deadline": float, "task": Task}
+
+    async def add(self, key, message):
+        stats["messages"] += 1
+        if self.quiet <= 0:
+            stats["actions"] += 1
+            await self.on_flush(key, [message])
+            return
+
+        now = time.monotonic()
+        entry = self._pending.get(key)
+        if entry is None:
+            entry = {"messages": [], "first": now}
+            self._pending[key] = entry
+            entry["task"] = asyncio.create_task(self._wait(key, entry))
+        entry["messages"].append(message)
+        entry["deadline"] = min(now + self.quiet, entry["first"] + self.max_wait)
+
+    async def _wait(self, key, entry):
+        # Dời deadline thay vì hủy/tạo lại task cho mỗi tin nhắn mới
+        while (remaining := entry["deadline"] - time.monotonic()) > 0:
+            await asyncio.sleep(remaining)
+        del self._pending[key]
+        stats["actions"] += 1
+        stats["merged"] += len(entry["messages"]) - 1
+        try:
+            await self.on_flush(key, entry["messages"])
+        except Exception as e:
+            print(f"❌ [ACTION] Lỗi khi xử lý hành động đã gom của {key}: {e}")
+
+    def close(self):
+        for entry in self._pending.values():
+            entry["task"].cancel()
+        self._pending.clear()
+
+
+def merge_text(messages: list) -> str:
+    """Nối nội dung các tin nhắn thành một hành động."""
+    return "\n".join(m.content.strip() for m in messages if m.content.strip())
+
+
+def get_stats() -> dict:
+    return {
+        **stats,
+        "quiet_seconds": ACTION_DEBOUNCE_SECONDS,
+    }
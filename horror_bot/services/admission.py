@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+HORROR BOT - ADMISSION CONTROL
+Sits between on_message and the LLM. Each player gets a token bucket, and the number of
+actions in flight is capped per player, per game and for the whole bot. A player who spams
+messages is turned away right away instead of queueing inference jobs ahead of everyone else.
+"""
+
+import os
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Token bucket mỗi player: tối đa ADMISSION_BURST hành động liên tiếp, hồi ADMISSION_RATE_PER_MIN hành động/phút
+ADMISSION_RATE_PER_MIN = float(os.getenv("ADMISSION_RATE_PER_MIN", "6"))
+ADMISSION_BURST = float(os.getenv("ADMISSION_BURST", "2"))
+# Số hành động đang xử lý cùng lúc (0 = không giới hạn)
+# Hành động của một player chạy tuần tự trong actor riêng, nên 2 = một đang chạy + một chờ sẵn
+ADMISSION_MAX_INFLIGHT_PER_PLAYER = int(os.getenv("ADMISSION_MAX_INFLIGHT_PER_PLAYER", "2"))
+ADMISSION_MAX_INFLIGHT_PER_GAME = int(os.getenv("ADMISSION_MAX_INFLIGHT_PER_GAME", "3"))
+ADMISSION_MAX_INFLIGHT = int(os.getenv("ADMISSION_MAX_INFLIGHT", "8"))
+
+# Lý do từ chối -> câu trả lời cho player
+REJECT_MESSAGES = {
+    "player_busy": "🌑 Bóng tối vẫn đang trả lời hành động trước của bạn... Hãy đợi nó nói xong.",
+    "rate_limited": "🌑 Bóng tối vẫn đang trả lời... Bạn hành động quá dồn dập, hãy chậm lại một chút.",
+    "game_busy": "🌑 Bóng tối vẫn đang trả lời những người chơi khác trong game... Thử lại sau giây lát.",
+    "server_busy": "🌑 Bóng tối vẫn đang trả lời quá nhiều linh hồn cùng lúc... Thử lại sau giây lát.",
+}
+
+_buckets = {}  # player_id -> (tokens, last_refill)
+_inflight_players = {}  # player_id -> số hành động đang xử lý
+_inflight_games = {}  # game_id -> số hành động đang xử lý
+_inflight_total = 0
+_last_prune = time.monotonic()
+# Dọn bucket đã hồi đầy tối đa một lần mỗi khoảng này (không quét mọi bucket ở mỗi hành động)
+_PRUNE_INTERVAL_SECONDS = 60.0
+stats = {"accepted": 0, "rejected": {reason: 0 for reason in REJECT_MESSAGES}}
+
+
+def _refill(player_id: int, now: float) -> float:
+    tokens, last = _buckets.get(player_id, (ADMISSION_BURST, now))
+    return min(ADMISSION_BURST, tokens + (now - last) * ADMISSION_RATE_PER_MIN / 60)
+
+
+def _maybe_prune(now: float):
+    """Bucket đã hồi đầy thì không cần giữ lại; quét theo chu kỳ nên mỗi hành động chỉ tốn O(1)."""
+    global _last_prune
+    if now - _last_prune < _PRUNE_INTERVAL_SECONDS:
+        return
+    _last_prune = now
+    for pid in [pid for pid in _buckets if pid not in _inflight_players and _refill(pid, now) >= ADMISSION_BURST]:
+        del _buckets[pid]
+
+
+def _over(limit: int, current: int) -> bool:
+    return limit > 0 and current >= limit
+
+
+def try_acquire(player_id: int, game_id: int) -> str | None:
+    """
+    Xin phép xử lý một hành động.
+    Returns None nếu được nhận (phải gọi release() khi xong), hoặc lý do từ chối (key của REJECT_MESSAGES).
+    """
+    global _inflight_total
+    now = time.monotonic()
+    _maybe_prune(now)
+    tokens = _refill(player_id, now)
+
+    if _over(ADMISSION_MAX_INFLIGHT_PER_PLAYER, _inflight_players.get(player_id, 0)):
+        reason = "player_busy"
+    elif tokens < 1:
+        reason = "rate_limited"
+    elif _over(ADMISSION_MAX_INFLIGHT_PER_GAME, _inflight_games.get(game_id, 0)):
+        reason = "game_busy"
+    elif _over(ADMISSION_MAX_INFLIGHT, _inflight_total):
+        reason = "server_busy"
+    else:
+        reason = None
+
+    if reason is not None:
+        # Lần bị từ chối không tốn token
+        _buckets[player_id] = (tokens, now)
+        stats["rejected"][reason] += 1
+        return reason
+
+    _buckets[player_id] = (tokens - 1, now)
+    _inflight_players[player_id] = _inflight_players.get(player_id, 0) + 1
+    _inflight_games[game_id] = _inflight_games.get(game_id, 0) + 1
+    _inflight_total += 1
+    stats["accepted"] += 1
+    return None
+
+
+def _decrement(counts: dict, key: int):
+    remaining = counts.get(key, 0) - 1
+    if remaining > 0:
+        counts[key] = remaining
+    else:
+        counts.pop(key, None)
+
+
+def release(player_id: int, game_id: int):
+    """Trả lại slot sau khi hành động xử lý xong (kể cả khi lỗi)."""
+    global _inflight_total
+    _decrement(_inflight_players, player_id)
+    _decrement(_inflight_games, game_id)
+    _inflight_total = max(0, _inflight_total - 1)
+
+
+def get_stats() -> dict:
+    rejected = sum(stats["rejected"].values())
+    return {
+        "accepted": stats["accepted"],
+        "rejected": dict(stats["rejected"]),
+        "reject_rate": rejected / (stats["accepted"] + rejected) if stats["accepted"] + rejected else 0.0,
+        "inflight": _inflight_total,
+        "inflight_games": len(_inflight_games),
+        "buckets": len(_buckets),
+        "limits": {
+            "rate_per_min": ADMISSION_RATE_PER_MIN,
+            "burst": ADMISSION_BURST,
+            "per_player": ADMISSION_MAX_INFLIGHT_PER_PLAYER,
+            "per_game": ADMISSION_MAX_INFLIGHT_PER_GAME,
+            "total": ADMISSION_MAX_INFLIGHT,
+        },
+    }
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+HORROR BOT - CONTENT POOL
+Rule sets and world lore pre-generated per scenario while the LLM is idle, so /newgame
+serves them instantly instead of waiting on a 1500-token generation.
+"""
+
+import asyncio
+import json
+import os
+from dotenv import load_dotenv
+from services import llm_service
+from services.map_generator import SCENARIOS_DIR
+
+load_dotenv()
+
+POOL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "database", "content_pool")
+
+# Số bộ rules / lore dự trữ cho mỗi scenario
+CONTENT_POOL_TARGET = int(os.getenv("CONTENT_POOL_TARGET", "2"))
+# Chu kỳ kiểm tra kho khi LLM đang bận hoặc kho đã đầy (giây)
+CONTENT_POOL_CHECK_SECONDS = float(os.getenv("CONTENT_POOL_CHECK_SECONDS", "30"))
+
+KINDS = ("rules", "lore")
+
+_stock = {}  # scenario -> {"rules": [rules_dict], "lore": [str]}
+_refill_task = None
+stats = {"served_from_pool": 0, "live_fallbacks": 0, "generated": 0, "rejected": 0}
+
+
+def list_scenarios() -> list:
+    return sorted(name[:-5] for name in os.listdir(SCENARIOS_DIR) if name.endswith(".json"))
+
+
+def _pool_path(scenario: str) -> str:
+    return os.path.join(POOL_DIR, f"{scenario}.json")
+
+
+def _load():
+    """Nạp kho đã lưu trên đĩa (một file JSON mỗi scenario)."""
+    for scenario in list_scenarios():
+        entry = {kind: [] for kind in KINDS}
+        try:
+            with open(_pool_path(scenario), 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            for kind in KINDS:
+                entry[kind] = list(saved.get(kind, []))
+        except FileNotFoundError:
+            pass
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"⚠️ [POOL] Bỏ qua file kho hỏng của '{scenario}': {e}")
+        _stock[scenario] = entry
+
+
+def _save(scenario: str):
+    """Ghi kho của một scenario (ghi file tạm rồi rename để không bao giờ để lại file dở)."""
+    os.makedirs(POOL_DIR, exist_ok=True)
+    path = _pool_path(scenario)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(_stock[scenario], f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _take(scenario: str, kind: str):
+    items = _stock.get(scenario, {}).get(kind)
+    if not items:
+        return None
+    item = items.pop(0)
+    _save(scenario)
+    return item
+
+
+# ============================================================================
+# VALIDATION
+# ============================================================================
+
+def _valid_rules(rules_dict: dict) -> bool:
+    for key in ("public_rules", "hidden_rules"):
+        rules = rules_dict.get(key)
+        if not isinstance(rules, list) or not rules:
+            return False
+        if not all(isinstance(rule, dict) and str(rule.get("rule", "")).strip() for rule in rules):
+            return False
+    return True
+
+
+def _valid_lore(scenario: str, lore: str) -> bool:
+    # generate_world_lore trả về lore trong file khi LLM lỗi/từ chối - cái đó không cần dự trữ
+    return bool(lore) and lore != llm_service.get_fallback_lore(scenario)
+
+
+# ============================================================================
+# SERVING
+# ============================================================================
+
+async def get_rules(scenario: str, game_id: int = None) -> dict:
+    """Rule set for a new game: from the pool if stocked, otherwise generated live."""
+    rules_dict = _take(scenario, "rules")
+    if rules_dict is not None:
+        stats["served_from_pool"] += 1
+        print(f"      ⚡ [POOL] Rules cho '{scenario}' lấy từ kho (còn {len(_stock[scenario]['rules'])})")
+        return rules_dict
+    stats["live_fallbacks"] += 1
+    return await llm_service.generate_dark_rules(scenario, game_id=game_id)
+
+
+async def get_lore(scenario: str) -> str:
+    """World lore for a new game: from the pool if stocked, otherwise generated live."""
+    lore = _take(scenario, "lore")
+    if lore is not None:
+        stats["served_from_pool"] += 1
+        return lore
+    stats["live_fallbacks"] += 1
+    return await llm_service.generate_world_lore(scenario)
+
+
+# ============================================================================
+# BACKGROUND REFILL
+# ============================================================================
+
+def _next_deficit():
+    """(scenario, kind) có ít hàng dự trữ nhất dưới mức target, hoặc None nếu kho đầy."""
+    lowest = None
+    for scenario, entry in _stock.items():
+        for kind in KINDS:
+            count = len(entry[kind])
+            if count < CONTENT_POOL_TARGET and (lowest is None or count < lowest[0]):
+                lowest = (count, scenario, kind)
+    return lowest[1:] if lowest else None
+
+
+async def _generate_one(scenario: str, kind: str):
+    if kind == "rules":
+        item = await llm_service.generate_dark_rules(scenario)
+        valid = _valid_rules(item)
+    else:
+        item = await llm_service.generate_world_lore(scenario)
+        valid = _valid_lore(scenario, item)
+
+    if not valid:
+        stats["rejected"] += 1
+        print(f"⚠️ [POOL] {kind} sinh cho '{scenario}' không hợp lệ, bỏ qua")
+        return
+    _stock[scenario][kind].append(item)
+    _save(scenario)
+    stats["generated"] += 1
+    print(f"📦 [POOL] +1 {kind} cho '{scenario}' ({len(_stock[scenario][kind])}/{CONTENT_POOL_TARGET})")
+
+
+async def _refill_loop():
+    while True:
+        try:
+            deficit = _next_deficit()
+            # Chỉ sinh khi LLM rảnh: người chơi luôn được ưu tiên
+            if deficit is not None and llm_service.is_loaded() and llm_service.is_idle():
+                await _generate_one(*deficit)
+                continue
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️ [POOL] Lỗi khi bổ sung kho: {e}")
+        await asyncio.sleep(CONTENT_POOL_CHECK_SECONDS)
+
+
+def start():
+    """Load the stored pool and start refilling it in the background (idempotent)."""
+    global _refill_task
+    if _refill_task is not None and not _refill_task.done():
+        return
+    _load()
+    if CONTENT_POOL_TARGET > 0:
+        _refill_task = asyncio.create_task(_refill_loop())
+
+
+def stop():
+    global _refill_task
+    if _refill_task is not None:
+        _refill_task.cancel()
+        _refill_task = None
+
+
+def get_stats() -> dict:
+    return {
+        **stats,
+        "target": CONTENT_POOL_TARGET,
+        "rules": sum(len(entry["rules"]) for entry in _stock.values()),
+        "lore": sum(len(entry["lore"]) for entry in _stock.values()),
+        "scenarios": len(_stock),
+    }
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+HORROR BOT - GAME DASHBOARD
+One renderer per game keeps the dashboard Message handle in memory, so updates skip the
+fetch_message round trip. Bursts of update requests are merged into at most one edit per
+DASHBOARD_EDIT_INTERVAL, and an edit is skipped when the rendered embed has not changed.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+import discord
+from dotenv import load_dotenv
+from database import db_manager
+
+load_dotenv()
+
+# Khoảng cách tối thiểu giữa hai lần edit dashboard của cùng một game (giây)
+DASHBOARD_EDIT_INTERVAL = float(os.getenv("DASHBOARD_EDIT_INTERVAL", "3"))
+
+stats = {"requests": 0, "renders": 0, "edits": 0, "sends": 0, "unchanged": 0, "dropped": 0}
+
+
+def create_progress_bar(current: int, max_val: int, width: int = 10) -> str:
+    """Create text-based progress bar [████░░░░░]"""
+    if max_val == 0:
+        return "░" * width
+    filled = int((current / max_val) * width)
+    return "█" * filled + "░" * (width - filled)
+
+
+def build_embed(players: list) -> discord.Embed:
+    """Dashboard embed with all player stats (players sorted by name)."""
+    embed = discord.Embed(
+        title="📊 Game Dashboard",
+        color=discord.Color.dark_gray()
+    )
+
+    for player in sorted(players, key=lambda p: p['background_name'] or ""):
+        hp_bar = create_progress_bar(player['hp'], 100)
+        sanity_bar = create_progress_bar(player['sanity'], 100)
+        location = player['location_name'] or "Unknown"
+        status = "🟢 Alive" if player['hp'] > 0 else "💀 Dead"
+
+        player_info = (
+            f"**HP:** {hp_bar} {player['hp']}/100\n"
+            f"**Sanity:** {sanity_bar} {player['sanity']}/100\n"
+            f"**Location:** {location}\n"
+            f"**Status:** {status}"
+        )
+
+        embed.add_field(
+            name=player['background_name'],
+            value=player_info,
+            inline=True
+        )
+    return embed
+
+
+class DashboardRenderer:
+    """Dashboard của một game: giữ handle Message, gộp các yêu cầu cập nhật liên tiếp."""
+
+    def __init__(self, game_id: int, bot: discord.Client):
+        self.game_id = game_id
+        self.bot = bot
+        self.message = None  # discord.Message / PartialMessage đang hiển thị
+        self.last_hash = None
+        self.last_edit = 0.0
+        self.dirty = False
+        self._task = None
+
+    def request(self):
+        """Đánh dấu cần vẽ lại; lần vẽ kế tiếp sẽ thấy mọi thay đổi tới thời điểm đó."""
+        stats["requests"] += 1
+        self.dirty = True
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while self.dirty:
+            wait = self.last_edit + DASHBOARD_EDIT_INTERVAL - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self.dirty = False
+            try:
+                await self.render()
+            except Exception as e:
+                print(f"❌ Error updating dashboard: {e}")
+            self.last_edit = time.monotonic()
+
+    async def render(self):
+        """Update real-time dashboard with all player stats (edit the same message, not spam new ones)."""
+        stats["renders"] += 1
+        game = await db_manager.get_game_by_id(self.game_id)
+        if not game:
+            # Game đã kết thúc (ví dụ ActionResolved tới sau cleanup_game) - bỏ renderer này
+            self.dirty = False
+            _forget(self.game_id, self)
+            return
+
+        embed = build_embed(await db_manager.get_game_players(self.game_id))
+        rendered_hash = hashlib.sha1(json.dumps(embed.to_dict(), sort_keys=True).encode()).hexdigest()
+        if rendered_hash == self.last_hash:
+            stats["unchanged"] += 1
+            return
+
+        dashboard_channel = self.bot.get_channel(int(game['dashboard_channel_id']))
+        if not dashboard_channel:
+            return
+
+        if self.message is None and game['dashboard_message_id']:
+            # Handle không cần gọi API - edit thẳng theo ID đã lưu
+            self.message = dashboard_channel.get_partial_message(int(game['dashboard_message_id']))
+
+        if self.message is not None:
+            try:
+                self.message = await self.message.edit(embed=embed)
+                stats["edits"] += 1
+                self.last_hash = rendered_hash
+                return
+            except discord.NotFound:
+                # Message deleted, create new one
+                self.message = None
+
+        self.message = await dashboard_channel.send(embed=embed)
+        stats["sends"] += 1
+        self.last_hash = rendered_hash
+        await db_manager.execute_query(
+            "UPDATE active_games SET dashboard_message_id = ? WHERE channel_id = ?",
+            (str(self.message.id), self.game_id),
+            commit=True
+        )
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+
+
+_renderers = {}  # game_id -> DashboardRenderer
+# Game đã cleanup gần đây: event tới muộn không được tạo lại renderer cho chúng
+_ended_games = OrderedDict()
+_ENDED_GAMES_LIMIT = 256
+
+
+def request_update(game_id: int, bot: discord.Client):
+    """Yêu cầu cập nhật dashboard của game (không chờ; các yêu cầu dồn dập được gộp lại)."""
+    game_id = int(game_id)
+    if game_id in _ended_games:
+        stats["dropped"] += 1
+        return
+    renderer = _renderers.get(game_id)
+    if renderer is None:
+        renderer = _renderers[game_id] = DashboardRenderer(game_id, bot)
+    renderer.request()
+
+
+def _forget(game_id: int, renderer: DashboardRenderer):
+    """Bỏ renderer khỏi bảng (chỉ khi nó vẫn là renderer hiện tại của game)."""
+    if _renderers.get(game_id) is renderer:
+        del _renderers[game_id]
+
+
+def evict(game_id: int):
+    game_id = int(game_id)
+    _ended_games[game_id] = True
+    _ended_games.move_to_end(game_id)
+    while len(_ended_games) > _ENDED_GAMES_LIMIT:
+        _ended_games.popitem(last=False)
+    renderer = _renderers.pop(game_id, None)
+    if renderer is not None:
+        renderer.close()
+
+
+db_manager.register_cleanup_hook(evict)
+
+
+def get_stats() -> dict:
+    return {
+        **stats,
+        "coalesced": stats["requests"] - stats["renders"],
+        "games": len(_renderers),
+        "interval": DASHBOARD_EDIT_INTERVAL,
+    }
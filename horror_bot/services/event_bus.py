@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+HORROR BOT - EVENT BUS
+The engine publishes an event once an action's state is committed and goes straight on to
+answer the player. Side effects (dashboard, encounters, game-over checks, leaderboard)
+subscribe to the event and run afterwards in their own workers, each with a concurrency limit.
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Số worker tối đa cho mỗi subscriber chạy song song được (encounter, leaderboard)
+EVENT_BUS_CONCURRENCY = int(os.getenv("EVENT_BUS_CONCURRENCY", "2"))
+
+
+class ActionResolved:
+    """Một hành động đã được commit vào DB và đã trả lời cho player."""
+    __slots__ = ("game_id", "player_id", "player_name", "action_text", "location_id",
+                 "hp", "sanity", "private_channel_id", "scenario_type", "bot")
+
+    def __init__(self, game_id, player_id, player_name, action_text, location_id,
+                 hp, sanity, private_channel_id, scenario_type, bot):
+        self.game_id = game_id
+        self.player_id = player_id
+        self.player_name = player_name
+        self.action_text = action_text
+        self.location_id = location_id
+        self.hp = hp
+        self.sanity = sanity
+        self.private_channel_id = private_channel_id
+        self.scenario_type = scenario_type
+        self.bot = bot
+
+
+class GameCompleted:
+    """Game đã kết thúc (ví dụ tất cả player chết) - cần tạo leaderboard và dọn kênh."""
+    __slots__ = ("game_id", "game", "reason", "guild", "bot")
+
+    def __init__(self, game_id, game, reason, guild, bot):
+        self.game_id = game_id
+        self.game = game
+        self.reason = reason
+        self.guild = guild
+        self.bot = bot
+
+
+class _Subscriber:
+    __slots__ = ("name", "handler", "concurrency", "queue", "workers", "running",
+                 "handled", "failed", "lag_ms")
+
+    def __init__(self, name, handler, concurrency):
+        self.name = name
+        self.handler = handler
+        self.concurrency = max(1, concurrency)
+        self.queue = asyncio.Queue()
+        self.workers = []
+        self.running = 0
+        self.handled = 0
+        self.failed = 0
+        self.lag_ms = deque(maxlen=500)  # publish -> subscriber bắt đầu xử lý
+
+
+_subscribers = {}  # event class -> [_Subscriber]
+
+
+def subscribe(event_type, handler, name: str = None, concurrency: int = 1):
+    """Đăng ký handler(event) (async) cho một loại event, xử lý tối đa `concurrency` event cùng lúc."""
+    subscriber = _Subscriber(name or handler.__name__, handler, concurrency)
+    _subscribers.setdefault(event_type, []).append(subscriber)
+
+
+async def _worker(subscriber: _Subscriber):
+    while True:
+        event, published_at = await subscriber.queue.get()
+        subscriber.lag_ms.append((time.perf_counter() - published_at) * 1000)
+        subscriber.running += 1
+        try:
+            await subscriber.handler(event)
+            subscriber.handled += 1
+        except Exception as e:
+            subscriber.failed += 1
+            print(f"⚠️ [EVENT] {subscriber.name} lỗi khi xử lý {type(event).__name__}: {type(e).__name__}: {e}")
+        finally:
+            subscriber.running -= 1
+
+
+def publish(event):
+    """Giao event cho mọi subscriber rồi trả về ngay (không chờ subscriber xử lý)."""
+    published_at = time.perf_counter()
+    for subscriber in _subscribers.get(type(event), ()):
+        # Worker chỉ tạo khi cần (lúc import chưa có event loop)
+        subscriber.workers = [task for task in subscriber.workers if not task.done()]
+        while len(subscriber.workers) < subscriber.concurrency:
+            subscriber.workers.append(asyncio.create_task(_worker(subscriber)))
+        subscriber.queue.put_nowait((event, published_at))
+
+
+def close():
+    for subscribers in _subscribers.values():
+        for subscriber in subscribers:
+            for task in subscriber.workers:
+                task.cancel()
+            subscriber.workers = []
+
+
+def get_stats() -> dict:
+    stats = {}
+    for subscribers in _subscribers.values():
+        for subscriber in subscribers:
+            lag = sorted(subscriber.lag_ms)
+            stats[subscriber.name] = {
+                "queued": subscriber.queue.qsize(),
+                "running": subscriber.running,
+                "concurrency": subscriber.concurrency,
+                "handled": subscriber.handled,
+                "failed": subscriber.failed,
+                "lag_p95": lag[min(len(lag) - 1, int(len(lag) * 0.95))] if lag else 0.0,
+            }
+    return stats
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+HORROR BOT - GAME CONTENT CACHE
+Per-game immutable content (hidden rules, map, scenario config), loaded once per game
+"""
+
+import asyncio
+import json
+from database import db_manager
+from services import llm_service
+from services.map_generator import scenario_path
+from services.map_graph import MapGraph
+
+
+class GameContent:
+    """Content that never changes after game creation."""
+
+    def __init__(self, game_id: int, scenario_type: str, hidden_rules: list, map_graph: MapGraph, scenario_config: dict):
+        self.game_id = game_id
+        self.scenario_type = scenario_type
+        self.hidden_rules = hidden_rules
+        # Pre-formatted prompt fragment for check_rule_violation
+        self.hidden_rules_text = llm_service.format_hidden_rules(hidden_rules)
+        # Compiled once per game: O(1) move validation and distance hints
+        self.map_graph = map_graph
+        self.scenario_config = scenario_config
+
+
+_contents = {}  # game_id -> GameContent
+_loading = {}   # game_id -> asyncio.Task (dedupe concurrent loads)
+_scenario_configs = {}
+
+
+def load_scenario_config(scenario_type: str) -> dict:
+    """Read data/scenarios/<scenario>.json once per process."""
+    if scenario_type not in _scenario_configs:
+        try:
+            with open(scenario_path(scenario_type), 'r', encoding='utf-8') as f:
+                _scenario_configs[scenario_type] = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError) as e:
+            print(f"⚠️ Could not load scenario config '{scenario_type}': {e}")
+            return {}
+    return _scenario_configs[scenario_type]
+
+
+async def _load(game_id: int) -> GameContent | None:
+    game = await db_manager.execute_query(
+        "SELECT scenario_type FROM active_games WHERE channel_id = ?",
+        (game_id,),
+        fetchone=True
+    )
+    if not game:
+        return None
+
+    hidden_rules = await db_manager.get_game_rules(game_id, is_public=False)
+    map_row = await db_manager.execute_query(
+        "SELECT map_data FROM game_maps WHERE game_id = ?",
+        (game_id,),
+        fetchone=True
+    )
+    # Seeded (v3, regenerated here), compact (v2) or legacy (v1) map_data - see map_generator.MAP_FORMAT_VERSION
+    map_graph = MapGraph.decode(map_row['map_data'] if map_row else None)
+
+    return GameContent(
+        game_id=game_id,
+        scenario_type=game['scenario_type'],
+        hidden_rules=hidden_rules,
+        map_graph=map_graph,
+        scenario_config=load_scenario_config(game['scenario_type'])
+    )
+
+
+async def get_game_content(game_id: int) -> GameContent | None:
+    """Get the cached content of a game, loading it from the DB on first use."""
+    game_id = int(game_id)
+    content = _contents.get(game_id)
+    if content is not None:
+        return content
+
+    task = _loading.get(game_id)
+    if task is None:
+        task = asyncio.ensure_future(_load(game_id))
+        _loading[game_id] = task
+        task.add_done_callback(lambda t: _finish_load(game_id, t))
+    return await asyncio.shield(task)
+
+
+def _finish_load(game_id: int, task: asyncio.Task):
+    if _loading.get(game_id) is not task:
+        return  # Evicted while loading - don't cache stale content
+    del _loading[game_id]
+    if not task.cancelled() and task.exception() is None and task.result() is not None:
+        _contents[game_id] = task.result()
+
+
+def evict(game_id: int):
+    """Drop the cached content of a game (game ended or its rules were just saved)."""
+    game_id = int(game_id)
+    _contents.pop(game_id, None)
+    _loading.pop(game_id, None)
+
+
+# Content lives exactly as long as the game's rows in the DB
+db_manager.register_cleanup_hook(evict)
@@ -6,17 +6,40 @@ Per-user action pipeline with automatic encounter detection and real-time dashbo
 
 import asyncio
 import json
+import os
+import time
+from collections import deque
 import discord
+from dotenv import load_dotenv
 from database import db_manager
-from services import llm_service, leaderboard_service
+from services import llm_service, leaderboard_service, game_content, player_actors, event_bus, dashboard
+from services.narration_stream import NarrationStream
 
+load_dotenv()
 
-def create_progress_bar(current: int, max_val: int, width: int = 10) -> str:
-    """Create text-based progress bar [████░░░░░]"""
-    if max_val == 0:
-        return "░" * width
-    filled = int((current / max_val) * width)
-    return "█" * filled + "░" * (width - filled)
+# "combined": one LLM call resolves the action AND judges the hidden rules (resolve_action)
+# "separate": process_player_action, then check_rule_violation (two sequential calls)
+ACTION_RESOLUTION_MODE = os.getenv("ACTION_RESOLUTION_MODE", "combined")
+
+_first_response_ms = deque(maxlen=500)
+move_stats = {"moves": 0, "invalid_moves": 0}
+
+# DM instructions are identical for every turn so they form the cached KV prefix;
+# per-turn state goes into player_context right before the action
+DM_SYSTEM_PROMPT = """You are a horror game Dungeon Master.
+
+Respond to the player's action with a JSON object:
+{
+    "description": "What happened (1-2 sentences)",
+    "success": bool,
+    "hp_change": int (negative for damage),
+    "sanity_change": int (negative for fear),
+    "new_location_id": "same, or one direction listed in Exits (e.g. north)",
+    "discovered_items": ["item1", "item2"]
+}
+
+Be concise. Horror tone. Vietnamese.
+"""
 
 
 async def process_free_text_action(
@@ -25,6 +48,23 @@ async def process_free_text_action(
     action_text: str,
     channel: discord.TextChannel,
     bot: discord.Client
+) -> None:
+    """
+    Queue a free-form action on the player's actor.
+    Actions of the same player run one at a time (no lost hp/sanity/history updates);
+    different players still run in parallel.
+    """
+    await player_actors.run(
+        (game_id, player_id), _resolve_free_text_action, player_id, game_id, action_text, channel, bot
+    )
+
+
+async def _resolve_free_text_action(
+    player_id: int,
+    game_id: str,
+    action_text: str,
+    channel: discord.TextChannel,
+    bot: discord.Client
 ) -> None:
     """
     Main 6-step pipeline for free-form player action processing.
@@ -32,175 +72,177 @@ async def process_free_text_action(
     Steps:
     1. Gather player context (location, inventory, stats, history)
     2. Call LLM with per-player DM system prompt
-    3. Parse LLM JSON response, update DB atomically
-    4. Check for encounters (get_players_at_location)
-    5. Update real-time dashboard
+    3. Parse LLM JSON response, check hidden rules
+       (ACTION_RESOLUTION_MODE=combined does 2-3 in a single LLM call)
+    4. Resolve the new location
+    5. Commit stats, history and location in one transaction
     6. Send response to player's private channel
+    7. Publish ActionResolved: dashboard, encounters and the game-over check
+       run afterwards in event_bus subscribers
     """
+    started_at = time.perf_counter()
+    narration = None
     try:
         # ======================================================================
         # STEP 1: GATHER CONTEXT
         # ======================================================================
-        player = await db_manager.execute_query(
-            """SELECT user_id, hp, sanity, agi, acc, background_name,
-               current_location_id, location_name, inventory,
-               llm_conversation_history, private_channel_id
-               FROM players WHERE user_id = ? AND game_id = ?""",
-            (player_id, game_id),
-            fetchone=True
-        )
+        player = await db_manager.get_player(player_id, game_id)
         
         if not player:
             return
         
-        location_name = player['location_name'] or "An Unknown Place"
+        content = await game_content.get_game_content(game_id)
+        map_graph = content.map_graph if content else None
+        location_id = player['current_location_id']
+        if map_graph is not None and location_id in map_graph:
+            location_name = map_graph.room_label(location_id)
+            map_hints = map_graph.describe_for_prompt(location_id) + "\n"
+        else:
+            location_name = player['location_name'] or "An Unknown Place"
+            map_hints = ""
         inventory = json.loads(player['inventory'] or '[]')
-        conversation_history = json.loads(player['llm_conversation_history'] or '[]')
+        # Window start moves in steps so consecutive prompts share their prefix
+        conversation_history = await db_manager.get_llm_history_window(player_id, game_id)
         
         # ======================================================================
         # STEP 2: CALL LLM WITH PER-PLAYER DM PROMPT
         # ======================================================================
-        system_prompt = f"""You are a horror game Dungeon Master.
-
-Current Location: {location_name}
-Player Stats: HP {player['hp']}/100, Sanity {player['sanity']}/100, AGI {player['agi']}, ACC {player['acc']}
+        player_context = f"""Current Location: {location_name}
+{map_hints}Player Stats: HP {player['hp']}/100, Sanity {player['sanity']}/100, AGI {player['agi']}, ACC {player['acc']}
 Inventory: {', '.join(inventory) if inventory else 'Empty'}
 
-Respond to the player's action with a JSON object:
-{{
-    "success": bool,
-    "description": "What happened (1-2 sentences)",
-    "hp_change": int (negative for damage),
-    "sanity_change": int (negative for fear),
-    "new_location_id": "same or new room ID",
-    "discovered_items": ["item1", "item2"]
-}}
-
-Be concise. Horror tone. Vietnamese.
 """
         
-        llm_response = await llm_service.process_player_action(
-            action_text=action_text,
-            system_prompt=system_prompt,
-            conversation_history=conversation_history
-        )
-        
-        # ======================================================================
-        # STEP 3: PARSE LLM RESPONSE
-        # ======================================================================
-        try:
-            action_result = json.loads(llm_response)
-        except json.JSONDecodeError:
-            action_result = {
-                "success": False,
-                "description": "Hệ thống AI gặp lỗi phân tích.",
-                "hp_change": 0,
-                "sanity_change": 0,
-                "new_location_id": "same",
-                "discovered_items": []
-            }
-        
-        # ======================================================================
-        # STEP 3.5: CHECK FOR HIDDEN RULE VIOLATIONS
-        # ======================================================================
-        violation_penalty = 0
-        violation_reason = None
-        hidden_rules = await db_manager.get_game_rules(game_id, is_public=False)
-        if hidden_rules:
-            violation_check = await llm_service.check_rule_violation(
-                hidden_rules=hidden_rules,
+        # Show the narration in the private channel while it is being generated
+        narration = NarrationStream(channel, started_at) if channel is not None else None
+        has_hidden_rules = bool(content and content.hidden_rules)
+        violation_check = {}
+
+        if ACTION_RESOLUTION_MODE == "combined" and has_hidden_rules:
+            # One call: outcome + rule verdict (STEP 3 / 3.5 come back together)
+            action_result = await llm_service.resolve_action(
+                action_text=action_text,
+                rules_text=content.hidden_rules_text,
+                conversation_history=conversation_history,
+                game_id=game_id,
+                player_context=player_context,
+                session_key=f"{game_id}:{player_id}",
+                on_token=narration.on_token if narration else None
+            )
+            violation_check = action_result
+        else:
+            llm_response = await llm_service.process_player_action(
                 action_text=action_text,
-                action_description=action_result.get('description', '')
+                system_prompt=DM_SYSTEM_PROMPT,
+                conversation_history=conversation_history,
+                game_id=game_id,
+                player_context=player_context,
+                session_key=f"{game_id}:{player_id}",
+                on_token=narration.on_token if narration else None
             )
-            if violation_check.get('violated'):
-                print(f"🚨 Player {player_id} violated rule: {violation_check.get('rule_violated')}")
-                violation_penalty = -15  # Penalty for breaking a hidden rule
-                violation_reason = violation_check.get('reason', 'Bạn cảm thấy một sự ớn lạnh chạy dọc sống lưng...')
+
+            # ==================================================================
+            # STEP 3: PARSE LLM RESPONSE
+            # ==================================================================
+            try:
+                action_result = json.loads(llm_response)
+            except json.JSONDecodeError:
+                action_result = {
+                    "success": False,
+                    "description": "Hệ thống AI gặp lỗi phân tích.",
+                    "hp_change": 0,
+                    "sanity_change": 0,
+                    "new_location_id": "same",
+                    "discovered_items": []
+                }
+
+            # ==================================================================
+            # STEP 3.5: CHECK FOR HIDDEN RULE VIOLATIONS
+            # ==================================================================
+            if has_hidden_rules:
+                violation_check = await llm_service.check_rule_violation(
+                    hidden_rules=content.hidden_rules,
+                    action_text=action_text,
+                    action_description=action_result.get('description', ''),
+                    rules_text=content.hidden_rules_text,
+                    game_id=game_id
+                )
+
+        violation_penalty = 0
+        violation_reason = None
+        if violation_check.get('violated'):
+            print(f"🚨 Player {player_id} violated rule: {violation_check.get('rule_violated')}")
+            violation_penalty = -15  # Penalty for breaking a hidden rule
+            violation_reason = violation_check.get('reason') or 'Bạn cảm thấy một sự ớn lạnh chạy dọc sống lưng...'
 
         # ======================================================================
-        # STEP 4: UPDATE DB ATOMICALLY
+        # STEP 4: RESOLVE LOCATION
         # ======================================================================
         # Combine penalties from action and violation
         total_hp_change = action_result.get('hp_change', 0)
         total_sanity_change = action_result.get('sanity_change', 0) + violation_penalty
-        
-        new_hp = max(0, min(100, player['hp'] + total_hp_change))
-        new_sanity = max(0, min(100, player['sanity'] + total_sanity_change))
-        
-        await db_manager.execute_query(
-            """UPDATE players SET hp = ?, sanity = ?, last_action_result = ?
-               WHERE user_id = ? AND game_id = ?""",
-            (
-                new_hp,
-                new_sanity,
-                json.dumps(action_result),
-                player_id,
-                game_id
-            ),
-            commit=True
-        )
-        
-        # Append to conversation history (rolling 10-message window)
-        await db_manager.append_to_llm_history(
-            user_id=player_id,
-            game_id=game_id,
-            role="user",
-            content=action_text
-        )
-        await db_manager.append_to_llm_history(
-            user_id=player_id,
-            game_id=game_id,
-            role="assistant",
-            content=action_result['description']
-        )
-        
+
+        # Only moves along an exit of the current room are accepted (O(1) adjacency check)
+        new_location_id = location_id
+        requested_move = str(action_result.get('new_location_id') or 'same').strip()
+        if requested_move.lower() not in ('same', '', location_id) and map_graph is not None:
+            destination = map_graph.resolve_move(location_id, requested_move)
+            if destination is None:
+                move_stats["invalid_moves"] += 1
+                print(f"🚧 Player {player_id}: bỏ qua di chuyển không hợp lệ '{requested_move}' từ {location_id}")
+            else:
+                move_stats["moves"] += 1
+                new_location_id = destination
+        location_fields = {}
+        if new_location_id != location_id:
+            location_fields = {"current_location_id": new_location_id, "location_name": map_graph.room_label(new_location_id)}
+
         # ======================================================================
-        # STEP 5: HANDLE LOCATION CHANGES AND ENCOUNTERS
+        # STEP 5: UPDATE DB ATOMICALLY (one transaction, one commit)
         # ======================================================================
-        new_location_id = action_result.get('new_location_id', 'same')
-        if new_location_id != 'same':
-            await db_manager.execute_query(
-                """UPDATE players SET current_location_id = ? WHERE user_id = ? AND game_id = ?""",
-                (new_location_id, player_id, game_id),
-                commit=True
+        async with db_manager.transaction() as tx:
+            # Re-read inside the transaction so deltas apply to the latest state
+            current = await tx.execute(
+                "SELECT hp, sanity FROM players WHERE user_id = ? AND game_id = ?",
+                (player_id, game_id),
+                fetchone=True
             )
-        else:
-            new_location_id = player['current_location_id']
-        
-        # Check for other players at same location
-        other_players = await db_manager.get_players_at_location(game_id, new_location_id)
-        other_players = [p for p in other_players if p['user_id'] != player_id and p['hp'] > 0]
-        
-        encounter_text = None
-        if other_players:
-            other_player_names = [p['background_name'] for p in other_players]
-            scenario_type = (await db_manager.execute_query(
-                "SELECT scenario_type FROM active_games WHERE channel_id = ?",
-                (game_id,), fetchone=True
-            ))['scenario_type']
-
-            encounter_text = await llm_service.generate_encounter(
-                action_description=action_text,
-                player_name=player['background_name'],
-                other_players=other_player_names,
-                scenario_type=scenario_type
+            if not current:
+                if narration is not None:
+                    await narration.abort()  # Player đã bị xóa - bỏ phần narration dở dang
+                return
+
+            new_hp = max(0, min(100, current['hp'] + total_hp_change))
+            new_sanity = max(0, min(100, current['sanity'] + total_sanity_change))
+
+            await db_manager.update_player_fields(
+                player_id,
+                game_id,
+                tx=tx,
+                hp=new_hp,
+                sanity=new_sanity,
+                last_action_result=json.dumps(action_result),
+                **location_fields
             )
-            
-            # Record encounter
-            await db_manager.record_encounter(
+
+            # Append to conversation history (old rows are pruned in the background)
+            await db_manager.append_to_llm_history(
+                user_id=player_id,
                 game_id=game_id,
-                location_id=new_location_id,
-                player_ids=[player_id] + [p['user_id'] for p in other_players],
-                encounter_text=encounter_text
+                role="user",
+                content=action_text,
+                tx=tx
             )
-        
-        # ======================================================================
-        # STEP 6: UPDATE REAL-TIME DASHBOARD
-        # ======================================================================
-        await update_game_dashboard(game_id, bot)
-        
+            await db_manager.append_to_llm_history(
+                user_id=player_id,
+                game_id=game_id,
+                role="assistant",
+                content=action_result['description'],
+                tx=tx
+            )
+
         # ======================================================================
-        # STEP 7: SEND RESPONSE TO PLAYER'S PRIVATE CHANNEL
+        # STEP 6: SEND RESPONSE TO PLAYER'S PRIVATE CHANNEL (right after commit)
         # ======================================================================
         private_channel_id = player['private_channel_id']
         if private_channel_id:
@@ -233,121 +275,145 @@ Be concise. Horror tone. Vietnamese.
                         inline=False
                     )
                 
-                await private_channel.send(embed=embed)
-                
-                # Send encounter message if applicable
-                if encounter_text:
-                    encounter_embed = discord.Embed(
-                        title="👥 Gặp gỡ!",
-                        description=encounter_text,
-                        color=discord.Color.gold()
-                    )
-                    await private_channel.send(embed=encounter_embed)
+                if narration is not None:
+                    await narration.finish(embed)
+                else:
+                    await private_channel.send(embed=embed)
+                _first_response_ms.append((time.perf_counter() - started_at) * 1000)
+
+        # ======================================================================
+        # STEP 7: PUBLISH ActionResolved
+        # Dashboard, encounters and the game-over check run in event subscribers
+        # ======================================================================
+        event_bus.publish(event_bus.ActionResolved(
+            game_id=game_id,
+            player_id=player_id,
+            player_name=player['background_name'],
+            action_text=action_text,
+            location_id=new_location_id,
+            hp=new_hp,
+            sanity=new_sanity,
+            private_channel_id=private_channel_id,
+            scenario_type=content.scenario_type if content else "unknown",
+            bot=bot
+        ))
     
+    except llm_service.InferenceCancelled:
+        # Game ended while the action was queued for the LLM - nothing left to update
+        print(f"🧹 Dropped action of player {player_id}: game {game_id} has ended")
+        if narration is not None:
+            await narration.abort()
     except Exception as e:
         print(f"❌ Error processing action: {type(e).__name__}: {e}")
         import traceback
         traceback.print_exc()
-    
-    # ======================================================================
-    # STEP 8: CHECK FOR GAME COMPLETION (Auto-create leaderboard)
-    # ======================================================================
+        if narration is not None:
+            # Không để lại đoạn narration dở dang như thể hành động đã được xử lý
+            await narration.abort(discord.Embed(
+                title="⚠️ Hành động thất bại",
+                description="Bóng tối nuốt chửng hành động của bạn... Hãy thử lại.",
+                color=discord.Color.dark_grey()
+            ))
+
+
+# ============================================================================
+# ActionResolved SUBSCRIBERS
+# ============================================================================
+
+async def _refresh_dashboard(event: event_bus.ActionResolved) -> None:
+    # Renderer gộp các yêu cầu dồn dập thành tối đa một lần edit mỗi DASHBOARD_EDIT_INTERVAL
+    dashboard.request_update(event.game_id, event.bot)
+
+
+async def _resolve_encounter(event: event_bus.ActionResolved) -> None:
+    """Player moved next to other living players: narrate the encounter and record it."""
+    # Occupancy index: tra O(1), chỉ đọc chi tiết player khi thật sự có người cùng phòng
+    other_ids = await db_manager.get_player_ids_at_location(event.game_id, event.location_id)
+    other_ids.discard(event.player_id)
+    if not other_ids:
+        return
+    other_players = [await db_manager.get_player(user_id, event.game_id) for user_id in other_ids]
+    other_players = [p for p in other_players if p]
+
     try:
-        game_guild = None
-        game_info = await db_manager.execute_query(
-            "SELECT * FROM active_games WHERE channel_id = ?",
-            (game_id,),
-            fetchone=True
+        encounter_text = await llm_service.generate_encounter(
+            action_description=event.action_text,
+            player_name=event.player_name,
+            other_players=[p['background_name'] for p in other_players],
+            scenario_type=event.scenario_type,
+            game_id=event.game_id
         )
-        
-        if game_info:
-            # Get guild from lobby channel
-            try:
-                lobby_ch = bot.get_channel(int(game_info['lobby_channel_id']))
-                if lobby_ch:
-                    game_guild = lobby_ch.guild
-            except:
-                pass
-        
-        if game_guild:
-            completion = await leaderboard_service.check_game_completion(
-                game_id, bot, game_guild
-            )
-            if completion:
-                print(f"[AUTO] Leaderboard created for game {game_id}")
-    except Exception as e:
-        print(f"⚠️ Error checking game completion: {e}")
+    except llm_service.InferenceCancelled:
+        return
 
+    await db_manager.record_encounter(
+        game_id=event.game_id,
+        location_id=event.location_id,
+        player_ids=[event.player_id] + [p['user_id'] for p in other_players],
+        encounter_text=encounter_text
+    )
 
-async def update_game_dashboard(game_id: str, bot: discord.Client) -> None:
-    """
-    Update real-time dashboard with all player stats.
-    Edits existing message (not spam new messages).
-    """
-    try:
-        game = await db_manager.get_game_by_id(game_id)
-        if not game:
-            return
-        
-        dashboard_channel = bot.get_channel(int(game['dashboard_channel_id']))
-        if not dashboard_channel:
-            return
-        
-        # Build player stats
-        players = await db_manager.execute_query(
-            """SELECT user_id, background_name, hp, sanity, location_name
-               FROM players WHERE game_id = ? ORDER BY background_name""",
-            (game_id,),
-            fetchall=True
+    private_channel = event.bot.get_channel(int(event.private_channel_id)) if event.private_channel_id else None
+    if private_channel:
+        encounter_embed = discord.Embed(
+            title="👥 Gặp gỡ!",
+            description=encounter_text,
+            color=discord.Color.gold()
         )
-        
-        # Create embed
-        embed = discord.Embed(
-            title="📊 Game Dashboard",
-            color=discord.Color.dark_gray()
+        await private_channel.send(embed=encounter_embed)
+
+
+_completing_games = set()  # game đã phát GameCompleted, đang tạo leaderboard
+
+
+async def _check_completion(event: event_bus.ActionResolved) -> None:
+    """Game can only end (all players dead) when an action took someone to 0 HP."""
+    if event.hp > 0 or event.game_id in _completing_games:
+        return
+
+    completion = await leaderboard_service.find_completion(event.game_id)
+    if not completion:
+        return
+    game, reason = completion
+
+    # Get guild from lobby channel
+    lobby_ch = event.bot.get_channel(int(game['lobby_channel_id'])) if game['lobby_channel_id'] else None
+    if lobby_ch is None:
+        return
+
+    _completing_games.add(event.game_id)
+    event_bus.publish(event_bus.GameCompleted(
+        game_id=event.game_id, game=game, reason=reason, guild=lobby_ch.guild, bot=event.bot
+    ))
+
+
+async def _create_leaderboard(event: event_bus.GameCompleted) -> None:
+    try:
+        await leaderboard_service.create_leaderboard_and_cleanup(
+            event.game_id, event.game['game_code'], event.game['scenario_type'],
+            event.game['lobby_channel_id'], event.bot, event.guild, event.reason
         )
-        
-        for player in players:
-            hp_bar = create_progress_bar(player['hp'], 100)
-            sanity_bar = create_progress_bar(player['sanity'], 100)
-            location = player['location_name'] or "Unknown"
-            status = "🟢 Alive" if player['hp'] > 0 else "💀 Dead"
-            
-            player_info = (
-                f"**HP:** {hp_bar} {player['hp']}/100\n"
-                f"**Sanity:** {sanity_bar} {player['sanity']}/100\n"
-                f"**Location:** {location}\n"
-                f"**Status:** {status}"
-            )
-            
-            embed.add_field(
-                name=player['background_name'],
-                value=player_info,
-                inline=True
-            )
-        
-        # Edit or create message
-        dashboard_message_id = game['dashboard_message_id']
-        if dashboard_message_id:
-            try:
-                message = await dashboard_channel.fetch_message(int(dashboard_message_id))
-                await message.edit(embed=embed)
-            except discord.NotFound:
-                # Message deleted, create new one
-                message = await dashboard_channel.send(embed=embed)
-                await db_manager.execute_query(
-                    "UPDATE active_games SET dashboard_message_id = ? WHERE game_id = ?",
-                    (str(message.id), game_id),
-                    commit=True
-                )
-        else:
-            # Create new message
-            message = await dashboard_channel.send(embed=embed)
-            await db_manager.execute_query(
-                "UPDATE active_games SET dashboard_message_id = ? WHERE game_id = ?",
-                (str(message.id), game_id),
-                commit=True
-            )
-    
-    except Exception as e:
-        print(f"❌ Error updating dashboard: {e}")
+        print(f"[AUTO] Leaderboard created for game {event.game_id}")
+    finally:
+        _completing_games.discard(event.game_id)
+
+
+event_bus.subscribe(event_bus.ActionResolved, _refresh_dashboard, name="dashboard")
+event_bus.subscribe(event_bus.ActionResolved, _resolve_encounter, name="encounter",
+                    concurrency=event_bus.EVENT_BUS_CONCURRENCY)
+event_bus.subscribe(event_bus.ActionResolved, _check_completion, name="completion")
+event_bus.subscribe(event_bus.GameCompleted, _create_leaderboard, name="leaderboard",
+                    concurrency=event_bus.EVENT_BUS_CONCURRENCY)
+
+
+def get_stats() -> dict:
+    """Time to first response: action received -> result embed shown to the player (ms), plus move checks."""
+    if not _first_response_ms:
+        return {"count": 0, "avg": 0.0, "p95": 0.0, **move_stats}
+    ordered = sorted(_first_response_ms)
+    return {
+        "count": len(ordered),
+        "avg": sum(ordered) / len(ordered),
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        **move_stats,
+    }
@@ -0,0 +1,246 @@
+"""
+HORROR BOT - INFERENCE SCHEDULER
+Single owner of the Llama model(s): serializes access and orders jobs by priority lane
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Priority lanes (lower = served first)
+PRIORITY_INTERACTIVE = 0  # Player actions, hidden-rule checks
+PRIORITY_NORMAL = 1       # Encounters, waiting-room messages
+PRIORITY_BACKGROUND = 2   # Lore, dark rules, scene generation
+
+LANE_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_NORMAL: "normal",
+    PRIORITY_BACKGROUND: "background",
+}
+
+
+class InferenceCancelled(Exception):
+    """Raised to the caller when its queued job was cancelled (e.g. the game ended)."""
+
+
+class _Job:
+    __slots__ = ("priority", "seq", "prompt", "params", "game_id", "kind", "on_token", "enqueued_at", "future")
+
+    def __init__(self, priority, seq, prompt, params, game_id, kind, on_token, future):
+        self.priority = priority
+        self.seq = seq
+        self.prompt = prompt
+        self.params = params
+        self.game_id = game_id
+        self.kind = kind
+        self.on_token = on_token
+        self.enqueued_at = time.perf_counter()
+        self.future = future
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+def _summary(samples) -> dict:
+    if not samples:
+        return {"avg": 0.0, "p95": 0.0, "max": 0.0}
+    ordered = sorted(samples)
+    return {
+        "avg": sum(ordered) / len(ordered),
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "max": ordered[-1],
+    }
+
+
+class InferenceScheduler:
+    """Owns the model(s); each model runs one job at a time, highest-priority lane first
+    (FIFO within a lane). With several models (worker processes) every idle model pulls
+    the next job from the shared queue; jobs with a KV-cache `session` are pinned to one
+    model (hash of the session) so the saved state of that session is found on the next turn.
+    """
+
+    def __init__(self):
+        self._models = []
+        self._executors = []
+        self._shared = []     # heap: job không có session, model nào rảnh cũng lấy được
+        self._pinned = []     # model index -> heap: job có session được gán cố định cho model đó
+        self._wakeup = None   # asyncio.Condition báo dispatcher có job mới
+        self._dispatchers = []
+        self._busy = 0
+        self._seq = itertools.count()
+        self._pending = set()
+        self._wait_ms = {lane: deque(maxlen=500) for lane in LANE_NAMES}
+        self._run_ms = deque(maxlen=500)
+        self._session_cache = {}  # model index -> (sessions, bytes) báo về sau mỗi job
+        self.stats = {
+            "submitted": 0, "completed": 0, "failed": 0, "cancelled": 0, "pinned": 0,
+            "prompt_tokens": 0, "reused_tokens": 0, "completion_tokens": 0,
+        }
+
+    # ----- Model ownership -----
+
+    @property
+    def has_model(self) -> bool:
+        return bool(self._models)
+
+    @property
+    def is_idle(self) -> bool:
+        """No job running and none waiting."""
+        return self._busy == 0 and not any(not job.future.done() for job in self._pending)
+
+    def attach_model(self, model):
+        self.attach_models([model])
+
+    def attach_models(self, models: list):
+        """Attach callables with the Llama signature: model(prompt, **params) -> output dict."""
+        self._models = list(models)
+        # One thread per model: a Llama instance is not thread-safe, and a worker
+        # process handle blocks on its pipe while the worker generates
+        self._executors = [
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"llm-inference-{i}")
+            for i in range(len(self._models))
+        ]
+
+    def close(self):
+        """Stop dispatching and release the models (worker processes are shut down)."""
+        for task in self._dispatchers:
+            task.cancel()
+        self._dispatchers = []
+        for model in self._models:
+            if hasattr(model, "close"):
+                model.close()
+        for executor in self._executors:
+            executor.shutdown(wait=False)
+        self._models = []
+        self._executors = []
+
+    # ----- Jobs -----
+
+    def _ensure_dispatchers(self):
+        if self._wakeup is None:
+            self._wakeup = asyncio.Condition()
+        if len(self._pinned) != len(self._models):
+            self._pinned = [[] for _ in self._models]
+        if len(self._dispatchers) != len(self._models):
+            self._dispatchers = [asyncio.create_task(self._run(i)) for i in range(len(self._models))]
+        for i, task in enumerate(self._dispatchers):
+            if task.done():
+                self._dispatchers[i] = asyncio.create_task(self._run(i))
+
+    async def complete(self, prompt: str, *, priority: int = PRIORITY_NORMAL, game_id=None,
+                       kind: str = "generic", on_token=None, **params) -> dict:
+        """Queue a completion and wait for the raw llama.cpp output dict.
+
+        on_token: optional callback, run on the event loop with each generated text piece
+        while the completion streams; the full output is still returned at the end.
+        """
+        if not self._models:
+            raise RuntimeError("LLM chưa được load")
+        self._ensure_dispatchers()
+
+        future = asyncio.get_running_loop().create_future()
+        job = _Job(priority, next(self._seq), prompt, params,
+                   int(game_id) if game_id is not None else None, kind, on_token, future)
+        self._pending.add(job)
+        self.stats["submitted"] += 1
+        session = params.get("session")
+        if session is not None and len(self._models) > 1:
+            heapq.heappush(self._pinned[zlib.crc32(str(session).encode()) % len(self._models)], job)
+            self.stats["pinned"] += 1
+        else:
+            heapq.heappush(self._shared, job)
+        async with self._wakeup:
+            self._wakeup.notify_all()
+        return await future
+
+    async def _next_job(self, index: int) -> _Job:
+        """Job ưu tiên cao nhất giữa hàng đợi riêng của model và hàng đợi chung."""
+        own = self._pinned[index]
+        async with self._wakeup:
+            while not own and not self._shared:
+                await self._wakeup.wait()
+            if own and (not self._shared or own[0] < self._shared[0]):
+                return heapq.heappop(own)
+            return heapq.heappop(self._shared)
+
+    async def _run(self, index: int):
+        loop = asyncio.get_running_loop()
+        model = self._models[index]
+        executor = self._executors[index]
+        while True:
+            job = await self._next_job(index)
+            self._pending.discard(job)
+            if job.future.done():
+                continue  # Cancelled while queued
+
+            started = time.perf_counter()
+            self._wait_ms[job.priority].append((started - job.enqueued_at) * 1000)
+            self._busy += 1
+            params = job.params
+            if job.on_token is not None:
+                # Tokens arrive on the inference thread; hand each one back to the loop
+                on_token = job.on_token
+                params = {**params, "on_text": lambda text: loop.call_soon_threadsafe(on_token, text)}
+            try:
+                result = await loop.run_in_executor(
+                    executor, lambda: model(job.prompt, **params)
+                )
+            except Exception as e:
+                self.stats["failed"] += 1
+                if not job.future.done():
+                    job.future.set_exception(e)
+            else:
+                self.stats["completed"] += 1
+                self._record_usage(index, result)
+                if not job.future.done():
+                    job.future.set_result(result)
+            finally:
+                self._busy -= 1
+            self._run_ms.append((time.perf_counter() - started) * 1000)
+
+    def _record_usage(self, index: int, result: dict):
+        if not isinstance(result, dict):
+            return
+        self.stats["completion_tokens"] += result.get("usage", {}).get("completion_tokens", 0)
+        cache = result.get("prompt_cache")
+        if cache is None:
+            return
+        self.stats["prompt_tokens"] += cache["prompt_tokens"]
+        self.stats["reused_tokens"] += cache["reused_tokens"]
+        self._session_cache[index] = (cache["sessions"], cache["bytes"])
+
+    def cancel_game(self, game_id) -> int:
+        """Cancel every queued (not yet running) job of a game. Returns the number cancelled."""
+        game_id = int(game_id)
+        cancelled = 0
+        for job in list(self._pending):
+            if job.game_id == game_id and not job.future.done():
+                job.future.set_exception(InferenceCancelled(f"Game {game_id} đã kết thúc"))
+                self._pending.discard(job)
+                cancelled += 1
+        self.stats["cancelled"] += cancelled
+        if cancelled:
+            print(f"🧹 [LLM] Đã hủy {cancelled} job đang chờ của game {game_id}")
+        return cancelled
+
+    def get_stats(self) -> dict:
+        depth = {name: 0 for name in LANE_NAMES.values()}
+        for job in self._pending:
+            if not job.future.done():
+                depth[LANE_NAMES[job.priority]] += 1
+        return {
+            **self.stats,
+            "workers": len(self._models),
+            "busy": self._busy,
+            "queue_depth": depth,
+            "wait_ms": {LANE_NAMES[lane]: _summary(samples) for lane, samples in self._wait_ms.items()},
+            "run_ms": _summary(self._run_ms),
+            "session_cache": {
+                "sessions": sum(sessions for sessions, _ in self._session_cache.values()),
+                "bytes": sum(size for _, size in self._session_cache.values()),
+            },
+        }
@@ -4,7 +4,7 @@ HORROR BOT - LEADERBOARD SERVICE
 AI-powered game rating and leaderboard generation
 """
 
-from services import llm_service
+from services import llm_service, game_content
 from database import db_manager
 import discord
 import json
@@ -13,56 +13,63 @@ import re
 # Rating scale: F (worst) to SS (best)
 RATING_SCALE = ["F", "D", "C", "B", "A", "S", "SS"]
 
-async def check_game_completion(game_id: str, bot: discord.Client, guild: discord.Guild) -> bool:
+async def find_completion(game_id: str):
     """
     Check if game should end (all objectives completed or all players dead/gone).
+    Returns (game, completion_reason) if the game is over, otherwise None.
+    """
+    # Get game info
+    game = await db_manager.execute_query(
+        "SELECT channel_id, game_code, scenario_type, lobby_channel_id FROM active_games WHERE channel_id = ?",
+        (game_id,),
+        fetchone=True
+    )
+    
+    if not game:
+        return None
+    
+    # Get all players
+    players = await db_manager.get_game_players(game_id)
+    
+    if not players:
+        return None
+    
+    # Check if all players are dead or HP <= 0
+    alive_players = [p for p in players if p['hp'] > 0]
+    
+    if len(alive_players) == 0:
+        # All players dead - game over
+        print(f"\n💀 [GAME_OVER] All players dead in game {game['game_code']}")
+        return game, "Tất cả người chơi đã bị tiêu diệt"
+    
+    # Check if all players completed objectives
+    # For now, we'll use a simple heuristic: if all players have reached sanctuary/exit
+    # In a real game, you'd track actual objective completion
+    
+    return None
+
+
+async def check_game_completion(game_id: str, bot: discord.Client, guild: discord.Guild) -> bool:
+    """
+    Check if game should end and, if so, create the leaderboard right away.
     Returns True if game is completed and leaderboard was created.
     """
     try:
-        # Get game info
-        game = await db_manager.execute_query(
-            "SELECT channel_id, game_code, scenario_type, lobby_channel_id FROM active_games WHERE channel_id = ?",
-            (game_id,),
-            fetchone=True
-        )
-        
-        if not game:
+        completion = await find_completion(game_id)
+        if not completion:
             return False
-        
-        # Get all players
-        players = await db_manager.execute_query(
-            "SELECT user_id, hp FROM players WHERE game_id = ?",
-            (game_id,),
-            fetchall=True
+        game, reason = completion
+        await create_leaderboard_and_cleanup(
+            game_id, game['game_code'], game['scenario_type'],
+            game['lobby_channel_id'], bot, guild, reason
         )
-        
-        if not players:
-            return False
-        
-        # Check if all players are dead or HP <= 0
-        alive_players = [p for p in players if p['hp'] > 0]
-        
-        if len(alive_players) == 0:
-            # All players dead - game over, create leaderboard
-            print(f"\n💀 [GAME_OVER] All players dead in game {game['game_code']}")
-            await _create_leaderboard_and_cleanup(
-                game_id, game['game_code'], game['scenario_type'], 
-                game['lobby_channel_id'], bot, guild,
-                "Tất cả người chơi đã bị tiêu diệt"
-            )
-            return True
-        
-        # Check if all players completed objectives
-        # For now, we'll use a simple heuristic: if all players have reached sanctuary/exit
-        # In a real game, you'd track actual objective completion
-        
-        return False
+        return True
     
     except Exception as e:
         print(f"❌ Error checking game completion: {e}")
         return False
 
-async def _create_leaderboard_and_cleanup(
+async def create_leaderboard_and_cleanup(
     game_id: str,
     game_code: str,
     scenario_type: str,
@@ -92,11 +99,7 @@ async def _create_leaderboard_and_cleanup(
         )
         
         # Delete private channels
-        players = await db_manager.execute_query(
-            "SELECT user_id, private_channel_id FROM players WHERE game_id = ?",
-            (game_id,),
-            fetchall=True
-        )
+        players = await db_manager.get_game_players(game_id)
         
         for player in players:
             if player['private_channel_id']:
@@ -118,21 +121,7 @@ async def _create_leaderboard_and_cleanup(
                 print(f"      ⚠️ Error deleting lobby: {e}")
         
         # Delete from database
-        await db_manager.execute_query(
-            "DELETE FROM players WHERE game_id = ?",
-            (game_id,),
-            commit=True
-        )
-        await db_manager.execute_query(
-            "DELETE FROM active_games WHERE channel_id = ?",
-            (game_id,),
-            commit=True
-        )
-        await db_manager.execute_query(
-            "DELETE FROM game_maps WHERE game_id = ?",
-            (game_id,),
-            commit=True
-        )
+        await db_manager.cleanup_game(game_id)
         
         if leaderboard_channel:
             # Ping users with their ratings
@@ -187,22 +176,13 @@ async def evaluate_game_completion(game_id: str, scenario_type: str) -> dict:
         if not game:
             return None
         
-        # Load scenario to get objectives
-        scenario_file = f"data/scenarios/{scenario_type}.json"
-        try:
-            import json as json_lib
-            with open(scenario_file, 'r', encoding='utf-8') as f:
-                scenario_data = json_lib.load(f)
-            objectives = scenario_data.get('objectives', [])
-        except:
-            objectives = []
+        # Scenario objectives (cached per game, no disk read)
+        content = await game_content.get_game_content(game_id)
+        scenario_data = content.scenario_config if content else game_content.load_scenario_config(scenario_type)
+        objectives = scenario_data.get('objectives', [])
         
         # Get all players
-        players = await db_manager.execute_query(
-            "SELECT user_id, hp, sanity, agi, acc, background_name, inventory FROM players WHERE game_id = ?",
-            (game_id,),
-            fetchall=True
-        )
+        players = await db_manager.get_game_players(game_id)
         
         if not players:
             return None
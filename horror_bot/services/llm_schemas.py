@@ -0,0 +1,85 @@
+"""
+HORROR BOT - LLM OUTPUT SCHEMAS
+Registry of the JSON shapes the bot asks the model for. Each schema is compiled once
+per process into a llama.cpp GBNF grammar, and the grammar is applied while sampling.
+The model can then only produce a valid object, and generation ends as soon as the
+object closes.
+"""
+
+import json
+import os
+from dotenv import load_dotenv
+
+try:
+    from llama_cpp import LlamaGrammar
+except ImportError:
+    LlamaGrammar = None
+
+load_dotenv()
+
+# on: ràng buộc output bằng grammar | off: sinh tự do rồi tìm {...} như trước (để so sánh)
+LLM_JSON_GRAMMAR = os.getenv("LLM_JSON_GRAMMAR", "on").lower() != "off"
+
+# "description" comes first wherever it exists so streamed narration shows up early
+_ACTION_PROPERTIES = {
+    "description": {"type": "string"},
+    "success": {"type": "boolean"},
+    "hp_change": {"type": "integer"},
+    "sanity_change": {"type": "integer"},
+    "new_location_id": {"type": "string"},
+    "discovered_items": {"type": "array", "items": {"type": "string"}, "maxItems": 5},
+}
+
+_RULE_LIST = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {"rule": {"type": "string"}},
+        "required": ["rule"],
+    },
+    "minItems": 10,
+    "maxItems": 10,
+}
+
+SCHEMAS = {
+    "player_action": {
+        "type": "object",
+        "properties": _ACTION_PROPERTIES,
+        "required": list(_ACTION_PROPERTIES),
+    },
+    "resolve_action": {
+        "type": "object",
+        "properties": {
+            **_ACTION_PROPERTIES,
+            "violated": {"type": "boolean"},
+            "rule_violated": {"type": "string"},
+            "reason": {"type": "string"},
+        },
+        "required": list(_ACTION_PROPERTIES) + ["violated", "rule_violated", "reason"],
+    },
+    "rule_check": {
+        "type": "object",
+        "properties": {
+            "violated": {"type": "boolean"},
+            "rule_violated": {"type": "string"},
+            "reason": {"type": "string"},
+        },
+        "required": ["violated", "rule_violated", "reason"],
+    },
+    "dark_rules": {
+        "type": "object",
+        "properties": {"public_rules": _RULE_LIST, "hidden_rules": _RULE_LIST},
+        "required": ["public_rules", "hidden_rules"],
+    },
+}
+
+_grammars = {}
+
+
+def get_grammar(name: str):
+    """Compiled grammar for a registered schema (cached per process), or None when disabled."""
+    if not LLM_JSON_GRAMMAR or LlamaGrammar is None or name is None:
+        return None
+    if name not in _grammars:
+        _grammars[name] = LlamaGrammar.from_json_schema(json.dumps(SCHEMAS[name]), verbose=False)
+    return _grammars[name]
@@ -8,6 +8,13 @@ import json
 import os
 from pathlib import Path
 from dotenv import load_dotenv
+from database import db_manager
+from services import llm_workers, llm_schemas
+from services.session_cache import SessionCachedModel
+from services.inference_scheduler import (
+    InferenceScheduler, InferenceCancelled,
+    PRIORITY_INTERACTIVE, PRIORITY_NORMAL, PRIORITY_BACKGROUND
+)
 
 try:
     from llama_cpp import Llama
@@ -20,9 +27,17 @@ load_dotenv()
 LLM_MODEL_PATH = os.getenv("LLM_MODEL_PATH")
 n_threads = int(os.getenv("LLM_N_THREADS", "4"))
 n_ctx = int(os.getenv("LLM_CONTEXT_SIZE", "8192"))
+# Số process llama.cpp chạy song song. 1 = model chạy ngay trong process bot (mặc định).
+# LLM_N_THREADS là tổng ngân sách core, chia đều cho các worker.
+LLM_WORKERS = max(1, int(os.getenv("LLM_WORKERS", "1")))
+# RAM cho KV state theo session (tổng, chia đều cho các worker). 0 = tắt.
+LLM_SESSION_CACHE_MB = int(os.getenv("LLM_SESSION_CACHE_MB", "512"))
 
-# Global model instance
-_llm = None
+# Scheduler owns the single model instance; every inference goes through it
+_scheduler = InferenceScheduler()
+
+# Vòng đời model: cold -> loading -> warming -> ready (hoặc failed)
+_state = "cold"
 
 # Prompt loading utility
 _prompt_cache = {}
@@ -53,50 +68,191 @@ def read_data_file(file_path: str) -> str | None:
         return None
 
 
+def is_loaded() -> bool:
+    return _scheduler.has_model
+
+
+def get_state() -> str:
+    return _state
+
+
+def is_waking_up() -> bool:
+    """Model is still loading or warming up: callers should answer "waking up" instead of waiting."""
+    return _state in ("cold", "loading", "warming")
+
+
+def is_idle() -> bool:
+    return _scheduler.is_idle
+
+
+def get_scheduler_stats() -> dict:
+    return _scheduler.get_stats()
+
+
+def cancel_game_jobs(game_id: int) -> int:
+    """Drop queued inference jobs of a game that has ended."""
+    return _scheduler.cancel_game(game_id)
+
+
+# Queued jobs of a deleted game would only produce output nobody reads
+db_manager.register_cleanup_hook(cancel_game_jobs)
+
+
+# Per call type: calls, JSON parse failures, generated tokens
+_call_stats = {}
+
+
+def _call_stat(kind: str) -> dict:
+    return _call_stats.setdefault(kind, {"calls": 0, "parse_failures": 0, "completion_tokens": 0})
+
+
+def _record_parse_failure(kind: str):
+    _call_stat(kind)["parse_failures"] += 1
+
+
+def get_call_stats() -> dict:
+    """Parse-failure rate and generated tokens per structured call type."""
+    return {
+        "grammar": llm_schemas.LLM_JSON_GRAMMAR,
+        "kinds": {
+            kind: {
+                **stat,
+                "failure_rate": stat["parse_failures"] / stat["calls"] if stat["calls"] else 0.0,
+                "avg_tokens": stat["completion_tokens"] / stat["calls"] if stat["calls"] else 0.0,
+            }
+            for kind, stat in _call_stats.items()
+        },
+    }
+
+
+async def _generate(prompt: str, *, kind: str, priority: int, game_id: int = None, **params) -> str:
+    """Run one completion through the scheduler and return the stripped text.
+
+    Pass schema=<llm_schemas name> to constrain the output to that JSON shape.
+    """
+    output = await _scheduler.complete(
+        prompt, priority=priority, game_id=game_id, kind=kind, echo=False, **params
+    )
+    if "schema" in params:
+        stat = _call_stat(kind)
+        stat["calls"] += 1
+        stat["completion_tokens"] += output.get("usage", {}).get("completion_tokens", 0)
+    return output['choices'][0]['text'].strip()
+
+
 def load_llm():
-    """Load Qwen model once for entire bot lifecycle."""
-    global _llm
-    if _llm is not None:
+    """Load Qwen model once for entire bot lifecycle.
+
+    Blocking (tens of seconds on CPU): run it in a thread, never on the event loop.
+    """
+    global _state
+    if _scheduler.has_model:
         return True
 
     if not LLM_MODEL_PATH or not os.path.exists(LLM_MODEL_PATH):
         print(f"❌ Không tìm thấy model tại: {LLM_MODEL_PATH}")
         print("👉 Hãy chạy python download_model.py trước.")
+        _state = "failed"
         return False
 
+    _state = "loading"
+
+    threads_per_worker = max(1, n_threads // LLM_WORKERS)
+    model_kwargs = dict(
+        model_path=LLM_MODEL_PATH,
+        n_ctx=n_ctx,
+        n_threads=threads_per_worker,
+        n_gpu_layers=0,  # Chạy thuần CPU
+        use_mmap=True,   # Các worker dùng chung weight qua page cache
+        verbose=False
+    )
+
+    session_cache_bytes = LLM_SESSION_CACHE_MB * 1024 * 1024 // LLM_WORKERS
+
+    if LLM_WORKERS > 1:
+        print(f"🔄 Đang khởi động {LLM_WORKERS} LLM worker (Threads/worker: {threads_per_worker}, Context: {n_ctx})...")
+        workers = llm_workers.start_workers(LLM_WORKERS, model_kwargs, session_cache_bytes)
+        if workers is None:
+            print("❌ Lỗi khởi động LLM worker")
+            _state = "failed"
+            return False
+        _scheduler.attach_models(workers)
+        print(f"✅ {LLM_WORKERS} LLM worker sẵn sàng!")
+        _state = "warming"
+        return True
+
     try:
         print(f"🔄 Đang load model GGUF (Threads: {n_threads}, Context: {n_ctx})...")
-        _llm = Llama(
-            model_path=LLM_MODEL_PATH,
-            n_ctx=n_ctx,
-            n_threads=n_threads,
-            n_gpu_layers=0,  # Chạy thuần CPU
-            verbose=False
-        )
+        _scheduler.attach_model(SessionCachedModel(Llama(**model_kwargs), session_cache_bytes))
         print("✅ LLM Load thành công!")
+        _state = "warming"
         return True
     except Exception as e:
         print(f"❌ Lỗi load model: {e}")
+        _state = "failed"
         return False
 
 
+async def warm_up():
+    """Run a tiny prompt on every worker so the first player action doesn't pay for
+    page-faulting the weights and allocating compute buffers."""
+    global _state
+    prompt = "<|im_start|>user\nXin chào<|im_end|>\n<|im_start|>assistant\n"
+    workers = _scheduler.get_stats()["workers"]
+    try:
+        await asyncio.gather(*(
+            _generate(prompt, kind="warm_up", priority=PRIORITY_INTERACTIVE, max_tokens=1)
+            for _ in range(workers)
+        ))
+    except Exception as e:
+        print(f"⚠️ Warm-up LLM lỗi (model vẫn dùng được): {e}")
+    _state = "ready"
+
+
+def shutdown_llm():
+    """Dừng scheduler và tắt các worker process (gọi khi bot tắt)."""
+    _scheduler.close()
+
+
 # ============================================================================
 # PER-PLAYER ACTION PROCESSING (Free-Form Text Actions)
 # ============================================================================
 
+def _format_history(conversation_history: list) -> str:
+    """Render conversation history (oldest first) as prompt lines."""
+    messages_text = ""
+    for msg in conversation_history or []:
+        role = msg.get('role', 'user').upper()
+        content = msg.get('content', '')
+        messages_text += f"{role}: {content}\n"
+    return messages_text
+
+
 async def process_player_action(
     action_text: str,
     system_prompt: str,
-    conversation_history: list = None
+    conversation_history: list = None,
+    game_id: int = None,
+    player_context: str = "",
+    session_key: str = None,
+    on_token=None
 ) -> str:
     """
     Process free-form player action through LLM.
     Per-user isolated context prevents cross-player state leakage.
+
+    The prompt is ordered from most to least stable (system prompt, history,
+    player context, action) so consecutive turns of one session share a long
+    prefix whose KV state is reused instead of re-evaluated.
     
     Args:
         action_text: What the player typed (e.g., "Tôi tìm kiếm quanh phòng")
-        system_prompt: Per-player system prompt (location desc, stats, inventory)
-        conversation_history: Last 10 messages (rolling window)
+        system_prompt: DM instructions that stay the same across turns
+        conversation_history: Recent messages, oldest first (the caller picks the window)
+        game_id: Owning game, so queued inference is dropped if the game ends
+        player_context: Per-turn state (location, stats, inventory), placed right before the action
+        session_key: KV-cache session (one per player per game)
+        on_token: Optional callback receiving each raw output piece as it is generated
     
     Returns:
         JSON string with action outcome:
@@ -109,7 +265,7 @@ async def process_player_action(
             "discovered_items": [str]
         }
     """
-    if _llm is None:
+    if not is_loaded():
         return json.dumps({
             "success": False,
             "description": "Hệ thống AI chưa sẵn sàng.",
@@ -119,20 +275,11 @@ async def process_player_action(
             "discovered_items": []
         })
 
-    if conversation_history is None:
-        conversation_history = []
-
-    # Build prompt with conversation history (last 5 messages for context)
-    messages_text = ""
-    for msg in conversation_history[-5:]:
-        role = msg.get('role', 'user').upper()
-        content = msg.get('content', '')
-        messages_text += f"{role}: {content}\n"
-
     prompt = get_prompt(
         "process_player_action",
         system_prompt=system_prompt,
-        messages_text=messages_text,
+        messages_text=_format_history(conversation_history),
+        player_context=player_context,
         action_text=action_text
     )
     if not prompt:
@@ -145,37 +292,130 @@ async def process_player_action(
             "discovered_items": []
         })
 
-    loop = asyncio.get_running_loop()
-
-    def run_inference():
+    try:
+        text = await _generate(
+            prompt,
+            kind="player_action",
+            priority=PRIORITY_INTERACTIVE,
+            game_id=game_id,
+            session=session_key,
+            on_token=on_token,
+            schema="player_action",
+            max_tokens=500,
+            stop=["<|im_end|>"],
+            temperature=0.8
+        )
         try:
-            output = _llm(
-                prompt,
-                max_tokens=500,
-                stop=["<|im_end|>"],
-                echo=False,
-                temperature=0.8
-            )
-            return output['choices'][0]['text'].strip()
-        except Exception as e:
-            print(f"❌ LLM inference error: {e}")
-            return json.dumps({
-                "success": False,
-                "description": f"Lỗi: {e}",
-                "hp_change": 0,
-                "sanity_change": 0,
-                "new_location_id": "same",
-                "discovered_items": []
-            })
-
-    return await loop.run_in_executor(None, run_inference)
+            json.loads(text)
+        except json.JSONDecodeError:
+            _record_parse_failure("player_action")  # game_engine falls back to an error result
+        return text
+    except InferenceCancelled:
+        raise
+    except Exception as e:
+        print(f"❌ LLM inference error: {e}")
+        return json.dumps({
+            "success": False,
+            "description": f"Lỗi: {e}",
+            "hp_change": 0,
+            "sanity_change": 0,
+            "new_location_id": "same",
+            "discovered_items": []
+        })
+
+
+async def resolve_action(
+    action_text: str,
+    rules_text: str,
+    conversation_history: list = None,
+    game_id: int = None,
+    player_context: str = "",
+    session_key: str = None,
+    on_token=None
+) -> dict:
+    """
+    Resolve a player action and judge it against the hidden rules in ONE inference call
+    (replaces process_player_action + check_rule_violation).
+
+    The hidden rules sit in the system prompt, so they are part of the session's
+    cached KV prefix instead of being re-sent in a second call.
+
+    Args:
+        action_text: What the player typed
+        rules_text: Pre-formatted hidden rules (see format_hidden_rules)
+        conversation_history: Recent messages, oldest first
+        game_id: Owning game, so queued inference is dropped if the game ends
+        player_context: Per-turn state (location, stats, inventory)
+        session_key: KV-cache session (one per player per game)
+        on_token: Optional callback receiving each raw output piece as it is generated
+
+    Returns:
+        Action outcome dict (same keys as process_player_action) plus
+        "violated", "rule_violated" and "reason" from the rule judgement.
+    """
+    default_response = {
+        "success": False,
+        "description": "Hệ thống AI gặp lỗi phân tích.",
+        "hp_change": 0,
+        "sanity_change": 0,
+        "new_location_id": "same",
+        "discovered_items": [],
+        "violated": False,
+        "reason": ""
+    }
+    if not is_loaded():
+        return {**default_response, "description": "Hệ thống AI chưa sẵn sàng."}
+
+    prompt = get_prompt(
+        "resolve_action",
+        hidden_rules=rules_text,
+        messages_text=_format_history(conversation_history),
+        player_context=player_context,
+        action_text=action_text
+    )
+    if not prompt:
+        return {**default_response, "description": "Lỗi: Không tìm thấy file prompt."}
+
+    raw_text = ""
+    try:
+        raw_text = await _generate(
+            prompt,
+            kind="resolve_action",
+            priority=PRIORITY_INTERACTIVE,
+            game_id=game_id,
+            session=session_key,
+            on_token=on_token,
+            schema="resolve_action",
+            max_tokens=600,
+            stop=["<|im_end|>", "```"],
+            temperature=0.7
+        )
+
+        json_start = raw_text.find('{')
+        json_end = raw_text.rfind('}') + 1
+        if json_start == -1 or json_end == 0:
+            print(f"❌ Lỗi: [Resolve Action] Không tìm thấy JSON trong output.\nOutput: {raw_text}")
+            _record_parse_failure("resolve_action")
+            return default_response
+        return {**default_response, **json.loads(raw_text[json_start:json_end])}
+
+    except InferenceCancelled:
+        raise
+    except json.JSONDecodeError as e:
+        print(f"❌ Lỗi: [Resolve Action] Giải mã JSON thất bại: {e}\nRaw text: {raw_text}")
+        _record_parse_failure("resolve_action")
+        return default_response
+    except Exception as e:
+        print(f"❌ LLM inference error: {e}")
+        return {**default_response, "description": f"Lỗi: {e}"}
 
 
 async def generate_encounter(
     action_description: str,
     player_name: str,
     other_players: list,
-    scenario_type: str
+    scenario_type: str,
+    game_id: int = None
 ) -> str:
     """
     Generate encounter scenario when 2+ players meet.
@@ -186,11 +426,12 @@ async def generate_encounter(
         player_name: Name of first player
         other_players: List of other player names at location
         scenario_type: Scenario type for context
+        game_id: Owning game, so queued inference is dropped if the game ends
     
     Returns:
         Encounter description text (2-3 sentences)
     """
-    if _llm is None:
+    if not is_loaded():
         other_names = ", ".join(other_players)
         return f"Bạn gặp {other_names}. Cảm giác rất kỳ lạ..."
 
@@ -204,22 +445,20 @@ async def generate_encounter(
     if not prompt:
         return f"Bạn gặp {', '.join(other_players)} trong tối tối..."
 
-    loop = asyncio.get_running_loop()
-
-    def run_inference():
-        try:
-            output = _llm(
-                prompt,
-                max_tokens=200,
-                stop=["<|im_end|>"],
-                echo=False,
-                temperature=0.9
-            )
-            return output['choices'][0]['text'].strip()
-        except Exception as e:
-            return f"Bạn gặp {', '.join(other_players)} trong tối tối..."
-
-    return await loop.run_in_executor(None, run_inference)
+    try:
+        return await _generate(
+            prompt,
+            kind="encounter",
+            priority=PRIORITY_NORMAL,
+            game_id=game_id,
+            max_tokens=200,
+            stop=["<|im_end|>"],
+            temperature=0.9
+        )
+    except InferenceCancelled:
+        raise
+    except Exception:
+        return f"Bạn gặp {', '.join(other_players)} trong tối tối..."
 
 
 # ============================================================================
@@ -228,63 +467,47 @@ async def generate_encounter(
 
 async def describe_scene(keywords: list) -> str:
     """Generate scene description for narrative (optional, for global log)."""
-    if _llm is None:
+    if not is_loaded():
         return "Không gian tĩnh mịch... (AI chưa load)"
 
     prompt = get_prompt("describe_scene", keywords=', '.join(keywords))
     if not prompt:
         return "Không gian tĩnh mịch... (AI chưa load)"
 
-    loop = asyncio.get_running_loop()
-    
-    def run_inference():
-        output = _llm(
-            prompt,
-            max_tokens=150,
-            stop=["<|im_end|>", "\n\n"],
-            echo=False,
-            temperature=0.7
-        )
-        return output['choices'][0]['text'].strip()
-
-    return await loop.run_in_executor(None, run_inference)
+    return await _generate(
+        prompt,
+        kind="describe_scene",
+        priority=PRIORITY_BACKGROUND,
+        max_tokens=150,
+        stop=["<|im_end|>", "\n\n"],
+        temperature=0.7
+    )
 
 
 async def describe_scene_stream(keywords: list, callback=None) -> str:
-    """Generate scene description với streaming callback (gọi callback từng phần)."""
-    if _llm is None:
+    """Generate scene description với streaming callback (gọi callback với từng token ngay khi sinh ra)."""
+    if not is_loaded():
         return "Không gian tĩnh mịch... (AI chưa load)"
 
     prompt = get_prompt("describe_scene", keywords=', '.join(keywords))
     if not prompt:
         return "Không gian tĩnh mịch... (AI chưa load)"
 
-    loop = asyncio.get_running_loop()
-    
-    def run_inference():
-        output = _llm(
-            prompt,
-            max_tokens=150,
-            stop=["<|im_end|>", "\n\n"],
-            echo=False,
-            temperature=0.7
-        )
-        result = output['choices'][0]['text'].strip()
-        
-        if callback:
-            sentences = result.split('. ')
-            for i, sentence in enumerate(sentences):
-                callback(sentence + ('.' if i < len(sentences) - 1 else ''))
-        
-        return result
-
-    return await loop.run_in_executor(None, run_inference)
+    return await _generate(
+        prompt,
+        kind="describe_scene",
+        priority=PRIORITY_BACKGROUND,
+        on_token=callback,
+        max_tokens=150,
+        stop=["<|im_end|>", "\n\n"],
+        temperature=0.7
+    )
 
 
-async def generate_dark_rules(scenario_type: str) -> dict:
+async def generate_dark_rules(scenario_type: str, game_id: int = None) -> dict:
     """Generate a set of dark rules for the game scenario like Chinese novels."""
     default_response = {"public_rules": [], "hidden_rules": []}
-    if _llm is None:
+    if not is_loaded():
         print("⚠️ LLM not loaded, returning empty rules.")
         return default_response
 
@@ -292,51 +515,54 @@ async def generate_dark_rules(scenario_type: str) -> dict:
     if not prompt:
         return default_response
 
-    loop = asyncio.get_running_loop()
-    
-    def run_inference():
-        try:
-            output = _llm(
-                prompt,
-                max_tokens=1500,  # Increased token limit for JSON output
-                stop=["<|im_end|>", "```"],
-                echo=False,
-                temperature=0.8
-            )
-            raw_text = output['choices'][0]['text'].strip()
-            
-            # Find the JSON block
-            json_start = raw_text.find('{')
-            json_end = raw_text.rfind('}') + 1
-            if json_start == -1 or json_end == 0:
-                print(f"❌ Lỗi: Không tìm thấy JSON trong output của LLM.\nOutput: {raw_text}")
-                return default_response
-
-            json_text = raw_text[json_start:json_end]
-            
-            # Parse the JSON
-            parsed_json = json.loads(json_text)
-            
-            # Validate structure
-            if "public_rules" not in parsed_json or "hidden_rules" not in parsed_json:
-                print(f"❌ Lỗi: JSON output thiếu key 'public_rules' hoặc 'hidden_rules'.\nOutput: {json_text}")
-                return default_response
-            
-            return parsed_json
+    raw_text = ""
+    try:
+        raw_text = await _generate(
+            prompt,
+            kind="dark_rules",
+            priority=PRIORITY_BACKGROUND,
+            game_id=game_id,
+            schema="dark_rules",
+            max_tokens=1500,  # Increased token limit for JSON output
+            stop=["<|im_end|>", "```"],
+            temperature=0.8
+        )
 
-        except json.JSONDecodeError as e:
-            print(f"❌ Lỗi giải mã JSON: {e}\nRaw text: {raw_text}")
+        # Find the JSON block
+        json_start = raw_text.find('{')
+        json_end = raw_text.rfind('}') + 1
+        if json_start == -1 or json_end == 0:
+            print(f"❌ Lỗi: Không tìm thấy JSON trong output của LLM.\nOutput: {raw_text}")
+            _record_parse_failure("dark_rules")
             return default_response
-        except Exception as e:
-            print(f"❌ Lỗi không xác định trong generate_dark_rules: {e}")
+
+        json_text = raw_text[json_start:json_end]
+
+        # Parse the JSON
+        parsed_json = json.loads(json_text)
+
+        # Validate structure
+        if "public_rules" not in parsed_json or "hidden_rules" not in parsed_json:
+            print(f"❌ Lỗi: JSON output thiếu key 'public_rules' hoặc 'hidden_rules'.\nOutput: {json_text}")
+            _record_parse_failure("dark_rules")
             return default_response
 
-    return await loop.run_in_executor(None, run_inference)
+        return parsed_json
+
+    except InferenceCancelled:
+        raise
+    except json.JSONDecodeError as e:
+        print(f"❌ Lỗi giải mã JSON: {e}\nRaw text: {raw_text}")
+        _record_parse_failure("dark_rules")
+        return default_response
+    except Exception as e:
+        print(f"❌ Lỗi không xác định trong generate_dark_rules: {e}")
+        return default_response
 
 
 async def generate_waiting_room_message(num_players: int, total_slots: int = 8) -> str:
     """Generate a natural greeting for waiting room."""
-    if _llm is None:
+    if not is_loaded():
         return f"Đang chờ đủ người tham gia... ({num_players}/{total_slots})"
 
     prompt = get_prompt(
@@ -347,19 +573,14 @@ async def generate_waiting_room_message(num_players: int, total_slots: int = 8)
     if not prompt:
         return f"Đang chờ đủ người tham gia... ({num_players}/{total_slots})"
 
-    loop = asyncio.get_running_loop()
-    
-    def run_inference():
-        output = _llm(
-            prompt,
-            max_tokens=150,
-            stop=["<|im_end|>"],
-            echo=False,
-            temperature=0.7
-        )
-        return output['choices'][0]['text'].strip()
-
-    return await loop.run_in_executor(None, run_inference)
+    return await _generate(
+        prompt,
+        kind="waiting_room",
+        priority=PRIORITY_NORMAL,
+        max_tokens=150,
+        stop=["<|im_end|>"],
+        temperature=0.7
+    )
 
 
 async def generate_simple_greeting(scenario_type: str) -> str:
@@ -368,13 +589,18 @@ async def generate_simple_greeting(scenario_type: str) -> str:
     return greeting or f"📍 Phòng {scenario_type} đợi bạn khám phá..."
 
 
+def get_fallback_lore(scenario_type: str) -> str:
+    """Static lore from data/lore, used when the LLM is unavailable or refuses."""
+    return read_data_file(f"lore/{scenario_type}/lore.txt") or "Thế giới bí ẩn... (Không tìm thấy file lore)"
+
+
 async def generate_world_lore(scenario_type: str) -> str:
     """Generate detailed world lore for the scenario (can be long, will be chunked)."""
     # Get fallback lore from file
-    fallback_lore = read_data_file(f"lore/{scenario_type}/lore.txt") or "Thế giới bí ẩn... (Không tìm thấy file lore)"
+    fallback_lore = get_fallback_lore(scenario_type)
     
     # If LLM is not available, return fallback
-    if _llm is None:
+    if not is_loaded():
         return fallback_lore
 
     # Prepare reference lore for the prompt
@@ -390,39 +616,50 @@ async def generate_world_lore(scenario_type: str) -> str:
     if not prompt: # Handle case where prompt file is missing
         return fallback_lore
 
-    loop = asyncio.get_running_loop()
-    
-    def run_inference():
-        try:
-            output = _llm(
-                prompt,
-                max_tokens=500,
-                stop=["<|im_end|>"],
-                echo=False,
-                temperature=0.7
-            )
-            result = output['choices'][0]['text'].strip()
-            # If result looks like a refusal, return fallback
-            if len(result) < 50 or "không thể" in result.lower() or "xin lỗi" in result.lower():
-                return fallback_lore
-            return result
-        except Exception as e:
-            print(f"⚠️ LLM error in generate_world_lore: {e}")
+    try:
+        result = await _generate(
+            prompt,
+            kind="world_lore",
+            priority=PRIORITY_BACKGROUND,
+            max_tokens=500,
+            stop=["<|im_end|>"],
+            temperature=0.7
+        )
+        # If result looks like a refusal, return fallback
+        if len(result) < 50 or "không thể" in result.lower() or "xin lỗi" in result.lower():
             return fallback_lore
+        return result
+    except Exception as e:
+        print(f"⚠️ LLM error in generate_world_lore: {e}")
+        return fallback_lore
+
 
-    return await loop.run_in_executor(None, run_inference)
+def format_hidden_rules(hidden_rules: list) -> str:
+    """Format hidden rules into the numbered list used by the rule-check prompt."""
+    rules_text = ""
+    for i, rule in enumerate(hidden_rules, 1):
+        rules_text += f"{i}. {rule['rule_text']}\n"
+    return rules_text
 
 
-async def check_rule_violation(hidden_rules: list, action_text: str, action_description: str) -> dict:
-    """Checks if a player's action violates any of the hidden rules."""
+async def check_rule_violation(
+    hidden_rules: list,
+    action_text: str,
+    action_description: str,
+    rules_text: str = None,
+    game_id: int = None
+) -> dict:
+    """Checks if a player's action violates any of the hidden rules.
+
+    rules_text: pre-formatted hidden rules (see format_hidden_rules) to skip rebuilding them
+    game_id: owning game, so the queued check is dropped if the game ends
+    """
     default_response = {"violated": False, "reason": "Lỗi hệ thống phán xét."}
-    if _llm is None or not hidden_rules:
+    if not is_loaded() or not hidden_rules:
         return default_response
 
-    # Format hidden rules into a numbered list string
-    rules_text = ""
-    for i, rule in enumerate(hidden_rules, 1):
-        rules_text += f"{i}. {rule['rule_text']}\n"
+    if rules_text is None:
+        rules_text = format_hidden_rules(hidden_rules)
 
     prompt = get_prompt(
         "check_rule_violation",
@@ -433,34 +670,38 @@ async def check_rule_violation(hidden_rules: list, action_text: str, action_desc
     if not prompt:
         return default_response
 
-    loop = asyncio.get_running_loop()
+    raw_text = ""
+    try:
+        raw_text = await _generate(
+            prompt,
+            kind="rule_check",
+            priority=PRIORITY_INTERACTIVE,
+            game_id=game_id,
+            schema="rule_check",
+            # Prompt starts with the game's hidden rules: reuse that prefix per game
+            session=f"rules:{game_id}" if game_id is not None else None,
+            max_tokens=300,
+            stop=["<|im_end|>", "```"],
+            temperature=0.2  # Low temperature for logical reasoning
+        )
 
-    def run_inference():
-        try:
-            output = _llm(
-                prompt,
-                max_tokens=300,
-                stop=["<|im_end|>", "```"],
-                echo=False,
-                temperature=0.2  # Low temperature for logical reasoning
-            )
-            raw_text = output['choices'][0]['text'].strip()
-
-            # Find the JSON block
-            json_start = raw_text.find('{')
-            json_end = raw_text.rfind('}') + 1
-            if json_start == -1 or json_end == 0:
-                print(f"❌ Lỗi: [Rule Check] Không tìm thấy JSON trong output.\nOutput: {raw_text}")
-                return default_response
-
-            json_text = raw_text[json_start:json_end]
-            return json.loads(json_text)
-
-        except json.JSONDecodeError as e:
-            print(f"❌ Lỗi: [Rule Check] Giải mã JSON thất bại: {e}\nRaw text: {raw_text}")
-            return default_response
-        except Exception as e:
-            print(f"❌ Lỗi không xác định trong check_rule_violation: {e}")
+        # Find the JSON block
+        json_start = raw_text.find('{')
+        json_end = raw_text.rfind('}') + 1
+        if json_start == -1 or json_end == 0:
+            print(f"❌ Lỗi: [Rule Check] Không tìm thấy JSON trong output.\nOutput: {raw_text}")
+            _record_parse_failure("rule_check")
             return default_response
 
-    return await loop.run_in_executor(None, run_inference)
+        json_text = raw_text[json_start:json_end]
+        return json.loads(json_text)
+
+    except InferenceCancelled:
+        raise
+    except json.JSONDecodeError as e:
+        print(f"❌ Lỗi: [Rule Check] Giải mã JSON thất bại: {e}\nRaw text: {raw_text}")
+        _record_parse_failure("rule_check")
+        return default_response
+    except Exception as e:
+        print(f"❌ Lỗi không xác định trong check_rule_violation: {e}")
+        return default_response
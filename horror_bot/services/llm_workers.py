@@ -0,0 +1,105 @@
+"""
+HORROR BOT - LLM WORKER PROCESSES
+Mỗi worker là một process riêng giữ một instance Llama. File GGUF được mmap nên
+các process dùng chung trang weight trong page cache; chỉ KV cache là riêng từng worker.
+"""
+
+import multiprocessing
+from services.session_cache import SessionCachedModel
+
+# Module này được import lại trong process con (spawn) - chỉ import những gì worker cần
+
+
+def _worker_main(conn, model_kwargs: dict, session_cache_bytes: int):
+    """Vòng lặp của process con: nhận (prompt, params, stream), trả ("ok", output) hoặc ("error", msg).
+
+    Khi stream=True, gửi thêm ("token", text) cho từng token trước kết quả cuối.
+    """
+    try:
+        from llama_cpp import Llama
+        llm = SessionCachedModel(Llama(**model_kwargs), session_cache_bytes)
+    except Exception as e:
+        conn.send(("error", f"{type(e).__name__}: {e}"))
+        return
+    conn.send(("ready", None))
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break  # Process cha đã đóng pipe
+        if message is None:
+            break
+        prompt, params, stream = message
+        on_text = (lambda text: conn.send(("token", text))) if stream else None
+        try:
+            conn.send(("ok", llm(prompt, on_text=on_text, **params)))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+class ProcessWorker:
+    """Handle phía process cha; gọi như SessionCachedModel: worker(prompt, on_text=None, **params) -> output dict.
+
+    Mỗi lần gọi chặn đến khi worker trả kết quả, nên scheduler gọi nó từ thread riêng của worker.
+    """
+
+    def __init__(self, index: int, model_kwargs: dict, session_cache_bytes: int = 0):
+        ctx = multiprocessing.get_context("spawn")
+        self.index = index
+        self._conn, child_conn = ctx.Pipe()
+        self._process = ctx.Process(
+            target=_worker_main,
+            args=(child_conn, model_kwargs, session_cache_bytes),
+            name=f"llm-worker-{index}",
+            daemon=True
+        )
+        self._process.start()
+        child_conn.close()
+
+    def wait_ready(self, timeout: float = 600) -> bool:
+        """Chờ worker load xong model. Trả về False nếu worker lỗi hoặc quá thời gian."""
+        if not self._conn.poll(timeout):
+            print(f"❌ LLM worker {self.index}: quá {timeout:.0f}s chưa load xong model")
+            return False
+        status, payload = self._conn.recv()
+        if status != "ready":
+            print(f"❌ LLM worker {self.index}: {payload}")
+            return False
+        return True
+
+    def __call__(self, prompt: str, on_text=None, **params) -> dict:
+        self._conn.send((prompt, params, on_text is not None))
+        status, payload = self._conn.recv()
+        while status == "token":
+            on_text(payload)
+            status, payload = self._conn.recv()
+        if status == "error":
+            raise RuntimeError(f"LLM worker {self.index}: {payload}")
+        return payload
+
+    def close(self):
+        try:
+            self._conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self._process.join(timeout=5)
+        if self._process.is_alive():
+            self._process.terminate()
+        self._conn.close()
+
+
+def start_workers(count: int, model_kwargs: dict, session_cache_bytes: int = 0) -> list | None:
+    """Khởi động `count` worker song song và chờ tất cả load xong.
+
+    session_cache_bytes: ngân sách RAM cho KV state theo session của MỖI worker (0 = tắt).
+
+    Returns:
+        Danh sách ProcessWorker, hoặc None nếu có worker lỗi (các worker đã mở sẽ bị đóng).
+    """
+    workers = [ProcessWorker(i, model_kwargs, session_cache_bytes) for i in range(count)]
+    if all([worker.wait_ready() for worker in workers]):
+        return workers
+    for worker in workers:
+        worker.close()
+    return None
@@ -1,15 +1,37 @@
 import json
 import random
-import uuid
 import os
 
+# Thứ tự hướng trong mảng kết nối đóng gói (mỗi phòng 6 ô, -1 = không có lối)
+DIRECTIONS = ("north", "south", "east", "west", "up", "down")
+
+# Phiên bản định dạng lưu trong game_maps.map_data
+# 1: MapStructure.to_dict() (ID uuid4, node lồng nhau) | 2: compact JSON (to_compact())
+# 3: chỉ (seed, scenario, generator) + state thay đổi của từng phòng (encode()); bản đồ được sinh lại khi cần
+MAP_FORMAT_VERSION = 3
+
+# Phiên bản thuật toán generate_map_structure. Mọi thay đổi làm khác chuỗi rng
+# (thêm/bớt/đổi thứ tự lời gọi random) PHẢI tăng số này và giữ lại nhánh cũ,
+# nếu không các game đã lưu theo seed sẽ sinh lại ra bản đồ khác.
+MAP_GENERATOR_VERSION = 1
+
+# Nơi duy nhất định nghĩa đường dẫn scenario (game_content, content_pool, map_graph dùng lại)
+SCENARIOS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "scenarios")
+
+
+def scenario_path(scenario: str) -> str:
+    return os.path.join(SCENARIOS_DIR, f"{scenario}.json")
+
+
 class MapNode:
     """Represents a single location (room) on the map."""
+    __slots__ = ("id", "room_type", "description", "connections", "entities", "events")
+
     def __init__(self, room_type: str, description: str = "An unremarkable space."):
-        self.id = str(uuid.uuid4())
+        self.id = None  # Gán bởi MapStructure.add_node: index của phòng dạng chuỗi ("0", "1", ...)
         self.room_type = room_type
         self.description = description
-        self.connections = {}  # e.g., {"north": "node_id_123"}
+        self.connections = {}  # e.g., {"north": "12"}
         self.entities = []  # Monsters or NPCs in the room
         self.events = []    # Special events or items
 
@@ -29,13 +51,20 @@ class MapNode:
 
 class MapStructure:
     """Represents the entire game map as a graph of nodes."""
-    def __init__(self, scenario_name: str):
+    def __init__(self, scenario_name: str, scenario: str = None, seed: int = None,
+                 generator_version: int = MAP_GENERATOR_VERSION, floors: tuple = None):
         self.scenario_name = scenario_name
         self.nodes = {}  # A flat dictionary of all nodes by their ID
         self.start_node_id = None
+        # (scenario, seed, generator_version, floors) đủ để sinh lại đúng bản đồ này
+        self.scenario = scenario
+        self.seed = seed
+        self.generator_version = generator_version
+        self.floors = floors  # (min_floors, max_floors) đã dùng khi sinh
 
     def add_node(self, node: MapNode):
-        """Adds a node to the map."""
+        """Adds a node to the map (IDs are small integers, as strings, in insertion order)."""
+        node.id = str(len(self.nodes))
         self.nodes[node.id] = node
         if not self.start_node_id:
             self.start_node_id = node.id
@@ -48,6 +77,55 @@ class MapStructure:
             "nodes": {node_id: node.to_dict() for node_id, node in self.nodes.items()}
         }
 
+    def encode(self, room_state: dict = None) -> str:
+        """
+        Versioned JSON for game_maps.map_data. A seeded map is stored as its generator inputs
+        only (format 3): seed, the scenario's floor range at generation time and the room count
+        to verify against, plus the per-room state that changed since generation
+        ({room_id: {"entities": [...], "events": [...]}}); other maps fall back to to_compact().
+        """
+        if self.seed is None or self.scenario is None or self.floors is None:
+            return self.to_compact()
+        return json.dumps({
+            "v": MAP_FORMAT_VERSION,
+            "scenario": self.scenario,
+            "seed": self.seed,
+            "generator": self.generator_version,
+            "floors": list(self.floors),
+            "n": len(self.nodes),
+            "rooms": room_state or {},
+        }, ensure_ascii=False, separators=(",", ":"))
+
+    def to_compact(self) -> str:
+        """
+        Compact JSON (format 2) with the whole graph:
+        room_type/description are indices into a shared string table, connections are one
+        flat array of 6 ints per room (order of DIRECTIONS, -1 = none), entities/events are sparse.
+        """
+        strings, string_index = [], {}
+
+        def intern(text):
+            if text not in string_index:
+                string_index[text] = len(strings)
+                strings.append(text)
+            return string_index[text]
+
+        nodes = list(self.nodes.values())
+        exits = []
+        for node in nodes:
+            exits.extend(int(node.connections[d]) if d in node.connections else -1 for d in DIRECTIONS)
+        return json.dumps({
+            "v": 2,
+            "scenario_name": self.scenario_name,
+            "start": int(self.start_node_id) if self.start_node_id is not None else 0,
+            "types": [intern(node.room_type) for node in nodes],
+            "desc": [intern(node.description) for node in nodes],
+            "strings": strings,
+            "exits": exits,
+            "entities": {node.id: node.entities for node in nodes if node.entities},
+            "events": {node.id: node.events for node in nodes if node.events},
+        }, ensure_ascii=False, separators=(",", ":"))
+
     def connect_nodes(self, from_node_id: str, to_node_id: str, direction: str):
         """Creates a two-way connection between nodes."""
         if from_node_id in self.nodes and to_node_id in self.nodes:
@@ -69,11 +147,23 @@ class MapStructure:
             self.nodes[from_node_id].connections[direction] = to_node_id
             self.nodes[to_node_id].connections[opposite_direction] = from_node_id
 
-def generate_map_structure(scenario_path: str) -> MapStructure:
+def generate_map_structure(scenario_path: str, seed: int = None,
+                           generator_version: int = MAP_GENERATOR_VERSION,
+                           floors: tuple = None) -> MapStructure:
     """
     Generates a random map structure based on a scenario JSON file,
     creating a grid-like layout for each floor.
+    All randomness comes from random.Random(seed): the same (seed, generator_version, floors)
+    always gives the same map. A new seed is drawn when none is given.
+    floors=(min, max) overrides the scenario's min/max_floors (used when regenerating a saved map,
+    so later edits to the scenario file do not change it).
     """
+    if generator_version != MAP_GENERATOR_VERSION:
+        raise ValueError(f"Unknown map generator version {generator_version}")
+    if seed is None:
+        seed = random.SystemRandom().getrandbits(63)
+    rng = random.Random(seed)
+
     # Xử lý đường dẫn file an toàn hơn
     if not os.path.exists(scenario_path):
         # Thử tìm trong thư mục gốc nếu đường dẫn tương đối bị sai
@@ -87,22 +177,32 @@ def generate_map_structure(scenario_path: str) -> MapStructure:
         print(f"Error: Scenario file not found at {scenario_path}")
         return None
 
-    map_structure = MapStructure(scenario_name=config.get("name", "Unknown Scenario"))
-    num_floors = random.randint(config.get("min_floors", 1), config.get("max_floors", 1))
+    if floors is None:
+        floors = (config.get("min_floors", 1), config.get("max_floors", 1))
+    min_floors, max_floors = floors
+
+    map_structure = MapStructure(
+        scenario_name=config.get("name", "Unknown Scenario"),
+        scenario=os.path.splitext(os.path.basename(scenario_path))[0],
+        seed=seed,
+        generator_version=generator_version,
+        floors=(min_floors, max_floors)
+    )
+    num_floors = rng.randint(min_floors, max_floors)
     
     previous_floor_stair_down = None
 
     for floor_num in range(num_floors):
         # Determine grid size, e.g., 3x3, 4x3, etc.
-        grid_w = random.randint(3, 5)
-        grid_h = random.randint(2, 4)
+        grid_w = rng.randint(3, 5)
+        grid_h = rng.randint(2, 4)
         floor_grid = [[None for _ in range(grid_w)] for _ in range(grid_h)]
         
         # Create nodes for the grid
         for y in range(grid_h):
             for x in range(grid_w):
                 # Have a chance for a room to not exist, creating holes in the map
-                if random.random() < 0.8:
+                if rng.random() < 0.8:
                     node = MapNode(room_type="room", description=f"A room on floor {floor_num+1}")
                     map_structure.add_node(node)
                     floor_grid[y][x] = node
@@ -128,7 +228,7 @@ def generate_map_structure(scenario_path: str) -> MapStructure:
 
         # Connect this floor to the previous one (UP STAIRS)
         if previous_floor_stair_down:
-            stair_up_node = random.choice(floor_nodes)
+            stair_up_node = rng.choice(floor_nodes)
             # Nối từ tầng trên (previous) đi xuống (down) tầng này (stair_up_node)
             map_structure.connect_nodes(previous_floor_stair_down.id, stair_up_node.id, "down")
             
@@ -138,10 +238,10 @@ def generate_map_structure(scenario_path: str) -> MapStructure:
 
         # Create a stairwell leading to the *next* floor (DOWN STAIRS)
         if floor_num < num_floors - 1:
-            stair_down_node = random.choice(floor_nodes)
+            stair_down_node = rng.choice(floor_nodes)
             # Ensure the chosen stairwell node is not the same as the entry stairwell, if possible
             if len(floor_nodes) > 1 and 'stair_up_node' in locals() and stair_down_node == stair_up_node:
-                stair_down_node = random.choice([n for n in floor_nodes if n != stair_up_node])
+                stair_down_node = rng.choice([n for n in floor_nodes if n != stair_up_node])
             
             # FIX 3: Phòng này dẫn xuống tầng dưới, nên gọi là stairwell_down
             stair_down_node.room_type = "stairwell_down"
@@ -152,9 +252,9 @@ def generate_map_structure(scenario_path: str) -> MapStructure:
             
     # Add some entities/events (example)
     for node in map_structure.nodes.values():
-        if random.random() < 0.2: # 20% chance to have an entity
+        if rng.random() < 0.2: # 20% chance to have an entity
             node.entities.append("creature")
-        if random.random() < 0.1: # 10% chance to have an event
+        if rng.random() < 0.1: # 10% chance to have an event
             node.events.append("locked_chest")
             
     return map_structure
\ No newline at end of file
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+HORROR BOT - COMPILED MAP GRAPH
+Read-only form of a game map, compiled once per game from game_maps.map_data
+(regenerated from its seed for seeded maps):
+rooms get integer indices, exits are one packed int array, and all-pairs BFS distances
+are computed up front into a packed array. The engine checks moves against adjacency in
+O(1), and "nearest stairwell" and distance hints for the prompt are table lookups.
+"""
+
+import json
+from array import array
+from collections import deque
+from services import map_generator
+from services.map_generator import DIRECTIONS
+
+# Loại phòng đặc biệt được tính sẵn "gần nhất" cho mọi phòng
+LANDMARK_TYPES = ("stairwell_up", "stairwell_down")
+
+UNREACHABLE = -1
+_NO_EXIT = -1
+_SLOTS = len(DIRECTIONS)
+_SLOT_OF = {direction: slot for slot, direction in enumerate(DIRECTIONS)}
+
+
+class MapGraph:
+    """Đồ thị bản đồ: index int cho phòng, mảng lối ra đóng gói, khoảng cách BFS mọi cặp phòng."""
+
+    __slots__ = ("node_ids", "index", "room_types", "descriptions", "exits", "start",
+                 "distances", "nearest", "entities", "events")
+
+    def __init__(self, node_ids: list, room_types: list, descriptions: list, exits: array, start: int,
+                 entities: dict = None, events: dict = None):
+        self.node_ids = node_ids            # index -> room ID (chuỗi lưu trong DB)
+        self.index = {node_id: i for i, node_id in enumerate(node_ids)}
+        self.room_types = room_types
+        self.descriptions = descriptions
+        self.exits = exits                  # 6 ô mỗi phòng theo thứ tự DIRECTIONS, -1 = không có lối
+        self.start = start
+        self.entities = entities or {}      # index -> list (chỉ phòng có entity)
+        self.events = events or {}
+        n = len(node_ids)
+        self.distances = array('h', [UNREACHABLE]) * (n * n)  # distances[a * n + b]
+        for source in range(n):
+            self._bfs(source)
+        # room_type -> (array index phòng gần nhất, array khoảng cách), -1 nếu không tới được
+        self.nearest = {room_type: self._nearest_of(room_type) for room_type in LANDMARK_TYPES}
+
+    # ----- Nạp từ game_maps -----
+
+    @classmethod
+    def decode(cls, map_data) -> "MapGraph":
+        """Compile map_data đã lưu (chuỗi JSON hoặc dict) ở bất kỳ phiên bản định dạng nào."""
+        if isinstance(map_data, (str, bytes)):
+            map_data = json.loads(map_data) if map_data else None
+        if not map_data:
+            # Game không có dòng game_maps / map_data NULL -> đồ thị rỗng
+            return cls.from_map_data({"nodes": {}})
+        version = map_data.get("v", 1)
+        if version == 1:
+            return cls.from_map_data(map_data)
+        if version == 3:
+            return cls.regenerate(map_data)
+        if version != 2:
+            raise ValueError(f"Unknown map format version {version}")
+
+        strings = map_data["strings"]
+        count = len(map_data["types"])
+        return cls(
+            node_ids=[str(i) for i in range(count)],
+            room_types=[strings[i] for i in map_data["types"]],
+            descriptions=[strings[i] for i in map_data["desc"]],
+            exits=array('i', map_data["exits"]),
+            start=map_data.get("start", 0),
+            entities={int(i): v for i, v in map_data.get("entities", {}).items()},
+            events={int(i): v for i, v in map_data.get("events", {}).items()},
+        )
+
+    @classmethod
+    def regenerate(cls, record: dict) -> "MapGraph":
+        """
+        Sinh lại bản đồ từ (scenario, seed, generator, floors) rồi áp state đã thay đổi của từng phòng (format 3).
+        Dùng floor range đã lưu chứ không đọc lại scenario hiện tại; số phòng sinh ra phải khớp "n"
+        đã lưu, nếu không player có thể đứng ở phòng không còn tồn tại -> raise thay vì trả bản đồ sai.
+        """
+        floors = record.get("floors")
+        structure = map_generator.generate_map_structure(
+            map_generator.scenario_path(record["scenario"]), seed=record["seed"],
+            generator_version=record.get("generator", map_generator.MAP_GENERATOR_VERSION),
+            floors=tuple(floors) if floors else None
+        )
+        if structure is None:
+            raise ValueError(f"Cannot regenerate map for scenario '{record['scenario']}'")
+        expected = record.get("n")
+        if expected is not None and len(structure.nodes) != expected:
+            raise ValueError(
+                f"Regenerated map for scenario '{record['scenario']}' (seed {record['seed']}) has "
+                f"{len(structure.nodes)} rooms, expected {expected}"
+            )
+        for room_id, state in record.get("rooms", {}).items():
+            node = structure.nodes.get(room_id)
+            if node is not None:
+                node.entities = state.get("entities", node.entities)
+                node.events = state.get("events", node.events)
+        return cls.from_map_data(structure.to_dict())
+
+    @classmethod
+    def from_map_data(cls, map_data: dict) -> "MapGraph":
+        """Compile dict dạng MapStructure.to_dict() (format 1, cũng là bước cuối của regenerate)."""
+        nodes = map_data.get("nodes", {})
+        node_ids = list(nodes)
+        index = {node_id: i for i, node_id in enumerate(node_ids)}
+        exits = array('i', [_NO_EXIT]) * (len(node_ids) * _SLOTS)
+        for i, node in enumerate(nodes.values()):
+            for direction, target in node.get("connections", {}).items():
+                if direction in _SLOT_OF and target in index:
+                    exits[i * _SLOTS + _SLOT_OF[direction]] = index[target]
+        return cls(
+            node_ids=node_ids,
+            room_types=[node.get("room_type", "room") for node in nodes.values()],
+            descriptions=[node.get("description", "") for node in nodes.values()],
+            exits=exits,
+            start=index.get(map_data.get("start_node_id"), 0),
+            entities={i: node["entities"] for i, node in enumerate(nodes.values()) if node.get("entities")},
+            events={i: node["events"] for i, node in enumerate(nodes.values()) if node.get("events")},
+        )
+
+    # ----- Precompute -----
+
+    def _neighbors(self, i: int):
+        """(direction, index) của mọi lối ra của phòng i."""
+        base = i * _SLOTS
+        for slot in range(_SLOTS):
+            neighbor = self.exits[base + slot]
+            if neighbor != _NO_EXIT:
+                yield DIRECTIONS[slot], neighbor
+
+    def _bfs(self, source: int):
+        n = len(self.node_ids)
+        row = source * n
+        self.distances[row + source] = 0
+        queue = deque([source])
+        while queue:
+            current = queue.popleft()
+            for _, neighbor in self._neighbors(current):
+                if self.distances[row + neighbor] == UNREACHABLE:
+                    self.distances[row + neighbor] = self.distances[row + current] + 1
+                    queue.append(neighbor)
+
+    def _nearest_of(self, room_type: str) -> tuple:
+        n = len(self.node_ids)
+        targets = [i for i, t in enumerate(self.room_types) if t == room_type]
+        nearest_index = array('i', [UNREACHABLE]) * n
+        nearest_distance = array('h', [UNREACHABLE]) * n
+        for source in range(n):
+            row = source * n
+            for target in targets:
+                d = self.distances[row + target]
+                if d != UNREACHABLE and (nearest_distance[source] == UNREACHABLE or d < nearest_distance[source]):
+                    nearest_index[source] = target
+                    nearest_distance[source] = d
+        return nearest_index, nearest_distance
+
+    # ----- Tra cứu O(1) -----
+
+    def __len__(self) -> int:
+        return len(self.node_ids)
+
+    def __contains__(self, node_id) -> bool:
+        return node_id in self.index
+
+    def resolve_move(self, from_id: str, target: str) -> str | None:
+        """
+        Phòng đích hợp lệ cho một lần di chuyển, hoặc None nếu không đi được.
+        target có thể là hướng ("north") hoặc room ID của một phòng kề bên.
+        """
+        source = self.index.get(from_id)
+        if source is None or not target:
+            return None
+        target = str(target).strip()
+        slot = _SLOT_OF.get(target.lower())
+        if slot is not None:
+            destination = self.exits[source * _SLOTS + slot]
+            return self.node_ids[destination] if destination != _NO_EXIT else None
+        destination = self.index.get(target)
+        if destination is None or destination not in self.exits[source * _SLOTS:(source + 1) * _SLOTS]:
+            return None
+        return self.node_ids[destination]
+
+    def distance(self, from_id: str, to_id: str) -> int:
+        """Số bước ngắn nhất giữa hai phòng (UNREACHABLE nếu không tới được)."""
+        source, destination = self.index.get(from_id), self.index.get(to_id)
+        if source is None or destination is None:
+            return UNREACHABLE
+        return self.distances[source * len(self.node_ids) + destination]
+
+    def nearest_room(self, from_id: str, room_type: str) -> tuple | None:
+        """(room ID, khoảng cách) của phòng loại room_type gần nhất, hoặc None."""
+        source = self.index.get(from_id)
+        table = self.nearest.get(room_type)
+        if source is None or table is None or table[0][source] == UNREACHABLE:
+            return None
+        return self.node_ids[table[0][source]], table[1][source]
+
+    def first_step(self, from_id: str, to_id: str) -> str | None:
+        """Hướng đi đầu tiên trên đường ngắn nhất tới to_id."""
+        source, destination = self.index.get(from_id), self.index.get(to_id)
+        if source is None or destination is None or source == destination:
+            return None
+        n = len(self.node_ids)
+        remaining = self.distances[source * n + destination]
+        if remaining == UNREACHABLE:
+            return None
+        for direction, neighbor in self._neighbors(source):
+            if self.distances[neighbor * n + destination] == remaining - 1:
+                return direction
+        return None
+
+    def room_type(self, node_id: str) -> str | None:
+        i = self.index.get(node_id)
+        return self.room_types[i] if i is not None else None
+
+    def description(self, node_id: str) -> str | None:
+        i = self.index.get(node_id)
+        return self.descriptions[i] if i is not None else None
+
+    def room_label(self, node_id: str) -> str:
+        i = self.index.get(node_id)
+        if i is None:
+            return "An Unknown Place"
+        return self.descriptions[i] or self.room_types[i]
+
+    def describe_for_prompt(self, node_id: str) -> str:
+        """Lối ra + gợi ý khoảng cách tới cầu thang, chèn vào player_context."""
+        source = self.index.get(node_id)
+        if source is None:
+            return ""
+        exits = ", ".join(
+            f"{direction} ({self.room_types[neighbor]})" for direction, neighbor in self._neighbors(source)
+        )
+        lines = [f"Exits: {exits or 'none'}"]
+        for room_type in LANDMARK_TYPES:
+            found = self.nearest_room(node_id, room_type)
+            if found is None:
+                continue
+            target, d = found
+            if d == 0:
+                lines.append(f"You are at the {room_type.replace('_', ' ')}.")
+            else:
+                lines.append(f"Nearest {room_type.replace('_', ' ')}: {d} rooms away "
+                             f"(go {self.first_step(node_id, target)})")
+        return "\n".join(lines)
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+HORROR BOT - NARRATION STREAM
+Hiện dần phần "description" của kết quả hành động trong kênh private trong khi LLM còn đang sinh token.
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+import discord
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Khoảng cách tối thiểu giữa hai lần edit message (Discord giới hạn ~5 edit / 5 giây mỗi kênh)
+ACTION_STREAM_EDIT_INTERVAL = float(os.getenv("ACTION_STREAM_EDIT_INTERVAL", "1.2"))
+
+_JSON_ESCAPES = {'n': '\n', 't': '\t', 'r': '', 'b': '', 'f': '', '"': '"', '\\': '\\', '/': '/'}
+
+# Thời gian từ lúc nhận hành động đến khi player thấy chữ đầu tiên (ms)
+_first_visible_ms = deque(maxlen=500)
+
+
+def extract_partial_string_field(raw: str, field: str) -> str | None:
+    """Lấy giá trị (có thể chưa kết thúc) của một field chuỗi trong JSON đang được sinh dở.
+
+    Returns:
+        Phần giá trị đã sinh (đã bỏ escape), hoặc None nếu field chưa xuất hiện.
+    """
+    key = raw.find(f'"{field}"')
+    if key == -1:
+        return None
+    i = key + len(field) + 2
+    while i < len(raw) and raw[i] in ' \t\r\n:':
+        i += 1
+    if i >= len(raw) or raw[i] != '"':
+        return None
+
+    out = []
+    i += 1
+    while i < len(raw):
+        c = raw[i]
+        if c == '"':
+            break
+        if c == '\\':
+            if i + 1 >= len(raw):
+                break  # Escape bị cắt giữa chừng - chờ token tiếp theo
+            n = raw[i + 1]
+            if n == 'u':
+                code = raw[i + 2:i + 6]
+                if len(code) < 4:
+                    break
+                try:
+                    out.append(chr(int(code, 16)))
+                except ValueError:
+                    pass
+                i += 6
+                continue
+            out.append(_JSON_ESCAPES.get(n, n))
+            i += 2
+            continue
+        out.append(c)
+        i += 1
+    return "".join(out)
+
+
+class NarrationStream:
+    """Nhận token thô từ LLM, gửi rồi edit dần một embed trong kênh với tốc độ an toàn.
+
+    on_token() được gọi trên event loop (qua scheduler); finish() thay embed đang chạy
+    bằng embed kết quả cuối cùng.
+    """
+
+    def __init__(self, channel: discord.abc.Messageable, started_at: float,
+                 field: str = "description", interval: float = ACTION_STREAM_EDIT_INTERVAL):
+        self.channel = channel
+        self.started_at = started_at
+        self.field = field
+        self.interval = interval
+        self.message = None
+        self._raw = []
+        self._shown = ""
+        self._last_edit = 0.0
+        self._task = None
+        self._sending = False
+
+    def on_token(self, text: str):
+        self._raw.append(text)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush())
+
+    async def _flush(self):
+        if self.message is not None:
+            wait = self._last_edit + self.interval - time.perf_counter()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+        text = extract_partial_string_field("".join(self._raw), self.field)
+        if not text or not text.strip() or text == self._shown:
+            return
+
+        embed = discord.Embed(
+            title="⚔️ Kết quả hành động",
+            description=text[:4000] + " ▌",
+            color=discord.Color.dark_red()
+        )
+        self._sending = True
+        try:
+            if self.message is None:
+                self.message = await self.channel.send(embed=embed)
+                _first_visible_ms.append((time.perf_counter() - self.started_at) * 1000)
+            else:
+                await self.message.edit(embed=embed)
+        except discord.HTTPException as e:
+            print(f"⚠️ Narration stream edit failed: {e}")
+        finally:
+            self._sending = False
+        self._shown = text
+        self._last_edit = time.perf_counter()
+
+    async def _stop(self):
+        if self._task is not None and not self._task.done():
+            if self._sending:
+                await self._task  # Don't race a send/edit already on the wire
+            else:
+                self._task.cancel()
+
+    async def finish(self, embed: discord.Embed):
+        """Show the final result: edit the streamed message, or send it if nothing was streamed."""
+        await self._stop()
+
+        if self.message is not None:
+            try:
+                await self.message.edit(embed=embed)
+                return
+            except discord.HTTPException as e:
+                print(f"⚠️ Narration stream final edit failed: {e}")
+        else:
+            _first_visible_ms.append((time.perf_counter() - self.started_at) * 1000)
+        await self.channel.send(embed=embed)
+
+    async def abort(self, embed: discord.Embed = None):
+        """Action failed after streaming started: replace the partial text with `embed`, or delete it."""
+        await self._stop()
+        if self.message is None:
+            return
+        try:
+            if embed is not None:
+                await self.message.edit(embed=embed)
+            else:
+                await self.message.delete()
+        except discord.HTTPException as e:
+            print(f"⚠️ Narration stream abort failed: {e}")
+
+
+def get_stats() -> dict:
+    """Time-to-first-visible-text of player actions (ms)."""
+    if not _first_visible_ms:
+        return {"count": 0, "avg": 0.0, "p95": 0.0}
+    ordered = sorted(_first_visible_ms)
+    return {
+        "count": len(ordered),
+        "avg": sum(ordered) / len(ordered),
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+    }
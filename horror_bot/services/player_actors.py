@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+HORROR BOT - PLAYER ACTORS
+Each player gets a mailbox and one task that works through it. A player's actions run
+strictly one after another, so their read-modify-write of hp/sanity/history never
+interleaves, while different players still run in parallel. An actor with nothing to do
+for ACTOR_IDLE_SECONDS exits and is dropped, so memory stays bounded by active players.
+"""
+
+import asyncio
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Actor không nhận việc trong chừng này giây sẽ bị thu hồi
+ACTOR_IDLE_SECONDS = float(os.getenv("ACTOR_IDLE_SECONDS", "60"))
+
+stats = {"spawned": 0, "reclaimed": 0, "processed": 0, "queued_behind": 0, "peak_actors": 0}
+
+
+class _Actor:
+    __slots__ = ("mailbox", "task", "busy")
+
+    def __init__(self):
+        self.mailbox = asyncio.Queue()
+        self.task = None
+        self.busy = False
+
+
+_actors = {}  # key -> _Actor
+
+
+async def _actor_loop(key, actor: _Actor):
+    while True:
+        try:
+            func, args, kwargs, future = await asyncio.wait_for(actor.mailbox.get(), ACTOR_IDLE_SECONDS)
+        except asyncio.TimeoutError:
+            # Không có await giữa lần kiểm tra và lúc xóa, nên không thể lọt thư mới
+            if actor.mailbox.empty():
+                if _actors.get(key) is actor:
+                    del _actors[key]
+                stats["reclaimed"] += 1
+                return
+            continue
+
+        if future.cancelled():
+            continue
+        actor.busy = True
+        try:
+            result = await func(*args, **kwargs)
+        except asyncio.CancelledError:
+            if not future.done():
+                future.cancel()
+            raise
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(result)
+        finally:
+            actor.busy = False
+        stats["processed"] += 1
+
+
+async def run(key, func, *args, **kwargs):
+    """Chạy func(*args, **kwargs) trong actor của key, sau mọi việc đã gửi trước đó cho key này."""
+    actor = _actors.get(key)
+    if actor is None or actor.task.done():
+        actor = _Actor()
+        actor.task = asyncio.create_task(_actor_loop(key, actor))
+        _actors[key] = actor
+        stats["spawned"] += 1
+        stats["peak_actors"] = max(stats["peak_actors"], len(_actors))
+
+    future = asyncio.get_running_loop().create_future()
+    if actor.busy or actor.mailbox.qsize():
+        # Phải chờ hành động trước của chính player này
+        stats["queued_behind"] += 1
+    actor.mailbox.put_nowait((func, args, kwargs, future))
+    return await future
+
+
+def close():
+    for actor in _actors.values():
+        actor.task.cancel()
+    _actors.clear()
+
+
+def get_stats() -> dict:
+    return {
+        **stats,
+        "actors": len(_actors),
+        "pending": sum(actor.mailbox.qsize() for actor in _actors.values()),
+        "idle_seconds": ACTOR_IDLE_SECONDS,
+    }
@@ -0,0 +1,102 @@
+"""
+HORROR BOT - SESSION KV CACHE
+Giữ KV state của llama.cpp theo từng session (player, game...) để lượt sau chỉ phải
+evaluate phần prompt mới thay vì toàn bộ prompt.
+"""
+
+from collections import OrderedDict
+from services import llm_schemas
+
+
+class SessionCachedModel:
+    """Bọc một Llama; gọi như Llama: model(prompt, session=None, on_text=None, schema=None, **params) -> output dict.
+
+    - Trước khi generate: nạp lại state đã lưu của session (load_state). llama.cpp tự tìm
+      prefix chung giữa token trong KV và prompt mới, và chỉ evaluate phần sau prefix đó.
+    - Sau khi generate: lưu state mới (save_state) vào LRU, tổng dung lượng <= budget_bytes.
+    - on_text: nếu có, generate ở chế độ stream và gọi on_text(đoạn text) cho từng token;
+      output trả về vẫn là dict đầy đủ như khi không stream.
+    - schema: tên schema trong llm_schemas; grammar tương ứng được compile ngay trong
+      process chạy model (grammar không gửi qua pipe được) và áp dụng khi sampling.
+    - Output được gắn thêm "prompt_cache" (số token prompt / số token dùng lại) để
+      scheduler tổng hợp metric, kể cả khi model chạy trong worker process.
+    """
+
+    def __init__(self, llm, budget_bytes: int):
+        self._llm = llm
+        self.budget_bytes = max(0, budget_bytes)
+        self._states = OrderedDict()  # session -> (LlamaState, size)
+        self._bytes = 0
+
+    def _reused_prefix(self, tokens: list) -> int:
+        # Cùng quy tắc với Llama.generate: token cuối luôn được evaluate lại để lấy logits
+        cached = self._llm.input_ids
+        limit = min(len(cached), len(tokens) - 1)
+        reused = 0
+        while reused < limit and cached[reused] == tokens[reused]:
+            reused += 1
+        return reused
+
+    def _store(self, session: str):
+        state = self._llm.save_state()
+        size = state.llama_state_size
+        self._drop(session)
+        if size > self.budget_bytes:
+            return
+        self._states[session] = (state, size)
+        self._bytes += size
+        while self._bytes > self.budget_bytes:
+            _, (_, evicted_size) = self._states.popitem(last=False)
+            self._bytes -= evicted_size
+
+    def _drop(self, session: str):
+        entry = self._states.pop(session, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def _stream(self, prompt: str, on_text, **params) -> dict:
+        pieces = []
+        finish_reason = None
+        completion_tokens = 0
+        for chunk in self._llm(prompt, stream=True, **params):
+            completion_tokens += 1  # llama.cpp yields one chunk per generated token
+            choice = chunk['choices'][0]
+            if choice['text']:
+                pieces.append(choice['text'])
+                on_text(choice['text'])
+            finish_reason = choice.get('finish_reason') or finish_reason
+        return {
+            "choices": [{"text": "".join(pieces), "index": 0, "finish_reason": finish_reason}],
+            "usage": {"completion_tokens": completion_tokens},
+        }
+
+    def __call__(self, prompt: str, session: str = None, on_text=None, schema: str = None, **params) -> dict:
+        tokens = self._llm.tokenize(prompt.encode("utf-8"), special=True)
+        grammar = llm_schemas.get_grammar(schema)
+        if grammar is not None:
+            params["grammar"] = grammar
+
+        use_cache = session is not None and self.budget_bytes > 0
+        if use_cache and session in self._states:
+            self._states.move_to_end(session)
+            self._llm.load_state(self._states[session][0])
+        reused = self._reused_prefix(tokens)
+
+        if on_text is not None:
+            output = self._stream(prompt, on_text, **params)
+        else:
+            output = self._llm(prompt, **params)
+        if use_cache:
+            self._store(session)
+
+        output["prompt_cache"] = {
+            "prompt_tokens": len(tokens),
+            "reused_tokens": reused,
+            "sessions": len(self._states),
+            "bytes": self._bytes,
+        }
+        return output
+
+    def close(self):
+        self._states.clear()
+        self._bytes = 0
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+HORROR BOT - STARTUP ORCHESTRATOR
+Thứ tự khởi động: storage (trước khi kết nối gateway) -> gateway -> model (nền) -> warm-up.
+Event loop không bao giờ bị chặn khi load model, nên heartbeat gateway luôn đều.
+"""
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from database.db_manager import setup_database, load_channel_routes, load_occupancy
+from services import llm_service, content_pool
+from services.recovery_service import restore_from_backup
+
+_process_started = time.perf_counter()
+timings = {}  # phase -> giây
+
+
+@asynccontextmanager
+async def phase(name: str):
+    """Đo thời gian một phase khởi động."""
+    start = time.perf_counter()
+    print(f"⏳ [STARTUP] {name}...")
+    try:
+        yield
+    finally:
+        timings[name] = time.perf_counter() - start
+        print(f"⏱️ [STARTUP] {name}: {timings[name]:.2f}s")
+
+
+def mark(name: str):
+    """Ghi thời điểm (tính từ lúc process khởi động) của một mốc, ví dụ gateway sẵn sàng."""
+    timings[name] = time.perf_counter() - _process_started
+
+
+async def prepare_storage():
+    """Restore backup + migrate DB + nạp bảng định tuyến private channel và occupancy index; chạy trước khi kết nối gateway."""
+    async with phase("restore_backup"):
+        await restore_from_backup()
+    async with phase("setup_database"):
+        await setup_database()
+    async with phase("load_channel_routes"):
+        await load_channel_routes()
+    async with phase("load_occupancy"):
+        await load_occupancy()
+
+
+async def load_model():
+    """Load model trong thread riêng, warm-up, rồi bật content pool. Chạy song song với gateway."""
+    async with phase("load_model"):
+        loaded = await asyncio.to_thread(llm_service.load_llm)
+    if not loaded:
+        print("⚠️  LLM không thể tải. Mô tả sẽ bị hạn chế.")
+        return
+
+    async with phase("warm_up"):
+        await llm_service.warm_up()
+    mark("model_ready_at")
+    print("✅ LLM sẵn sàng cho mô tả game")
+
+    # Dự trữ rules/lore cho /newgame khi LLM rảnh
+    content_pool.start()
+
+
+def get_timings() -> dict:
+    return dict(timings)
@@ -0,0 +1,41 @@
+"""
+Kiểm tra hồi quy: mọi query trong migrations.HOT_QUERIES phải dùng index.
+Chạy migration trên một DB tạm rồi EXPLAIN QUERY PLAN từng query.
+
+Chạy từ thư mục horror_bot/:
+    python -m pytest -q tests
+"""
+
+import asyncio
+import os
+import sys
+
+import aiosqlite
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import migrations  # noqa: E402
+from database.db_manager import SCHEMA_PATH  # noqa: E402
+
+
+async def _query_plans(db_path: str) -> dict:
+    """name -> danh sách bước plan của từng query nóng, sau khi chạy đủ migration."""
+    async with aiosqlite.connect(db_path) as db:
+        await migrations.run_migrations(db, SCHEMA_PATH)
+        plans = {}
+        for name, query, params in migrations.HOT_QUERIES:
+            async with db.execute(f"EXPLAIN QUERY PLAN {query}", params) as cursor:
+                plans[name] = [row[-1] for row in await cursor.fetchall()]
+        return plans
+
+
+@pytest.fixture(scope="module")
+def query_plans(tmp_path_factory):
+    return asyncio.run(_query_plans(str(tmp_path_factory.mktemp("db") / "plans.db")))
+
+
+@pytest.mark.parametrize("name", [name for name, _, _ in migrations.HOT_QUERIES])
+def test_hot_query_uses_index(query_plans, name):
+    full_scans = [detail for detail in query_plans[name] if detail.startswith("SCAN ")]
+    assert not full_scans, f"{name} quét toàn bảng: {full_scans}"